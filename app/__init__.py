@@ -1,12 +1,22 @@
-from business import (
-    Uploader,
-    Getter,
-    Setter,
-    Deleter
-)
-
-# Making sure the objects do not get initiated again
-UPLOADER = Uploader()
-GETTER = Getter()
-SETTER = Setter()
-DELETER = Deleter()
\ No newline at end of file
+from cache import SUBJECTS_CACHE
+from metrics import MetricsMiddleware, instrument_engine, render_metrics
+from diagnostics import DiagnosticsMiddleware, NPlusOneError
+from crud import SQLRepository, create_tables, init_db, release_upload_claims
+from async_crud import AsyncSQLRepository
+from business import (
+    Uploader,
+    Getter,
+    Setter,
+    Deleter,
+    Exporter
+)
+from jobs import JobManager
+from parallel import ParallelUploader
+from validation import BatchValidator
+from parsers import open_decompressed, digest_stream, DecompressionError
+from async_business import (
+    AsyncUploader,
+    AsyncGetter,
+    AsyncSetter,
+    AsyncDeleter
+)
\ No newline at end of file
@@ -0,0 +1,262 @@
+from fastapi import HTTPException
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from typing import BinaryIO
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from async_crud import AsyncSQLRepository
+from business import (
+    Uploader,
+    Getter,
+    Setter,
+    Deleter,
+    CSVUploadResult,
+    batched,
+    invalid_json,
+    parse_csv,
+    parse_json,
+    read_update_request
+)
+
+
+def until_error(items):
+    """
+    Yields the items, then the ValueError that ended them early,
+    so the items parsed before a JSON error are still inserted
+    """
+
+    try:
+        yield from items
+    except ValueError as e:
+        yield e
+
+
+class AsyncUploader:
+    """
+    async version of Uploader on the async engine
+
+    The uploaded file is read, parsed and validated on the thread
+    pool, and only the inserts are awaited on the event loop.
+    """
+
+    def __init__(self, repo: AsyncSQLRepository):
+        """
+        Assigns the async SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : AsyncSQLRepository
+            The async SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+
+    async def upload_csv(self, file: BinaryIO, chunk_size: int = None):
+        """
+        see Uploader.upload_csv
+        """
+
+        result = CSVUploadResult()
+        chunks = parse_csv(file, chunk_size, insert_after_error=False)
+
+        async for rows, batch, error in iterate_in_threadpool(chunks):
+            if error is not None:
+                result.add(rows, None, error)
+                continue
+
+            success, inserted = await self.repo.bulk_create(batch=batch)
+
+            if success:
+                result.add(rows, inserted, None)
+            else:
+                result.add(rows, None, inserted)
+
+        return result.response()
+
+
+    async def upload_json(self, file: BinaryIO):
+        """
+        see Uploader.upload_json
+        """
+
+        inserted = 0
+        elements = batched(until_error(parse_json(file)), settings.ingest_chunk_size)
+
+        async for chunk in iterate_in_threadpool(elements):
+            for element in chunk:
+                if isinstance(element, ValueError):
+                    raise invalid_json(inserted, element)
+
+                table, outcome, message = await self.repo.run(
+                    lambda repo: Uploader(repo).insert_json_record(*element)
+                )
+
+                # halt the process on the first existing or failed record
+                if outcome in ('skipped', 'failed'):
+                    raise HTTPException(status_code=400, detail=message)
+
+                inserted += outcome == 'inserted'
+
+        return {
+            "success": True, 
+            "message": "Data Inserted Successfully!"
+        }
+
+
+    async def claim_upload(self, key: str, format: str, digest: str = None, owner: str = None):
+        """
+        see Uploader.claim_upload
+        """
+
+        return await self.repo.run(
+            lambda repo: Uploader(repo).claim_upload(key, format, digest, owner)
+        )
+
+
+    async def finish_upload(self, key: str, result: dict):
+        """
+        see Uploader.finish_upload
+        """
+
+        return await self.repo.run(
+            lambda repo: Uploader(repo).finish_upload(key, result)
+        )
+
+
+    async def release_upload(self, key: str, owner: str = None):
+        """
+        see Uploader.release_upload
+        """
+
+        return await self.repo.run(
+            lambda repo: Uploader(repo).release_upload(key, owner)
+        )
+
+
+class AsyncGetter:
+    """
+    async version of Getter on the async engine
+    """
+
+    def __init__(self, repo: AsyncSQLRepository):
+        """
+        Assigns the async SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : AsyncSQLRepository
+            The async SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+
+    async def get_subjects_by_student(self, student_id: int):
+        """
+        see Getter.get_subjects_by_student
+        """
+
+        return await self.repo.run(
+            lambda repo: Getter(repo).get_subjects_by_student(student_id)
+        )
+
+
+    async def list_records(self, table_name: str, filters: dict, after: str = None, limit: int = 100):
+        """
+        see Getter.list_records
+        """
+
+        return await self.repo.run(
+            lambda repo: Getter(repo).list_records(table_name, filters, after, limit)
+        )
+
+
+    async def list_students_by_subject(self, subject_id: int, after: str = None, limit: int = 100, count_only: bool = False):
+        """
+        see Getter.list_students_by_subject
+        """
+
+        return await self.repo.run(
+            lambda repo: Getter(repo).list_students_by_subject(subject_id, after, limit, count_only)
+        )
+
+
+    async def list_summary(self, scope: str, after: str = None, limit: int = 100):
+        """
+        see Getter.list_summary
+        """
+
+        return await self.repo.run(
+            lambda repo: Getter(repo).list_summary(scope, after, limit)
+        )
+
+
+class AsyncSetter:
+    """
+    async version of Setter on the async engine
+    """
+
+    def __init__(self, repo: AsyncSQLRepository):
+        """
+        Assigns the async SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : AsyncSQLRepository
+            The async SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+
+    async def update_record(self, file: BinaryIO):
+        """
+        see Setter.update_record, parsing the file on the thread pool
+        """
+
+        update_request = await run_in_threadpool(read_update_request, file)
+
+        return await self.repo.run(
+            lambda repo: Setter(repo).apply_updates(update_request)
+        )
+
+
+class AsyncDeleter:
+    """
+    async version of Deleter on the async engine
+    """
+
+    def __init__(self, repo: AsyncSQLRepository):
+        """
+        Assigns the async SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : AsyncSQLRepository
+            The async SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+
+    async def delete_enrollment(self, student_id: int, subject_id: int):
+        """
+        see Deleter.delete_enrollment
+        """
+
+        return await self.repo.run(
+            lambda repo: Deleter(repo).delete_enrollment(student_id, subject_id)
+        )
+
+
+    async def delete_enrollments(self, request, chunk_size: int = None):
+        """
+        see Deleter.delete_enrollments
+        """
+
+        return await self.repo.run(
+            lambda repo: Deleter(repo).delete_enrollments(request, chunk_size)
+        )
@@ -0,0 +1,60 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from crud import SQLRepository
+
+
+class AsyncSQLRepository:
+    """
+    The data access layer on the async engine.
+
+    Every SQLRepository method is available as a coroutine, running the
+    same queries through AsyncSession.run_sync so the db round trips
+    are awaited on the async driver instead of blocking a thread.
+    """
+
+    def __init__(self, db: AsyncSession):
+        """
+        Assigns the async database session to the repository
+
+        Parameters
+        ----------
+        db : AsyncSession
+            the session of the current request, see database.get_async_db
+        """
+        self.db = db
+
+
+    async def run(self, operation):
+        """
+        Runs a function of a SQLRepository on this session
+
+        Parameters
+        ----------
+        operation : Callable[[SQLRepository], Any]
+            e.g. lambda repo: repo.get_student_by_id(id=1)
+
+        Returns
+        -------
+        Any
+            whatever `operation` returns
+        """
+
+        return await self.db.run_sync(
+            lambda session: operation(SQLRepository(session))
+        )
+
+
+    def __getattr__(self, name: str):
+        """
+        Exposes SQLRepository.<name> as a coroutine
+        """
+
+        method = getattr(SQLRepository, name)
+
+        async def call(*args, **kwargs):
+            return await self.run(lambda repo: method(repo, *args, **kwargs))
+
+        return call
@@ -1,437 +1,1184 @@
-from fastapi import HTTPException
-from io import StringIO
-import json
-import csv
-import sys
-
-sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
-
-from scripts import schemas
-from crud import SQLRepository
-
-# to have one repo throughout the whole system
-REPO = SQLRepository()
-
-
-class Uploader:
-    """
-    class to upload CSV or JSON payloads into the db
-    """
-
-    def __init__(self, repo=REPO):
-        """
-        Assigns the global SQL repo to the instance
-
-        Parameters
-        ----------
-        repo : Optional[SQLRepository]
-            The SQL Repository with all the functions related to the db
-        """
-        self.repo = repo
-
-    
-    def upload_csv(self, file_content: bytes):
-        """
-        Takes the file content of the CSV payload
-        and inserts into the db
-
-        Parameters
-        ----------
-        file_content : bytes
-            binary content of the file
-
-        Returns
-        -------
-        success/failure, message : tuple
-
-        Raises
-        ------
-        HTTPException
-            If the insertion is not successful
-        """
-
-        content_str = file_content.decode('utf-8')
-        data = csv.DictReader(StringIO(content_str))
-
-        for row in data:
-            for col in row:
-
-                if 'dept_name' == col:
-                    # finding if the dept already exists
-                    db_dept = self.repo.get_department(
-                        dept_name=row.get('dept_name')
-                    )
-
-                    # in CSV bulk insertions, ignore if it exists
-                    if db_dept:
-                        continue
-                    
-                    try:
-                        success, message = self.repo.create_department(
-                            department=schemas.DepartmentCreate(dept_name=row.get('dept_name'))
-                        )
-                    except Exception as e:
-                        success, message = False, str(e)
-
-                elif 'teacher_name' == col:
-                    db_teacher = self.repo.get_teacher(
-                        email=row.get('teacher_email')
-                    )
-
-                    if db_teacher:
-                        continue
-                    
-                    try:
-                        success, message = self.repo.create_teacher(
-                            teacher=schemas.TeacherCreate(
-                                email=row.get('teacher_email'),
-                                teacher_name=row.get('teacher_name'),
-                                dept_id=row.get('dept_id')
-                            )
-                        )
-                    except Exception as e:
-                        success, message = False, str(e)
-
-                elif 'subj_name' == col:
-                    db_subj = self.repo.get_subject(
-                        subj_name=row.get('subj_name')
-                    )
-
-                    if db_subj:
-                        continue
-
-                    try:
-                        success, message = self.repo.create_subject(
-                            subject=schemas.SubjectCreate(
-                                subj_name=row.get('subj_name'),
-                                description=row.get('description'),
-                                dept_id=row.get('dept_id'),
-                                teacher_id=row.get('teacher_id')
-                            )
-                        )
-                    except Exception as e:
-                        success, message = False, str(e)
-                
-                elif 'std_name' == col:
-                    db_stud = self.repo.get_student_by_id(
-                        id=row.get('std_id')
-                    )
-
-                    if db_stud:
-                        continue
-
-                    try:
-                        success, message = self.repo.create_student(
-                            student=schemas.StudentCreate(
-                                email=row.get('std_email'),
-                                std_name=row.get('std_name'),
-                                dept_id=row.get('dept_id')
-                            )
-                        )
-                    except Exception as e:
-                        success, message = False, str(e)
-
-                else:
-                    success = True
-                    continue
-
-                if not success:
-                    raise HTTPException(status_code=400, detail=message)
-                
-            if ('subj_name' in row) and ('std_name' in row):
-                db_enroll = self.repo.get_enrollment(
-                    student_id=row.get('std_id'),
-                    subject_id=row.get('subj_id')
-                )
-
-                if db_enroll:
-                    continue
-                
-                try:
-                    success, message = self.repo.create_enrollment(
-                        enrollment=schemas.EnrollmentCreate(
-                            student_id=row.get('std_id'),
-                            subject_id=row.get('subj_id')
-                        )
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-
-                if not success:
-                    raise HTTPException(status_code=400, detail=message)
-
-        return {
-            "success": success, 
-            "message": "Data Inserted Successfully!"
-        }
-    
-
-    def upload_json(self, file_content: bytes):
-        """
-        Takes the file content of the JSON payload
-        and inserts into the db
-
-        Parameters
-        ----------
-        file_content : bytes
-            binary content of the file
-
-        Returns
-        -------
-        success/failure, message : tuple
-
-        Raises
-        ------
-        HTTPException
-            If the insertion is not successful
-            OR If a record already exists in the db
-        """
-
-        content_str = file_content.decode('utf-8')
-        data = json.loads(content_str)
-
-        for row in data:
-            if 'dept_name' in row:
-                # if the dept already exists
-                db_dept = self.repo.get_department(
-                    dept_name=row.get('dept_name')
-                )
-
-                # raise an exception, halt the process
-                if db_dept:
-                    raise HTTPException(status_code=400, detail="Department already exists.")
-                
-                try:
-                    success, message = self.repo.create_department(
-                        department=schemas.DepartmentCreate(**row)
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-
-            elif 'std_name' in row:
-                db_stud = self.repo.get_student_by_email(
-                    email=row.get('email')
-                )
-
-                if db_stud:
-                    raise HTTPException(status_code=400, detail="Student already exists!")
-
-                try:
-                    success, message = self.repo.create_student(
-                        student=schemas.StudentCreate(**row)
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-            
-            elif 'subj_name' in row:
-                db_subj = self.repo.get_subject(
-                    subj_name=row.get('subj_name')
-                )
-
-                if db_subj:
-                    raise HTTPException(status_code=400, detail="Subject already exists!")
-
-                try:
-                    success, message = self.repo.create_subject(
-                        subject=schemas.SubjectCreate(**row)
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-            
-            elif 'teacher_name' in row:
-                db_teacher = self.repo.get_teacher(
-                    email=row.get('email')
-                )
-
-                if db_teacher:
-                    raise HTTPException(status_code=400, detail="Teacher already exists!")
-                
-                try:
-                    success, message = self.repo.create_teacher(
-                        teacher=schemas.TeacherCreate(**row)
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-            
-            elif ('subject_id' in row) and ('student_id'  in row):
-                db_enroll = self.repo.get_enrollment(
-                    student_id=row.get('student_id'),
-                    subject_id=row.get('subject_id')
-                )
-
-                if db_enroll:
-                    raise HTTPException(status_code=400, detail="Enrollment already exists!")
-                
-                try:
-                    success, message = self.repo.create_enrollment(
-                        enrollment=schemas.EnrollmentCreate(**row)
-                    )
-                except Exception as e:
-                    success, message = False, str(e)
-
-            else:
-                pass
-
-            if not success:
-                raise HTTPException(status_code=400, detail=message)
-
-        return {
-            "success": success, 
-            "message": "Data Inserted Successfully!"
-        }
-    
-
-class Getter:
-    """
-    a class to get any record from the db
-    """
-
-    def __init__(self, repo=REPO):
-        """
-        Assigns the global SQL repo to the instance
-
-        Parameters
-        ----------
-        repo : Optional[SQLRepository]
-            The SQL Repository with all the functions related to the db
-        """
-
-        self.repo = repo
-
-    
-    def get_subjects_by_student(self, student_id):
-        """
-        Fetches the subject list for the given student
-
-        Parameters
-        ----------
-        student_id : int
-            the id of the student
-
-        Returns
-        -------
-        list[models.Subject]
-            the subject records with matching student in Enrollments table
-        """
-
-        db_student = self.repo.get_student_by_id(id=student_id)
-
-        if not db_student:
-            raise HTTPException(status_code=400, detail="Student does not exist!")
-
-        subjects = self.repo.get_subject_by_student(
-            student_id=student_id
-        )
-
-        return subjects
-    
-
-class Setter:
-    """
-    a class to update one or more records in the db
-    """
-
-    def __init__(self, repo=REPO):
-        """
-        Assigns the global SQL repo to the instance
-
-        Parameters
-        ----------
-        repo : Optional[SQLRepository]
-            The SQL Repository with all the functions related to the db
-        """
-
-        self.repo = repo
-
-    
-    def update_record(self, file_content: bytes):
-        """
-        Takes the file content of JSON payload 
-        and updates the records with matching details
-
-        Parameters
-        ----------
-        file_content : bytes
-            binary content of the file
-
-        Returns
-        -------
-        success/failure, message : tuple
-
-        Raises
-        ------
-        HTTPException
-            If the updating is not successful
-        """
-
-        content_str = file_content.decode('utf-8')
-        data = json.loads(content_str)
-
-        update_request = []
-        for row in data:
-            update_request.append(schemas.UpdateItem(**row))
-
-        success, message = self.repo.update_records(
-            update_request=schemas.UpdateRequest(updates=update_request)
-        )
-
-        if not success:
-            raise HTTPException(status_code=400, detail=message)
-        
-        return {"success": success, "message": message}
-    
-
-class Deleter:
-    """
-    class to delete a record from the db
-    """
-
-    def __init__(self, repo=REPO):
-        """
-        Assigns the global SQL repo to the instance
-
-        Parameters
-        ----------
-        repo : Optional[SQLRepository]
-            The SQL Repository with all the functions related to the db
-        """
-
-        self.repo = repo
-
-    
-    def delete_enrollment(self, student_id: int, subject_id: int):
-        """
-        Takes the file content of JSON payload 
-        and updates the records with matching details
-
-        Parameters
-        ----------
-        file_content : bytes
-            binary content of the file
-
-        Returns
-        -------
-        success/failure, message : tuple
-
-        Raises
-        ------
-        HTTPException
-            If the updating is not successful
-        """
-        
-        db_enroll = self.repo.get_enrollment(
-            student_id=student_id,
-            subject_id=subject_id
-        )
-
-        if not db_enroll:
-            raise HTTPException(status_code=400, detail="Enrollment not found!")
-
-        success, message = self.repo.delete_enrollments(
-            student_id=student_id,
-            subject_id=subject_id
-        )
-
-        if not success: 
-            raise HTTPException(status_code=400, detail=message)
-        return {"success": True, "message": message}
+from fastapi import HTTPException
+from itertools import islice
+from typing import BinaryIO
+import json
+import zlib
+import csv
+import sys
+import io
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from scripts import models, schemas
+from crud import SQLRepository
+from cache import SUBJECTS_CACHE
+from parsers import iter_lines, iter_json_items
+from validation import BatchValidator, ErrorReport
+
+# entities found in a CSV row, in the order they are inserted:
+# (header column, model, natural key column, row -> key, row -> schema)
+# the rows have passed BatchValidator, so the schemas skip validation
+CSV_ENTITIES = [
+    (
+        'dept_name',
+        models.Department,
+        models.Department.dept_name,
+        lambda row: row['dept_name'],
+        lambda row: schemas.DepartmentCreate.construct(
+            dept_name=row['dept_name']
+        )
+    ),
+    (
+        'teacher_name',
+        models.Teacher,
+        models.Teacher.email,
+        lambda row: row['teacher_email'],
+        lambda row: schemas.TeacherCreate.construct(
+            email=row['teacher_email'],
+            teacher_name=row['teacher_name'],
+            dept_id=row['dept_id']
+        )
+    ),
+    (
+        'subj_name',
+        models.Subject,
+        models.Subject.subj_name,
+        lambda row: row['subj_name'],
+        lambda row: schemas.SubjectCreate.construct(
+            subj_name=row['subj_name'],
+            description=row['description'],
+            dept_id=row['dept_id'],
+            teacher_id=row['teacher_id']
+        )
+    ),
+    (
+        'std_name',
+        models.Student,
+        models.Student.id,
+        lambda row: row['std_id'],
+        # keeps the std_id the enrollments of the file reference,
+        # as ParallelUploader does
+        lambda row: schemas.Student.construct(
+            id=row['std_id'],
+            email=row['std_email'],
+            std_name=row['std_name'],
+            dept_id=row['dept_id']
+        )
+    ),
+]
+
+
+# table -> column name -> CSV header, the layout Uploader.upload_csv reads
+EXPORT_COLUMNS = {
+    'departments': {'id': 'dept_id', 'dept_name': 'dept_name'},
+    'teachers': {
+        'id': 'teacher_id',
+        'teacher_name': 'teacher_name',
+        'email': 'teacher_email',
+        'dept_id': 'dept_id'
+    },
+    'subjects': {
+        'id': 'subj_id',
+        'subj_name': 'subj_name',
+        'description': 'description',
+        'dept_id': 'dept_id',
+        'teacher_id': 'teacher_id'
+    },
+    'students': {
+        'id': 'std_id',
+        'std_name': 'std_name',
+        'email': 'std_email',
+        'dept_id': 'dept_id'
+    },
+}
+
+# the roster CSV header, one row per enrollment
+ROSTER_COLUMNS = [
+    'dept_id', 'dept_name',
+    'teacher_id', 'teacher_name', 'teacher_email',
+    'subj_id', 'subj_name', 'description',
+    'std_id', 'std_name', 'std_email'
+]
+
+
+def batched(iterable, size: int):
+    """
+    Yields lists of up to `size` items from the iterable
+    """
+
+    iterator = iter(iterable)
+
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def add_counts(counts: dict, rows: int, inserted: dict):
+    """
+    Adds a chunk's new records per table to the running
+    inserted/skipped counts of an upload
+    """
+
+    for table, n_inserted in inserted.items():
+        table_counts = counts.setdefault(
+            table, {"inserted": 0, "skipped": 0}
+        )
+        table_counts["inserted"] += n_inserted
+        table_counts["skipped"] += rows - n_inserted
+
+
+def parse_csv(file: BinaryIO, chunk_size: int = None, skip_rows: int = 0, insert_after_error: bool = True):
+    """
+    Reads and validates the CSV payload chunk by chunk, mapping
+    each valid chunk to its records without touching the db
+
+    Parameters
+    ----------
+    file : BinaryIO
+        the uploaded file, read in fixed-size pieces
+    chunk_size : Optional[int]
+        rows per chunk, defaults to `settings.ingest_chunk_size`
+    skip_rows : int
+        rows already ingested, e.g. by an interrupted job
+    insert_after_error : bool
+        False to only validate the chunks after the first invalid
+        one, yielding none of them that are valid
+
+    Yields
+    ------
+    rows, batch, error : tuple
+        the chunk's rows, its records as taken by
+        SQLRepository.bulk_create and None, or None and the error
+        if the chunk cannot be inserted: the {row, column, error}
+        of each invalid row, see BatchValidator, or the message
+        of a failed build
+    """
+
+    data = csv.DictReader(iter_lines(file))
+    validator = BatchValidator(data.fieldnames or [])
+    first_row = skip_rows + 1
+    failed = False
+
+    for chunk in batched(islice(data, skip_rows, None), chunk_size or settings.ingest_chunk_size):
+        errors = validator.validate(chunk, first_row)
+        first_row += len(chunk)
+
+        if errors:
+            failed = True
+            yield chunk, None, errors
+            continue
+
+        if failed and not insert_after_error:
+            continue
+
+        try:
+            batch = build_csv_batch(chunk)
+        except Exception as e:
+            yield chunk, None, str(e)
+            continue
+
+        yield chunk, batch, None
+
+
+def build_csv_batch(rows: list):
+    """
+    Maps a chunk of CSV rows to the records of each table,
+    keyed by their natural key and in dependency order
+
+    Parameters
+    ----------
+    rows : list[dict]
+        the CSV rows, all sharing the same header,
+        checked and converted by BatchValidator
+
+    Returns
+    -------
+    list[tuple]
+        (model, key_column, records) as taken by SQLRepository.bulk_create
+    """
+
+    batch = []
+
+    for column, model, key_column, get_key, build in CSV_ENTITIES:
+        if column not in rows[0]:
+            continue
+
+        records = {}
+        for row in rows:
+            key = get_key(row)
+            if key not in records:
+                records[key] = build(row)
+
+        batch.append((model, key_column, records))
+
+    if ('subj_name' in rows[0]) and ('std_name' in rows[0]):
+        records = {}
+        for row in rows:
+            records[(row['std_id'], row['subj_id'])] = schemas.EnrollmentCreate.construct(
+                student_id=row['std_id'],
+                subject_id=row['subj_id']
+            )
+
+        batch.append((models.Enrollment, None, records))
+
+    return batch
+
+
+class CSVUploadResult:
+    """
+    The response of a CSV upload, added up from
+    the outcome of each chunk, see Uploader.iter_csv
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.report = ErrorReport()
+        self.first_invalid = None
+
+
+    def add(self, rows: list, inserted: dict, error):
+        """
+        Adds the outcome of a chunk
+
+        Raises
+        ------
+        HTTPException
+            If the insertion of the chunk failed
+        """
+
+        if isinstance(error, list):
+            self.report.add(error)
+            self.first_invalid = self.first_invalid or error[0]["row"]
+        elif error is not None:
+            raise HTTPException(status_code=400, detail=error)
+        else:
+            add_counts(self.counts, len(rows), inserted)
+
+
+    def response(self) -> dict:
+        """
+        Returns
+        -------
+        success/failure, message, counts : dict
+            counts holds the inserted/skipped rows per table
+
+        Raises
+        ------
+        HTTPException
+            If rows were invalid
+        """
+
+        if self.report.count:
+            raise HTTPException(
+                status_code=400,
+                detail=self.report.detail(
+                    f"Invalid rows, nothing was inserted from row {self.first_invalid} on."
+                )
+            )
+
+        return {
+            "success": True, 
+            "message": "Data Inserted Successfully!",
+            "counts": self.counts
+        }
+
+
+# table of a JSON element -> (the keys its elements have,
+# the schema validating them, the message when the record exists)
+JSON_TABLES = {
+    'departments': (('dept_name',), schemas.DepartmentCreate, "Department already exists."),
+    'students': (('std_name',), schemas.StudentCreate, "Student already exists!"),
+    'subjects': (('subj_name',), schemas.SubjectCreate, "Subject already exists!"),
+    'teachers': (('teacher_name',), schemas.TeacherCreate, "Teacher already exists!"),
+    'enrollments': (('subject_id', 'student_id'), schemas.EnrollmentCreate, "Enrollment already exists!"),
+}
+
+
+def parse_json(file: BinaryIO, skip_items: int = 0):
+    """
+    Reads the JSON payload element by element, finding the table
+    of each and validating it without touching the db
+
+    Parameters
+    ----------
+    file : BinaryIO
+        the uploaded file, either a JSON array or NDJSON
+    skip_items : int
+        elements already ingested, e.g. by an interrupted job
+
+    Yields
+    ------
+    row, table, record, error : tuple
+        the element, its table or None if it is no record of any
+        table, and its validated schema or why it is invalid
+
+    Raises
+    ------
+    ValueError
+        If the payload is not valid JSON
+    """
+
+    for row in islice(iter_json_items(file), skip_items, None):
+        table = None
+
+        if isinstance(row, dict):
+            table = next(
+                (
+                    table for table, (keys, schema, message) in JSON_TABLES.items()
+                    if all(key in row for key in keys)
+                ),
+                None
+            )
+
+        if table is None:
+            yield row, None, None, "Not a record of any table."
+            continue
+
+        try:
+            record, error = JSON_TABLES[table][1](**row), None
+        except Exception as e:
+            record, error = None, str(e)
+
+        yield row, table, record, error
+
+
+def invalid_json(inserted: int, error: ValueError) -> HTTPException:
+    """
+    The 400 of a JSON upload cut short by a parse error,
+    after `inserted` of its elements were inserted
+    """
+
+    return HTTPException(
+        status_code=400,
+        detail=f"Invalid JSON, {inserted} elements before the error were inserted: {error}"
+    )
+
+
+class Uploader:
+    """
+    class to upload CSV or JSON payloads into the db
+    """
+
+    def __init__(self, repo: SQLRepository):
+        """
+        Assigns the SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : SQLRepository
+            The SQL Repository with all the functions related to the db
+        """
+        self.repo = repo
+
+    
+    def upload_csv(self, file: BinaryIO, chunk_size: int = None):
+        """
+        Reads the CSV payload as a stream
+        and inserts into the db in chunks of rows,
+        skipping the records that already exist
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file, read in fixed-size pieces
+        chunk_size : Optional[int]
+            rows per transaction, defaults to `settings.ingest_chunk_size`
+
+        Returns
+        -------
+        success/failure, message, counts : dict
+            counts holds the inserted/skipped rows per table
+
+        Raises
+        ------
+        HTTPException
+            If the insertion is not successful
+            OR If rows are invalid; the rest of the file is still
+            validated, so the response lists every invalid row, and
+            the chunks before the first invalid one stay inserted
+        """
+
+        result = CSVUploadResult()
+
+        for rows, inserted, error in self.iter_csv(file, chunk_size, insert_after_error=False):
+            result.add(rows, inserted, error)
+
+        return result.response()
+
+
+    def iter_csv(self, file: BinaryIO, chunk_size: int = None, skip_rows: int = 0, insert_after_error: bool = True):
+        """
+        Validates and inserts the CSV payload chunk by chunk,
+        reporting each chunk once it is committed or has failed
+
+        Parameters
+        ----------
+        see parse_csv
+
+        Yields
+        ------
+        rows, inserted, error : tuple
+            the chunk's rows, the new records per table and None,
+            or None and the error if the chunk was not inserted: the
+            {row, column, error} of each invalid row, see BatchValidator,
+            or the message of a failed insert
+        """
+
+        for rows, batch, error in parse_csv(file, chunk_size, skip_rows, insert_after_error):
+            if error is not None:
+                yield rows, None, error
+                continue
+
+            success, inserted = self.repo.bulk_create(batch=batch)
+
+            if success:
+                yield rows, inserted, None
+            else:
+                yield rows, None, inserted
+
+
+    def upload_json(self, file: BinaryIO):
+        """
+        Reads the JSON payload as a stream
+        and inserts each element into the db as soon as it is parsed
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file, either a JSON array or NDJSON
+
+        Returns
+        -------
+        success/failure, message : tuple
+
+        Raises
+        ------
+        HTTPException
+            If the insertion is not successful
+            OR If a record already exists in the db
+            OR If the payload is not valid JSON; the elements
+            before the error stay inserted
+        """
+
+        inserted = 0
+
+        try:
+            for table, outcome, message in self.iter_json(file):
+                # halt the process on the first existing or failed record
+                if outcome in ('skipped', 'failed'):
+                    raise HTTPException(status_code=400, detail=message)
+
+                inserted += outcome == 'inserted'
+
+        except ValueError as e:
+            raise invalid_json(inserted, e)
+
+        return {
+            "success": True, 
+            "message": "Data Inserted Successfully!"
+        }
+
+
+    def iter_json(self, file: BinaryIO, skip_items: int = 0):
+        """
+        Inserts the JSON payload element by element,
+        reporting what became of each
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file, either a JSON array or NDJSON
+        skip_items : int
+            elements already ingested, e.g. by an interrupted job
+
+        Yields
+        ------
+        table, outcome, message : tuple
+            outcome is 'inserted', 'skipped' if the record already
+            exists, 'failed', or 'unknown' for an element that is
+            no record; table is None for the unknown ones
+        """
+
+        for row, table, record, error in parse_json(file, skip_items):
+            yield self.insert_json_record(row, table, record, error)
+
+
+    def insert_json_record(self, row, table: str, record, error: str):
+        """
+        Inserts an element parsed by parse_json unless its record exists
+
+        Returns
+        -------
+        table, outcome, message : tuple
+            see iter_json
+        """
+
+        if table is None:
+            return None, 'unknown', error
+
+        if table == 'departments':
+            exists = self.repo.get_department_id(dept_name=row.get('dept_name'))
+            create = self.repo.create_department
+
+        elif table == 'students':
+            exists = self.repo.get_student_by_email(email=row.get('email'))
+            create = self.repo.create_student
+
+        elif table == 'subjects':
+            exists = self.repo.get_subject_id(subj_name=row.get('subj_name'))
+            create = self.repo.create_subject
+
+        elif table == 'teachers':
+            exists = self.repo.get_teacher_id(email=row.get('email'))
+            create = self.repo.create_teacher
+
+        else:
+            exists = self.repo.get_enrollment(
+                student_id=row.get('student_id'),
+                subject_id=row.get('subject_id')
+            )
+            create = self.repo.create_enrollment
+
+        if exists:
+            return table, 'skipped', JSON_TABLES[table][2]
+
+        if error is not None:
+            return table, 'failed', error
+
+        try:
+            success, message = create(record)
+        except Exception as e:
+            success, message = False, str(e)
+
+        return table, 'inserted' if success else 'failed', message
+
+
+    def claim_upload(self, key: str, format: str, digest: str = None, owner: str = None):
+        """
+        Looks up an earlier upload with the same key, claiming
+        the key for this upload if there is none
+
+        Parameters
+        ----------
+        key : str
+            the digest of the upload or its Idempotency-Key,
+            see models.UploadRecord.key
+        format : str
+            'csv' or 'json'
+        digest : Optional[str]
+            the SHA-256 of the upload, if it was hashed
+        owner : Optional[str]
+            the process running the upload, see JobManager.owner
+
+        Returns
+        -------
+        dict or None
+            the result of the earlier upload, or None once
+            claimed, when this upload has to be ingested
+
+        Raises
+        ------
+        HTTPException
+            If an upload with the same key is still running
+        """
+
+        claimed, record = self.repo.claim_upload(key=key, format=format, digest=digest, owner=owner)
+
+        if claimed:
+            return None
+
+        if record is None or record.status != 'done':
+            raise HTTPException(
+                status_code=409,
+                detail="An identical upload is in progress, retry once it is done."
+            )
+
+        return record.result
+
+
+    def finish_upload(self, key: str, result: dict):
+        """
+        Records the result of a claimed upload for its repeats
+
+        Raises
+        ------
+        HTTPException
+            If the result could not be recorded
+        """
+
+        success, message = self.repo.finish_upload(key=key, result=result)
+
+        if not success:
+            raise HTTPException(status_code=500, detail=message)
+
+
+    def release_upload(self, key: str, owner: str = None):
+        """
+        Releases the claim of an upload that failed
+        """
+
+        self.repo.release_upload(key=key, owner=owner)
+    
+
+class Getter:
+    """
+    a class to get any record from the db
+    """
+
+    def __init__(self, repo: SQLRepository):
+        """
+        Assigns the SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : SQLRepository
+            The SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+    
+    def get_subjects_by_student(self, student_id):
+        """
+        Fetches the subject list for the given student
+
+        Parameters
+        ----------
+        student_id : int
+            the id of the student
+
+        Served from SUBJECTS_CACHE when possible, which the repo
+        invalidates on writes to the student's enrollments or subjects
+
+        Returns
+        -------
+        list[dict]
+            the subject records with matching student in Enrollments table
+
+        Raises
+        ------
+        HTTPException
+            If the student does not exist
+        """
+
+        subjects = SUBJECTS_CACHE.get_or_load(
+            student_id,
+            lambda: self.__load_subjects(student_id)
+        )
+
+        if subjects is None:
+            raise HTTPException(status_code=400, detail="Student does not exist!")
+
+        return subjects
+    
+
+    def __load_subjects(self, student_id: int):
+        """
+        Reads the student's subjects from the db as plain dicts,
+        so they can outlive the session in the cache
+
+        Returns
+        -------
+        list[dict] or None
+            None if the student does not exist
+        """
+
+        subjects = self.repo.get_subject_by_student(
+            student_id=student_id
+        )
+
+        if subjects is None:
+            return None
+
+        columns = models.Subject.__table__.columns
+
+        return [
+            {column.name: getattr(subject, column.name) for column in columns}
+            for subject in subjects
+        ]
+    
+
+    def list_records(self, table_name: str, filters: dict, after: str = None, limit: int = 100):
+        """
+        Fetches one page of a table with keyset pagination
+
+        Parameters
+        ----------
+        table_name : str
+            one of the tables in models.TABLES
+        filters : dict
+            column name -> value to match, None values are ignored
+        after : Optional[str]
+            the `next_cursor` of the previous page, None for the first page
+        limit : int
+            the page size
+
+        Returns
+        -------
+        items, next_cursor : dict
+            next_cursor is the comma separated primary key of the
+            last item, None on the last page
+
+        Raises
+        ------
+        HTTPException
+            If the cursor is malformed
+        """
+
+        model = models.TABLES[table_name]
+        primary_key = list(model.__table__.primary_key.columns)
+
+        cursor = None
+
+        if after is not None:
+            try:
+                cursor = tuple(int(key) for key in after.split(','))
+            except ValueError:
+                cursor = ()
+
+            if len(cursor) != len(primary_key):
+                raise HTTPException(status_code=400, detail="Invalid cursor!")
+
+        records, has_more = self.repo.list_records(
+            model=model,
+            filters=filters,
+            after=cursor,
+            limit=limit
+        )
+
+        next_cursor = None
+
+        if has_more:
+            next_cursor = ','.join(
+                str(getattr(records[-1], column.name))
+                for column in primary_key
+            )
+
+        return {"items": records, "next_cursor": next_cursor}
+    
+
+    def list_students_by_subject(self, subject_id: int, after: str = None, limit: int = 100, count_only: bool = False):
+        """
+        Fetches one page of the students enrolled in a subject,
+        or only how many there are
+
+        Parameters
+        ----------
+        subject_id : int
+            the id of the subject
+        after : Optional[str]
+            the `next_cursor` of the previous page, None for the first page
+        limit : int
+            the page size
+        count_only : bool
+            count the students instead of listing them
+
+        Returns
+        -------
+        items, next_cursor : dict
+            next_cursor is the id of the last student,
+            None on the last page
+        subject_id, count : dict
+            with `count_only`
+
+        Raises
+        ------
+        HTTPException
+            If the subject does not exist or the cursor is malformed
+        """
+
+        if count_only:
+            count = self.repo.count_students_by_subject(subject_id)
+
+            if count is None:
+                raise HTTPException(status_code=400, detail="Subject does not exist!")
+
+            return {"subject_id": subject_id, "count": count}
+
+        cursor = None
+
+        if after is not None:
+            try:
+                cursor = int(after)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor!")
+
+        page = self.repo.get_students_by_subject(
+            subject_id=subject_id,
+            after=cursor,
+            limit=limit
+        )
+
+        if page is None:
+            raise HTTPException(status_code=400, detail="Subject does not exist!")
+
+        students, has_more = page
+
+        return {
+            "items": students,
+            "next_cursor": str(students[-1].id) if has_more else None
+        }
+    
+
+    def list_summary(self, scope: str, after: str = None, limit: int = 100):
+        """
+        Fetches one page of the enrollment counts of the subjects,
+        teachers or departments, read from the summary table
+
+        Parameters
+        ----------
+        scope : str
+            'subjects', 'teachers' or 'departments'
+        after : Optional[str]
+            the `next_cursor` of the previous page, None for the first page
+        limit : int
+            the page size
+
+        Returns
+        -------
+        items, next_cursor : dict
+            next_cursor is the id of the last item, None on the last page
+
+        Raises
+        ------
+        HTTPException
+            If the cursor is malformed
+        """
+
+        cursor = None
+
+        if after is not None:
+            try:
+                cursor = int(after)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor!")
+
+        rows, has_more = self.repo.list_summary(scope=scope, after=cursor, limit=limit)
+
+        return {
+            "items": rows,
+            "next_cursor": str(rows[-1]["id"]) if has_more else None
+        }
+    
+
+def read_update_request(file: BinaryIO) -> schemas.UpdateRequest:
+    """
+    Reads the updates of a JSON payload as a stream, see Setter.update_record
+    """
+
+    return schemas.UpdateRequest(
+        updates=[schemas.UpdateItem(**row) for row in iter_json_items(file)]
+    )
+
+
+class Setter:
+    """
+    a class to update one or more records in the db
+    """
+
+    def __init__(self, repo: SQLRepository):
+        """
+        Assigns the SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : SQLRepository
+            The SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+    
+    def update_record(self, file: BinaryIO):
+        """
+        Reads the JSON payload as a stream
+        and updates the records with matching details
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file, a JSON array or NDJSON of updates
+
+        Returns
+        -------
+        success/failure, message, updated : dict
+            updated holds the affected rows per table
+
+        Raises
+        ------
+        HTTPException
+            If the updating is not successful
+        """
+
+        return self.apply_updates(read_update_request(file))
+
+
+    def apply_updates(self, update_request: schemas.UpdateRequest):
+        """
+        Updates the records of a parsed request, see update_record
+
+        Parameters
+        ----------
+        update_request : schemas.UpdateRequest
+            see read_update_request
+        """
+
+        success, updated = self.repo.update_records(
+            update_request=update_request
+        )
+
+        if not success:
+            raise HTTPException(status_code=400, detail=updated)
+        
+        return {
+            "success": success,
+            "message": "Records updated successfully!",
+            "updated": updated
+        }
+    
+
+class Deleter:
+    """
+    class to delete a record from the db
+    """
+
+    def __init__(self, repo: SQLRepository):
+        """
+        Assigns the SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : SQLRepository
+            The SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+    
+    def delete_enrollment(self, student_id: int, subject_id: int):
+        """
+        Takes the file content of JSON payload 
+        and updates the records with matching details
+
+        Parameters
+        ----------
+        file_content : bytes
+            binary content of the file
+
+        Returns
+        -------
+        success/failure, message : tuple
+
+        Raises
+        ------
+        HTTPException
+            If the updating is not successful
+        """
+        
+        db_enroll = self.repo.get_enrollment(
+            student_id=student_id,
+            subject_id=subject_id
+        )
+
+        if not db_enroll:
+            raise HTTPException(status_code=400, detail="Enrollment not found!")
+
+        success, message = self.repo.delete_enrollments(
+            student_id=student_id,
+            subject_id=subject_id
+        )
+
+        if not success: 
+            raise HTTPException(status_code=400, detail=message)
+        return {"success": True, "message": message}
+    
+
+    def delete_enrollments(self, request: schemas.EnrollmentDeleteRequest, chunk_size: int = None):
+        """
+        Deletes a list of enrollments, or all the enrollments of a
+        student or of a subject, in chunked transactions
+
+        Parameters
+        ----------
+        request : schemas.EnrollmentDeleteRequest
+            the pairs, the student_id or the subject_id to delete
+        chunk_size : Optional[int]
+            pairs per transaction, defaults to `settings.delete_chunk_size`
+
+        Returns
+        -------
+        success, message, deleted, missing : dict
+            deleted counts the removed enrollments,
+            missing lists the requested pairs that did not exist
+
+        Raises
+        ------
+        HTTPException
+            If the request does not select exactly one of the three
+            OR If a chunk fails, the earlier chunks stay deleted
+        """
+
+        selectors = [request.enrollments, request.student_id, request.subject_id]
+
+        if sum(selector is not None for selector in selectors) != 1:
+            raise HTTPException(
+                status_code=400,
+                detail="Give exactly one of `enrollments`, `student_id` or `subject_id`."
+            )
+
+        if request.enrollments is not None:
+            pairs = [
+                (enrollment.student_id, enrollment.subject_id)
+                for enrollment in request.enrollments
+            ]
+        else:
+            pairs = self.repo.get_enrollment_pairs(
+                student_id=request.student_id,
+                subject_id=request.subject_id
+            )
+
+        deleted = 0
+        missing = []
+
+        # dict.fromkeys drops repeated pairs, keeping their order
+        for chunk in batched(dict.fromkeys(pairs), chunk_size or settings.delete_chunk_size):
+            success, found = self.repo.delete_enrollment_pairs(pairs=chunk)
+
+            if not success:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{found} ({deleted} enrollments were deleted before the failure)"
+                )
+
+            deleted += len(found)
+            missing += [
+                {"student_id": student_id, "subject_id": subject_id}
+                for student_id, subject_id in chunk
+                if (student_id, subject_id) not in found
+            ]
+
+        return {
+            "success": True,
+            "message": "Enrollments deleted successfully!",
+            "deleted": deleted,
+            "missing": missing
+        }
+
+
+class Exporter:
+    """
+    class to stream whole tables out of the db as CSV or NDJSON
+    """
+
+    def __init__(self, repo: SQLRepository):
+        """
+        Assigns the SQL repo of the current request to the instance
+
+        Parameters
+        ----------
+        repo : SQLRepository
+            The SQL Repository with all the functions related to the db
+        """
+
+        self.repo = repo
+
+
+    def export(self, table_name: str, format: str = 'csv', compress: bool = False, batch_size: int = None):
+        """
+        Streams a table, or the roster of all enrollments, one batch
+        of rows at a time so memory stays flat however large it is
+
+        CSV exports use the headers Uploader.upload_csv reads, and
+        the roster matches the uploaded roster file; enrollments are
+        exported as the roster in CSV, as upload_csv only inserts an
+        enrollment from a row naming its student and subject. NDJSON
+        exports of a table use its column names, which
+        Uploader.upload_json reads.
+
+        Parameters
+        ----------
+        table_name : str
+            one of the tables in models.TABLES, or 'roster'
+        format : str
+            'csv' or 'ndjson'
+        compress : bool
+            gzip the stream
+        batch_size : Optional[int]
+            rows per fetch, defaults to `settings.export_batch_size`
+
+        Yields
+        ------
+        bytes
+            the encoded chunks, the CSV header first
+        """
+
+        batch_size = batch_size or settings.export_batch_size
+
+        if table_name == 'roster' or (table_name == 'enrollments' and format == 'csv'):
+            header = ROSTER_COLUMNS
+            batches = self.repo.stream_roster(batch_size)
+        else:
+            model = models.TABLES[table_name]
+
+            if format == 'csv':
+                columns = EXPORT_COLUMNS[table_name]
+            else:
+                columns = {column.name: column.name for column in model.__table__.columns}
+
+            header = list(columns.values())
+            batches = self.repo.stream_records(model, columns, batch_size)
+
+        if format == 'csv':
+            chunks = self.__encode_csv(header, batches)
+        else:
+            chunks = self.__encode_ndjson(header, batches)
+
+        if compress:
+            chunks = self.__gzip(chunks)
+
+        yield from chunks
+
+
+    def __encode_csv(self, header, batches):
+        """
+        Yields the header line, then one chunk of CSV lines per batch
+        """
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+
+        writer.writerow(header)
+        yield buffer.getvalue().encode()
+
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+
+            writer.writerows(rows)
+            yield buffer.getvalue().encode()
+
+
+    def __encode_ndjson(self, header, batches):
+        """
+        Yields one chunk of JSON lines per batch
+        """
+
+        for rows in batches:
+            yield ''.join(
+                json.dumps(dict(zip(header, row))) + '\n'
+                for row in rows
+            ).encode()
+
+
+    def __gzip(self, chunks):
+        """
+        Compresses the chunks into one gzip stream, flushing
+        after each so a batch is sent as soon as it is read
+        """
+
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressor.flush()
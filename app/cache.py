@@ -0,0 +1,290 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+
+# returned by CacheBackend.get when the key is not cached
+MISSING = object()
+
+
+class CacheBackend:
+    """
+    Storage behind a ReadThroughCache.
+
+    A shared cache (e.g. Redis) can be swapped in by implementing
+    these methods; keys are hashable and values are JSON-like.
+    """
+
+    def get(self, key):
+        """returns the cached value or MISSING"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """caches the value under the key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """drops the key if it is cached"""
+        raise NotImplementedError
+
+    def clear(self):
+        """drops every key"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """backend specific counters"""
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process cache bounded by size (least recently used out)
+    and by age (entries older than `ttl` seconds are misses)
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Parameters
+        ----------
+        max_size : int
+            most entries held at once, 0 disables caching
+        ttl : float
+            seconds an entry stays valid
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                return MISSING
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self.__entries[key]
+                self.expirations += 1
+                return MISSING
+
+            self.__entries.move_to_end(key)
+            return value
+
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.__entries),
+            "max_size": self.max_size,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class ReadThroughCache:
+    """
+    Serves values from the backend, loading and storing them on a miss
+    """
+
+    def __init__(self, backend: CacheBackend):
+        """
+        Parameters
+        ----------
+        backend : CacheBackend
+            where the values are stored
+        """
+
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        # bumped on every invalidation, a load that overlapped one
+        # may have read the old rows and is not stored
+        self.__generation = 0
+
+
+    def get_or_load(self, key, load):
+        """
+        Returns the cached value of the key, or the result of `load()`
+
+        Parameters
+        ----------
+        key : Hashable
+            the cache key
+        load : Callable[[], Any]
+            reads the value from the db, None results are not cached
+
+        Returns
+        -------
+        Any
+            the cached or loaded value
+        """
+
+        value = self.backend.get(key)
+
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self.__generation
+        value = load()
+
+        if value is not None and generation == self.__generation:
+            self.backend.set(key, value)
+
+        return value
+
+
+    def invalidate(self, keys):
+        """
+        Drops the given keys, call after the write is committed
+
+        Parameters
+        ----------
+        keys : Iterable[Hashable]
+            the keys affected by the write
+        """
+
+        self.__generation += 1
+
+        for key in set(keys):
+            self.backend.delete(key)
+            self.invalidations += 1
+
+
+    def invalidate_all(self):
+        """
+        Drops every key, for writes made outside this process
+        whose keys are not known here
+        """
+
+        self.__generation += 1
+        self.backend.clear()
+        self.invalidations += 1
+
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss/invalidation counters and the backend's
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            **self.backend.stats()
+        }
+
+
+class NaturalKeyIndex:
+    """
+    natural key -> id of the rows of a few tables, e.g. dept_name -> id,
+    one bounded MemoryBackend per table
+
+    Writes in this process invalidate the table, those of other
+    processes go unseen until the keys expire after `ttl` seconds.
+    """
+
+    def __init__(self, tables: list, max_size: int, ttl: float = float('inf')):
+        """
+        Parameters
+        ----------
+        tables : list[str]
+            the names of the indexed tables
+        max_size : int
+            most keys held per table, 0 disables the index
+        ttl : float
+            seconds a key stays valid
+        """
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__tables = {
+            table: MemoryBackend(max_size=max_size, ttl=ttl)
+            for table in tables
+        }
+
+
+    def indexes(self, table: str) -> bool:
+        """whether the table is indexed"""
+        return table in self.__tables
+
+
+    def get(self, table: str, key):
+        """returns the id of the key or MISSING"""
+
+        id = self.__tables[table].get(key)
+
+        if id is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return id
+
+
+    def set(self, table: str, key, id: int):
+        """records the id of a committed row"""
+        self.__tables[table].set(key, id)
+
+
+    def invalidate(self, table: str):
+        """forgets every key of the table, e.g. after its rows are updated"""
+        self.__tables[table].clear()
+
+
+    def stats(self) -> dict:
+        """hit/miss counters and the counters of each table"""
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            **{table: index.stats() for table, index in self.__tables.items()}
+        }
+
+
+# student id -> list of the student's subjects, read by Getter
+# and invalidated by SQLRepository on writes to enrollments or subjects
+SUBJECTS_CACHE = ReadThroughCache(
+    MemoryBackend(
+        max_size=settings.cache_max_size,
+        ttl=settings.cache_ttl
+    )
+)
@@ -1,510 +1,2080 @@
-import sys
-
-sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
-
-from scripts import models, schemas
-from scripts.database import SessionLocal, engine, Base
-
-
-class SQLRepository:
-    """
-    A class to represent the data access layer. 
-    """
-
-    def __init__(self):
-        """
-        creates all the tables defined using declarative_base()
-        
-        Attributes
-        ----------
-        db : Session
-            an instance of a database with all the tables defined in models.py
-        """
-        Base.metadata.create_all(bind=engine)
-        self.db = next(self.__get_db())
-
-
-    def __get_db(self):
-        """
-        Provides a SQLAlchemy database session 
-        to the caller within a context manager.
-        """
-
-        db = SessionLocal()
-
-        try:
-            yield db
-        finally:
-            db.close()
-
-    
-    def create_student(
-            self,
-            student: schemas.StudentCreate
-        ):
-        """
-        creates the student record in the db
-
-        Parameters
-        ----------
-        student : schemas.StudentCreate
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            db_student = models.Student(**student.dict())
-            self.db.add(db_student)
-            
-            self.db.commit()
-            self.db.refresh(db_student)
-            
-            return True, "Student created successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-
-
-    def create_department(
-            self,
-            department: schemas.DepartmentCreate,
-        ):
-        """
-        creates the department record in the db
-
-        Parameters
-        ----------
-        department : schemas.DepartmentCreate
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-            
-        try:
-            db_dept = models.Department(**department.dict())
-            self.db.add(db_dept)
-
-            self.db.commit()
-            self.db.refresh(db_dept)
-
-            return True, "Department created successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-
-
-    def create_subject(
-            self,
-            subject: schemas.SubjectCreate
-        ):
-        """
-        creates the subject record in the db
-
-        Parameters
-        ----------
-        subject : schemas.SubjectCreate
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            db_subject = models.Subject(
-                **subject.dict()
-            )
-            self.db.add(db_subject)
-
-            self.db.commit()
-            self.db.refresh(db_subject)
-            
-            return True, "Subject created successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-
-
-    def create_teacher(
-            self,
-            teacher: schemas.TeacherCreate
-        ):
-        """
-        creates the teacher record in the db
-
-        Parameters
-        ----------
-        teacher : schemas.TeacherCreate
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            db_teacher = models.Teacher(**teacher.dict())
-            self.db.add(db_teacher)
-
-            self.db.commit()
-            self.db.refresh(db_teacher)
-            
-            return True, "Teacher created successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-
-
-    def create_enrollment(
-            self,
-            enrollment: schemas.EnrollmentCreate
-        ):
-        """
-        creates the enrollment record in the db
-
-        Parameters
-        ----------
-        enrollment : schemas.EnrollmentCreate
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            db_enroll = models.Enrollment(**enrollment.dict())
-            self.db.add(db_enroll)
-
-            self.db.commit()
-            self.db.refresh(db_enroll)
-            
-            return True, "Enrollment created successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-
-
-    def get_student_by_email(self, email: str):
-        """
-        Fetches the student with the given email in the db
-
-        Parameters
-        ----------
-        email : str
-            the email of the student
-
-        Returns
-        -------
-        models.Student
-            the student record with matching email
-        """
-
-        return (
-            self.db
-            .query(models.Student)
-            .filter(models.Student.email == email)
-            .first()
-        )
-    
-
-    def get_student_by_id(self, id: str):
-        """
-        Fetches the student with the given id in the db
-
-        Parameters
-        ----------
-        id : int
-            the id of the student
-
-        Returns
-        -------
-        models.Student
-            the student record with matching id
-        """
-
-        return (
-            self.db
-            .query(models.Student)
-            .filter(models.Student.id == id)
-            .first()
-        )
-
-
-    def get_department(self, dept_name: str):
-        """
-        Fetches the department with the given name in the db
-
-        Parameters
-        ----------
-        dept_name : str
-            the name of the department
-
-        Returns
-        -------
-        models.Department
-            the department record with matching name
-        """
-
-        return (
-            self.db
-            .query(models.Department)
-            .filter(models.Department.dept_name == dept_name)
-            .first()
-        )
-
-
-    def get_teacher(self, email: str):
-        """
-        Fetches the teacher with the given email in the db
-
-        Parameters
-        ----------
-        email : str
-            the email of the teacher
-
-        Returns
-        -------
-        models.Teacher
-            the teacher record with matching email
-        """
-
-        return (
-            self.db
-            .query(models.Teacher)
-            .filter(models.Teacher.email == email)
-            .first()
-        )
-
-
-    def get_subject(self, subj_name: str):
-        """
-        Fetches the subject with the given name in the db
-
-        Parameters
-        ----------
-        subj_name : str
-            the name of the subject
-
-        Returns
-        -------
-        models.Subject
-            the subject record with matching name
-        """
-
-        return (
-            self.db
-            .query(models.Subject)
-            .filter(models.Subject.subj_name == subj_name)
-            .first()
-        )
-
-
-    def get_enrollment(self, student_id: int, subject_id: int):
-        """
-        Fetches the enrollment with the given credentials
-
-        Parameters
-        ----------
-        student_id : int
-            the id of the student
-        subject_id : int
-            the id of the subject
-
-        Returns
-        -------
-        models.Enrollment
-            the enrollment with matching credentials
-        """
-
-        return (
-            self.db
-            .query(models.Enrollment)
-            .filter(
-                (models.Enrollment.student_id == student_id) 
-                & (models.Enrollment.subject_id == subject_id)
-            )
-            .first()
-        )
-
-
-    def get_subject_by_student(self, student_id: int):
-        """
-        Fetches the subject list for the given student
-
-        Parameters
-        ----------
-        id : int
-            the id of the student
-
-        Returns
-        -------
-        list[models.Subject]
-            the subject records with matching student in Enrollments table
-        """
-
-        enrollments = (
-            self.db
-            .query(models.Enrollment)
-            .filter(models.Enrollment.student_id == student_id)
-            .all()
-        )
-
-        subjects = []
-        
-        # for each subject the student is enrolled in
-        for enrollment in enrollments:
-            subject = (
-                self.db
-                .query(models.Subject)
-                .filter(models.Subject.id == enrollment.subject_id)
-                .first()
-            )
-
-            if subject:
-                subjects.append(subject)
-
-        return subjects
-
-
-    def update_records(self, update_request: schemas.UpdateRequest):
-        """
-        updates the the record with matching details
-
-        Parameters
-        ----------
-        update_request : schemas.UpdateRequest
-            List of schemas.UpdateItem to be updated
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-        
-        try:
-            for update_item in update_request.updates:
-                table_name = update_item.table_name
-                record_id = update_item.record_id
-                updated_fields = update_item.updated_fields
-
-                if table_name == "students":
-                    (
-                        self.db
-                        .query(models.Student)
-                        .filter(models.Student.id == record_id)
-                        .update(updated_fields)
-                    )
-
-                elif table_name == "teachers":
-                    (
-                        self.db
-                        .query(models.Teacher)
-                        .filter(models.Teacher.id == record_id)
-                        .update(updated_fields)
-                    )
-
-                elif table_name == "departments":
-                    (
-                        self.db
-                        .query(models.Department)
-                        .filter(models.Department.id == record_id)
-                        .update(updated_fields)
-                    )
-
-                elif table_name == "subjects":
-                    (
-                        self.db
-                        .query(models.Subject)
-                        .filter(models.Subject.id == record_id)
-                        .update(updated_fields)
-                    )
-
-                elif table_name == "students":
-                    (
-                        self.db
-                        .query(models.Student)
-                        .filter(models.Student.id == record_id)
-                        .update(updated_fields)
-                    )
-                
-                else:
-                    return False, f"Table '{table_name}' does not exist!"
-
-            self.db.commit()
-            return True, "Records updated successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-        
-
-    def delete_enrollments(self, student_id: int, subject_id: int):
-        """
-        Deletes the enrollment with matching credentials
-
-        Parameters
-        ----------
-        student_id : int
-            the id of the student
-        subject_id : int
-            the id of the subject
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            enrollment = (
-                self.db
-                .query(models.Enrollment)
-                .filter(
-                    (models.Enrollment.student_id == student_id) 
-                    & (models.Enrollment.subject_id == subject_id)
-                )
-                .first()
-            )
-            
-            self.db.delete(enrollment)
-            self.db.commit()
-            return True, "Enrollment deleted successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
-        
-    
-    def delete_student(self, student_id: int):
-        """
-        Deletes the student with matching id
-
-        Parameters
-        ----------
-        student_id : int
-            the id of the student
-
-        Returns
-        -------
-        success/failure, message : tuple
-        """
-
-        try:
-            db_student = (
-                self.db
-                .query(models.Student)
-                .filter(models.Student.id == student_id)
-                .first()
-            )
-
-            self.db.delete(db_student)
-            self.db.commit()
-            return True, "Student deleted successfully!"
-        
-        except Exception as e:
-            self.db.rollback()
-            return False, str(e)
\ No newline at end of file
+from sqlalchemy import and_, bindparam, delete, exc, func, insert, inspect, or_, select, text, tuple_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+from collections import Counter
+from datetime import datetime, timedelta
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from scripts import models, schemas
+from scripts.database import Base, engine
+from cache import SUBJECTS_CACHE, NaturalKeyIndex, MISSING
+from diagnostics import diagnose, intentional_batch
+
+
+def create_tables():
+    """
+    creates all the tables defined using declarative_base()
+    """
+    Base.metadata.create_all(bind=engine)
+
+
+def get_schema_version():
+    """
+    The schema version recorded in the db
+
+    Returns
+    -------
+    int or None
+        None if the db has no schema_version table or row
+
+    Raises
+    ------
+    sqlalchemy.exc.SQLAlchemyError
+        If the db can not be read, e.g. it is unreachable or locked
+    """
+
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(models.SchemaVersion.__tablename__):
+            return None
+
+        return conn.execute(select(func.max(models.SchemaVersion.version))).scalar()
+
+
+def init_db(create_schema: bool = None):
+    """
+    Checks that the db is at the schema version of the models,
+    creating the missing tables and recording the version if not.
+
+    Called once per process at startup, instead of create_tables,
+    since the check is two queries where create_all inspects every table.
+    Missing tables, nullable columns and indexes are added and the
+    enrollment summary is rebuilt; any other change to an existing
+    table needs a migration before the version is bumped.
+
+    Parameters
+    ----------
+    create_schema : Optional[bool]
+        create the missing tables when the version is behind,
+        defaults to `settings.db_create_schema`
+
+    Raises
+    ------
+    RuntimeError
+        If the version is behind and creating is off, or if the
+        db is at a newer version than the models
+    """
+
+    if create_schema is None:
+        create_schema = settings.db_create_schema
+
+    version = get_schema_version()
+
+    if version == models.SCHEMA_VERSION:
+        return
+
+    if version is not None and version > models.SCHEMA_VERSION:
+        raise RuntimeError(
+            f"The db schema is at version {version}, newer than "
+            f"this app's {models.SCHEMA_VERSION}."
+        )
+
+    if not create_schema:
+        raise RuntimeError(
+            f"The db schema is at version {version}, expected {models.SCHEMA_VERSION}. "
+            "Migrate it, or set DB_CREATE_SCHEMA to create the missing tables."
+        )
+
+    create_tables()
+
+    with engine.begin() as conn:
+        # create_all skips the new columns of existing tables
+        inspector = inspect(conn)
+        preparer = conn.dialect.identifier_preparer
+
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {preparer.format_table(table)} "
+                        f"ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"
+                    ))
+
+        # and the new indexes
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+        conn.execute(delete(models.SchemaVersion))
+        conn.execute(insert(models.SchemaVersion).values(version=models.SCHEMA_VERSION))
+
+    # a new version may count differently, or add the summary to a filled db
+    with Session(engine) as db:
+        success, message = SQLRepository(db).rebuild_summary()
+
+    if not success:
+        raise RuntimeError(message)
+
+
+class SQLRepository:
+    """
+    A class to represent the data access layer. 
+    """
+
+    # natural key -> id of the rows looked up by the uploads,
+    # shared by the repositories of all requests
+    key_index = NaturalKeyIndex(
+        tables=['departments', 'teachers', 'subjects'],
+        max_size=settings.key_index_max_size,
+        ttl=settings.key_index_ttl
+    )
+
+    def __init__(self, db: Session):
+        """
+        Assigns the database session to the repository
+
+        Parameters
+        ----------
+        db : Session
+            the session of the current request, see database.get_db
+        """
+        self.db = db
+
+
+    def diagnose(self, strict: bool = False, **kwargs):
+        """
+        Diagnostic mode: a block that logs the slow statements of
+        this repository with their plans and flags N+1 patterns
+
+            with repo.diagnose(strict=True, n_plus_one_threshold=3):
+                repo.get_subject_by_student(1)
+
+        Parameters
+        ----------
+        strict : bool
+            raise NPlusOneError when the block repeats a statement
+            shape too often, e.g. in tests
+        **kwargs
+            n_plus_one_threshold, slow_query_ms and label, see diagnostics.diagnose
+
+        Returns
+        -------
+        a context manager yielding the block's diagnostics.QueryLog
+        """
+
+        return diagnose(self.db.get_bind(), strict=strict, **kwargs)
+
+    
+    def create_student(
+            self,
+            student: schemas.StudentCreate
+        ):
+        """
+        creates the student record in the db
+
+        Parameters
+        ----------
+        student : schemas.StudentCreate
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            db_student = models.Student(**student.dict())
+            self.db.add(db_student)
+
+            self.__apply_summary(self.__student_deltas([student.dept_id], 1))
+            
+            self.db.commit()
+            self.db.refresh(db_student)
+            
+            return True, "Student created successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def create_department(
+            self,
+            department: schemas.DepartmentCreate,
+        ):
+        """
+        creates the department record in the db
+
+        Parameters
+        ----------
+        department : schemas.DepartmentCreate
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+            
+        try:
+            db_dept = models.Department(**department.dict())
+            self.db.add(db_dept)
+
+            self.db.commit()
+            self.db.refresh(db_dept)
+
+            self.key_index.set('departments', db_dept.dept_name, db_dept.id)
+
+            return True, "Department created successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def create_subject(
+            self,
+            subject: schemas.SubjectCreate
+        ):
+        """
+        creates the subject record in the db
+
+        Parameters
+        ----------
+        subject : schemas.SubjectCreate
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            db_subject = models.Subject(
+                **subject.dict()
+            )
+            self.db.add(db_subject)
+
+            self.db.commit()
+            self.db.refresh(db_subject)
+
+            self.key_index.set('subjects', db_subject.subj_name, db_subject.id)
+            
+            return True, "Subject created successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def create_teacher(
+            self,
+            teacher: schemas.TeacherCreate
+        ):
+        """
+        creates the teacher record in the db
+
+        Parameters
+        ----------
+        teacher : schemas.TeacherCreate
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            db_teacher = models.Teacher(**teacher.dict())
+            self.db.add(db_teacher)
+
+            self.db.commit()
+            self.db.refresh(db_teacher)
+
+            self.key_index.set('teachers', db_teacher.email, db_teacher.id)
+            
+            return True, "Teacher created successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def create_enrollment(
+            self,
+            enrollment: schemas.EnrollmentCreate
+        ):
+        """
+        creates the enrollment record in the db
+
+        Parameters
+        ----------
+        enrollment : schemas.EnrollmentCreate
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            db_enroll = models.Enrollment(**enrollment.dict())
+            self.db.add(db_enroll)
+
+            self.__apply_summary(self.__enrollment_deltas(
+                [(enrollment.student_id, enrollment.subject_id)], 1
+            ))
+
+            self.db.commit()
+            self.db.refresh(db_enroll)
+
+            SUBJECTS_CACHE.invalidate([enrollment.student_id])
+            
+            return True, "Enrollment created successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def get_student_by_email(self, email: str):
+        """
+        Fetches the student with the given email in the db
+
+        Parameters
+        ----------
+        email : str
+            the email of the student
+
+        Returns
+        -------
+        models.Student
+            the student record with matching email
+        """
+
+        return (
+            self.db
+            .query(models.Student)
+            .filter(models.Student.email == email)
+            .first()
+        )
+    
+
+    def get_student_by_id(self, id: str):
+        """
+        Fetches the student with the given id in the db
+
+        Parameters
+        ----------
+        id : int
+            the id of the student
+
+        Returns
+        -------
+        models.Student
+            the student record with matching id
+        """
+
+        return (
+            self.db
+            .query(models.Student)
+            .filter(models.Student.id == id)
+            .first()
+        )
+
+
+    def get_department(self, dept_name: str):
+        """
+        Fetches the department with the given name in the db
+
+        Parameters
+        ----------
+        dept_name : str
+            the name of the department
+
+        Returns
+        -------
+        models.Department
+            the department record with matching name
+        """
+
+        return (
+            self.db
+            .query(models.Department)
+            .filter(models.Department.dept_name == dept_name)
+            .first()
+        )
+
+
+    def get_teacher(self, email: str):
+        """
+        Fetches the teacher with the given email in the db
+
+        Parameters
+        ----------
+        email : str
+            the email of the teacher
+
+        Returns
+        -------
+        models.Teacher
+            the teacher record with matching email
+        """
+
+        return (
+            self.db
+            .query(models.Teacher)
+            .filter(models.Teacher.email == email)
+            .first()
+        )
+
+
+    def get_subject(self, subj_name: str):
+        """
+        Fetches the subject with the given name in the db
+
+        Parameters
+        ----------
+        subj_name : str
+            the name of the subject
+
+        Returns
+        -------
+        models.Subject
+            the subject record with matching name
+        """
+
+        return (
+            self.db
+            .query(models.Subject)
+            .filter(models.Subject.subj_name == subj_name)
+            .first()
+        )
+
+
+    def get_department_id(self, dept_name: str):
+        """
+        Fetches the id of the department with the given name,
+        from the natural key index when it is there
+
+        Parameters
+        ----------
+        dept_name : str
+            the name of the department
+
+        Returns
+        -------
+        int or None
+            the id of the department with matching name
+        """
+
+        return self.get_ids_by_key(
+            models.Department.dept_name, [dept_name]
+        ).get(dept_name)
+
+
+    def get_teacher_id(self, email: str):
+        """
+        Fetches the id of the teacher with the given email,
+        from the natural key index when it is there
+
+        Parameters
+        ----------
+        email : str
+            the email of the teacher
+
+        Returns
+        -------
+        int or None
+            the id of the teacher with matching email
+        """
+
+        return self.get_ids_by_key(
+            models.Teacher.email, [email]
+        ).get(email)
+
+
+    def get_subject_id(self, subj_name: str):
+        """
+        Fetches the id of the subject with the given name,
+        from the natural key index when it is there
+
+        Parameters
+        ----------
+        subj_name : str
+            the name of the subject
+
+        Returns
+        -------
+        int or None
+            the id of the subject with matching name
+        """
+
+        return self.get_ids_by_key(
+            models.Subject.subj_name, [subj_name]
+        ).get(subj_name)
+
+
+    def get_enrollment(self, student_id: int, subject_id: int):
+        """
+        Fetches the enrollment with the given credentials
+
+        Parameters
+        ----------
+        student_id : int
+            the id of the student
+        subject_id : int
+            the id of the subject
+
+        Returns
+        -------
+        models.Enrollment
+            the enrollment with matching credentials
+        """
+
+        return (
+            self.db
+            .query(models.Enrollment)
+            .filter(
+                (models.Enrollment.student_id == student_id) 
+                & (models.Enrollment.subject_id == subject_id)
+            )
+            .first()
+        )
+
+
+    def get_subject_by_student(self, student_id: int):
+        """
+        Fetches the subject list for the given student in one query,
+        joining the student to its enrollments and their subjects
+
+        Parameters
+        ----------
+        id : int
+            the id of the student
+
+        Returns
+        -------
+        list[Row] or None
+            the subject columns of each subject with matching student in
+            Enrollments table, ordered by subject id, or None if the
+            student does not exist; plain rows, not hydrated models
+        """
+
+        rows = self.db.execute(
+            select(
+                models.Student.id.label('student_id'),
+                *models.Subject.__table__.columns
+            )
+            .outerjoin(
+                models.Enrollment,
+                models.Enrollment.student_id == models.Student.id
+            )
+            .outerjoin(
+                models.Subject,
+                models.Subject.id == models.Enrollment.subject_id
+            )
+            .where(models.Student.id == student_id)
+            .order_by(models.Subject.id)
+        ).all()
+
+        # no row at all means no such student,
+        # a student without enrollments gives one row with no subject
+        if not rows:
+            return None
+
+        return [row for row in rows if row.id is not None]
+
+
+    def get_students_by_subject(self, subject_id: int, after: int = None, limit: int = 100):
+        """
+        Fetches one page of the students enrolled in a subject, in id
+        order, seeking past the last id of the previous page along
+        the enrollments' subject index
+
+        Parameters
+        ----------
+        subject_id : int
+            the id of the subject
+        after : Optional[int]
+            the id of the last student of the previous page
+        limit : int
+            the page size
+
+        Returns
+        -------
+        students, has_more : tuple
+            the page of student rows and whether another page
+            follows, or None if the subject does not exist
+        """
+
+        statement = (
+            select(models.Student.__table__)
+            .join(models.Enrollment, models.Enrollment.student_id == models.Student.id)
+            .where(models.Enrollment.subject_id == subject_id)
+        )
+
+        if after is not None:
+            statement = statement.where(models.Enrollment.student_id > after)
+
+        students = self.db.execute(
+            statement
+            .order_by(models.Enrollment.student_id)
+            .limit(limit + 1)
+        ).all()
+
+        # only an empty page needs telling apart from a missing subject
+        if not students and self.db.get(models.Subject, subject_id) is None:
+            return None
+
+        return students[:limit], len(students) > limit
+
+
+    def count_students_by_subject(self, subject_id: int):
+        """
+        Counts the students enrolled in a subject from the
+        enrollments' subject index alone
+
+        Parameters
+        ----------
+        subject_id : int
+            the id of the subject
+
+        Returns
+        -------
+        int or None
+            None if the subject does not exist
+        """
+
+        count = self.db.scalar(
+            select(func.count())
+            .select_from(models.Enrollment)
+            .where(models.Enrollment.subject_id == subject_id)
+        )
+
+        if not count and self.db.get(models.Subject, subject_id) is None:
+            return None
+
+        return count
+
+
+    def update_records(self, update_request: schemas.UpdateRequest):
+        """
+        updates the the records with matching details in one transaction
+
+        The items are grouped by table and by the set of updated columns,
+        and each group runs as one executemany UPDATE by primary key
+
+        Parameters
+        ----------
+        update_request : schemas.UpdateRequest
+            List of schemas.UpdateItem to be updated
+
+        Returns
+        -------
+        success/failure, updated/message : tuple
+            updated maps each table name to the number of affected rows
+        """
+        
+        try:
+            groups = {}
+            updated = {}
+
+            # what the updated rows add to the enrollment summary, before and after
+            summary_subjects, summary_students = self.__summary_keys(update_request.updates)
+            contributions = self.__summary_contributions(summary_subjects, summary_students)
+
+            # the group each record was last updated in
+            record_groups = {}
+
+            affected_students = set()
+            affected_subjects = set()
+
+            for update_item in update_request.updates:
+                table_name = update_item.table_name
+                model = models.TABLES.get(table_name)
+
+                if model is None:
+                    self.db.rollback()
+                    return False, f"Table '{table_name}' does not exist!"
+
+                primary_key = list(model.__table__.primary_key.columns)
+                record_id = update_item.record_id
+
+                if not isinstance(record_id, list):
+                    record_id = [record_id]
+
+                if len(record_id) != len(primary_key):
+                    self.db.rollback()
+                    return False, (
+                        f"Records of '{table_name}' are identified by "
+                        f"{[column.name for column in primary_key]}!"
+                    )
+
+                unknown = set(update_item.updated_fields) - set(model.__table__.columns.keys())
+
+                if unknown:
+                    self.db.rollback()
+                    return False, f"Columns {sorted(unknown)} do not exist in '{table_name}'!"
+
+                if not update_item.updated_fields:
+                    continue
+
+                group = (table_name, tuple(sorted(update_item.updated_fields)))
+                record = (table_name, tuple(record_id))
+
+                # a record updated again in another group must keep
+                # the order of the items, so run what is pending first
+                if record_groups.get(record, group) != group:
+                    self.__execute_updates(groups, updated)
+                    record_groups.clear()
+
+                record_groups[record] = group
+                groups.setdefault(group, []).append({
+                    **{f"pk_{column.name}": value for column, value in zip(primary_key, record_id)},
+                    **{f"new_{column}": value for column, value in update_item.updated_fields.items()}
+                })
+
+                if table_name == "subjects":
+                    affected_subjects.add(record_id[0])
+                elif table_name == "enrollments":
+                    affected_students.add(record_id[0])
+                    affected_students.add(update_item.updated_fields.get("student_id", record_id[0]))
+
+            self.__execute_updates(groups, updated)
+
+            deltas = self.__summary_contributions(summary_subjects, summary_students)
+            deltas.subtract(contributions)
+            self.__apply_summary(deltas)
+
+            # their cached subject lists show the old subject fields
+            affected_students.update(self.__enrolled_students(list(affected_subjects)))
+
+            self.db.commit()
+
+            SUBJECTS_CACHE.invalidate(affected_students)
+
+            # the natural keys of the updated rows may have changed
+            for table_name in updated:
+                if self.key_index.indexes(table_name):
+                    self.key_index.invalidate(table_name)
+
+            return True, updated
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def __execute_updates(self, groups: dict, updated: dict):
+        """
+        Runs one executemany UPDATE per group and empties the groups
+
+        Parameters
+        ----------
+        groups : dict
+            (table name, updated columns) -> list of bind parameters
+        updated : dict
+            table name -> affected rows, incremented in place
+        """
+
+        for (table_name, columns), params in groups.items():
+            table = models.TABLES[table_name].__table__
+
+            statement = (
+                update(table)
+                .where(and_(*(
+                    column == bindparam(f"pk_{column.name}")
+                    for column in table.primary_key.columns
+                )))
+                .values({column: bindparam(f"new_{column}") for column in columns})
+            )
+
+            result = self.db.execute(statement, params)
+            updated[table_name] = updated.get(table_name, 0) + result.rowcount
+
+        groups.clear()
+        
+
+    def __enrolled_students(self, subject_ids: list):
+        """
+        Fetches the ids of the students enrolled in any of the subjects
+
+        Parameters
+        ----------
+        subject_ids : list[int]
+            the ids of the subjects
+
+        Returns
+        -------
+        list[int]
+            the ids of their students
+        """
+
+        if not subject_ids:
+            return []
+
+        return self.db.scalars(
+            select(models.Enrollment.student_id)
+            .where(models.Enrollment.subject_id.in_(subject_ids))
+            .distinct()
+        ).all()
+        
+
+    def delete_enrollments(self, student_id: int, subject_id: int):
+        """
+        Deletes the enrollment with matching credentials
+
+        Parameters
+        ----------
+        student_id : int
+            the id of the student
+        subject_id : int
+            the id of the subject
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            enrollment = (
+                self.db
+                .query(models.Enrollment)
+                .filter(
+                    (models.Enrollment.student_id == student_id) 
+                    & (models.Enrollment.subject_id == subject_id)
+                )
+                .first()
+            )
+            
+            self.db.delete(enrollment)
+            self.__apply_summary(self.__enrollment_deltas([(student_id, subject_id)], -1))
+            self.db.commit()
+
+            SUBJECTS_CACHE.invalidate([student_id])
+            return True, "Enrollment deleted successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+        
+    
+    def get_enrollment_pairs(self, student_id: int = None, subject_id: int = None):
+        """
+        Fetches the enrollments of a student or of a subject
+
+        Parameters
+        ----------
+        student_id : Optional[int]
+            the id of the student
+        subject_id : Optional[int]
+            the id of the subject
+
+        Returns
+        -------
+        list[tuple[int, int]]
+            the matching (student_id, subject_id) pairs
+        """
+
+        statement = select(
+            models.Enrollment.student_id,
+            models.Enrollment.subject_id
+        )
+
+        if student_id is not None:
+            statement = statement.where(models.Enrollment.student_id == student_id)
+        if subject_id is not None:
+            statement = statement.where(models.Enrollment.subject_id == subject_id)
+
+        return [tuple(row) for row in self.db.execute(statement)]
+
+
+    def delete_enrollment_pairs(self, pairs: list):
+        """
+        Deletes the enrollments with matching credentials
+        with one set-based DELETE in a single transaction
+
+        Parameters
+        ----------
+        pairs : list[tuple[int, int]]
+            the (student_id, subject_id) pairs to delete
+
+        Returns
+        -------
+        success/failure, deleted/message : tuple
+            deleted is the set of pairs that existed and were removed
+        """
+
+        # called once per chunk of a bulk delete
+        with intentional_batch('delete_enrollment_pairs'):
+            try:
+                existing = self.get_existing_enrollments(pairs)
+
+                if existing:
+                    self.db.execute(
+                        delete(models.Enrollment)
+                        .where(
+                            tuple_(
+                                models.Enrollment.student_id,
+                                models.Enrollment.subject_id
+                            ).in_(existing)
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+
+                    self.__apply_summary(self.__enrollment_deltas(existing, -1))
+
+                self.db.commit()
+
+                SUBJECTS_CACHE.invalidate(student_id for student_id, _ in existing)
+                return True, existing
+
+            except Exception as e:
+                self.db.rollback()
+                return False, str(e)
+        
+    
+    def delete_student(self, student_id: int):
+        """
+        Deletes the student with matching id, and their enrollments
+
+        Parameters
+        ----------
+        student_id : int
+            the id of the student
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            db_student = (
+                self.db
+                .query(models.Student)
+                .filter(models.Student.id == student_id)
+                .first()
+            )
+
+            pairs = self.get_enrollment_pairs(student_id=student_id)
+
+            self.db.execute(
+                delete(models.Enrollment)
+                .where(models.Enrollment.student_id == student_id)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.expire(db_student, ['subjects'])
+            self.db.delete(db_student)
+
+            deltas = self.__enrollment_deltas(pairs, -1)
+            deltas.update(self.__student_deltas([db_student.dept_id], -1))
+            self.__apply_summary(deltas)
+
+            self.db.commit()
+
+            SUBJECTS_CACHE.invalidate([student_id])
+            return True, "Student deleted successfully!"
+        
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def list_records(self, model, filters: dict, after: tuple = None, limit: int = 100):
+        """
+        Fetches one page of a table in primary key order,
+        seeking past the last key of the previous page
+        instead of counting off an OFFSET
+
+        Parameters
+        ----------
+        model : Base
+            the model of the table e.g. models.Student
+        filters : dict
+            column name -> value to match, None values are ignored
+        after : Optional[tuple]
+            the primary key of the last record of the previous page
+        limit : int
+            the page size
+
+        Returns
+        -------
+        records, has_more : tuple
+            the page of rows, with the table's columns as attributes,
+            and whether another page follows
+        """
+
+        primary_key = list(model.__table__.primary_key.columns)
+        statement = select(model.__table__)
+
+        for column, value in filters.items():
+            if value is not None:
+                statement = statement.where(getattr(model, column) == value)
+
+        if after is not None and len(primary_key) == 1:
+            statement = statement.where(primary_key[0] > after[0])
+        elif after is not None:
+            statement = statement.where(tuple_(*primary_key) > tuple_(*after))
+
+        records = self.db.execute(
+            statement
+            .order_by(*primary_key)
+            .limit(limit + 1)
+        ).all()
+
+        return records[:limit], len(records) > limit
+
+
+    def stream_records(self, model, columns: dict, batch_size: int):
+        """
+        Yields every row of a table in primary key order, one
+        keyset page at a time so only one batch is held at a time
+
+        Parameters
+        ----------
+        model : Base
+            the model of the table e.g. models.Student
+        columns : dict
+            column name -> label it is exported under
+        batch_size : int
+            rows fetched at a time
+
+        Yields
+        ------
+        list[Row]
+            a batch of rows with the labelled columns
+        """
+
+        primary_key = list(model.__table__.primary_key.columns)
+
+        statement = select(
+            *(getattr(model, name).label(label) for name, label in columns.items())
+        )
+
+        # the primary key is exported, under its label
+        yield from self.__stream(
+            statement,
+            primary_key,
+            [columns[column.name] for column in primary_key],
+            batch_size
+        )
+
+
+    def stream_roster(self, batch_size: int):
+        """
+        Yields every enrollment joined to its student, subject,
+        teacher and department, in the column layout of the roster CSV
+
+        The department columns are the subject's department
+
+        Parameters
+        ----------
+        batch_size : int
+            rows fetched at a time
+
+        Yields
+        ------
+        list[Row]
+            a batch of rows labelled like the roster CSV header
+        """
+
+        statement = (
+            select(
+                models.Department.id.label('dept_id'),
+                models.Department.dept_name,
+                models.Teacher.id.label('teacher_id'),
+                models.Teacher.teacher_name,
+                models.Teacher.email.label('teacher_email'),
+                models.Subject.id.label('subj_id'),
+                models.Subject.subj_name,
+                models.Subject.description,
+                models.Student.id.label('std_id'),
+                models.Student.std_name,
+                models.Student.email.label('std_email')
+            )
+            .select_from(models.Enrollment)
+            .join(models.Student, models.Enrollment.student_id == models.Student.id)
+            .join(models.Subject, models.Enrollment.subject_id == models.Subject.id)
+            .outerjoin(models.Teacher, models.Subject.teacher_id == models.Teacher.id)
+            .outerjoin(models.Department, models.Subject.dept_id == models.Department.id)
+        )
+
+        # std_id and subj_id are the enrollment's key, through the inner joins
+        yield from self.__stream(
+            statement,
+            [models.Enrollment.student_id, models.Enrollment.subject_id],
+            ['std_id', 'subj_id'],
+            batch_size
+        )
+
+
+    def __stream(self, statement, key_columns: list, key_labels: list, batch_size: int):
+        """
+        Runs the statement one page at a time in key order, seeking
+        past the last key of the previous page, and yields the pages
+
+        A server side cursor would hold one batch as well, but the
+        mysqlconnector dialect always buffers the whole result set,
+        so the pages are separate queries. Within the session's
+        transaction MySQL reads them all from one snapshot.
+
+        Parameters
+        ----------
+        statement : Select
+            the rows to stream, without an order
+        key_columns : list[Column]
+            a unique key to page on, with an index in this order
+        key_labels : list[str]
+            the labels the key columns are selected under
+        batch_size : int
+            rows per page
+        """
+
+        after = None
+
+        while True:
+            page = statement
+
+            if after is not None and len(key_columns) == 1:
+                page = page.where(key_columns[0] > after[0])
+            elif after is not None:
+                page = page.where(tuple_(*key_columns) > tuple_(*after))
+
+            with intentional_batch('export page'):
+                rows = self.db.execute(
+                    page
+                    .order_by(*key_columns)
+                    .limit(batch_size)
+                ).all()
+
+            if rows:
+                yield rows
+
+            if len(rows) < batch_size:
+                return
+
+            last = rows[-1]._mapping
+            after = tuple(last[label] for label in key_labels)
+
+
+    def get_ids_by_key(self, key_column, keys):
+        """
+        Resolves a set of natural keys to their ids, from the
+        natural key index where possible and in one query otherwise
+
+        Parameters
+        ----------
+        key_column : InstrumentedAttribute
+            the unique column to match on e.g. models.Department.dept_name
+        keys : Iterable
+            the natural keys to look up
+
+        Returns
+        -------
+        dict
+            natural key -> id, for the keys that exist in the db
+        """
+
+        model = key_column.class_
+        table = model.__tablename__
+
+        ids = {}
+        missing = []
+
+        if self.key_index.indexes(table):
+            for key in keys:
+                id = self.key_index.get(table, key)
+
+                if id is MISSING:
+                    missing.append(key)
+                else:
+                    ids[key] = id
+        else:
+            missing = list(keys)
+
+        if not missing:
+            return ids
+
+        rows = self.db.execute(
+            select(key_column, model.id)
+            .where(key_column.in_(missing))
+        )
+
+        for key, id in rows:
+            ids[key] = id
+
+            if self.key_index.indexes(table):
+                self.key_index.set(table, key, id)
+
+        return ids
+
+
+    def get_existing_enrollments(self, pairs):
+        """
+        Finds which of the given (student_id, subject_id) pairs
+        are already enrolled, in one query
+
+        Parameters
+        ----------
+        pairs : Iterable[tuple[int, int]]
+            the (student_id, subject_id) pairs to look up
+
+        Returns
+        -------
+        set[tuple[int, int]]
+            the pairs that exist in the db
+        """
+
+        pairs = list(pairs)
+
+        if not pairs:
+            return set()
+
+        rows = self.db.execute(
+            select(models.Enrollment.student_id, models.Enrollment.subject_id)
+            .where(
+                tuple_(
+                    models.Enrollment.student_id,
+                    models.Enrollment.subject_id
+                ).in_(pairs)
+            )
+        )
+
+        return {(student_id, subject_id) for student_id, subject_id in rows}
+
+
+    def bulk_create(self, batch: list, ignore_conflicts: bool = False):
+        """
+        Inserts the missing records of one chunk in a single transaction.
+
+        Existing natural keys are resolved with one query per table,
+        then the missing records are inserted with one multi-row insert
+        per table, in the order given. The ids of new departments,
+        teachers and subjects go into the natural key index once
+        committed, so the next chunk or upload finds them there.
+
+        Parameters
+        ----------
+        batch : list[tuple]
+            (model, key_column, records) in dependency order, where
+            records maps each natural key to its schemas.*Create.
+            key_column is None for models.Enrollment, whose records
+            are keyed by (student_id, subject_id)
+        ignore_conflicts : bool
+            skip the rows whose primary key another process inserted
+            since the lookup, instead of failing the chunk, and count
+            only the rows inserted; used by the parallel ingest
+            workers, which insert side by side. A row conflicting on
+            another unique key still fails the chunk.
+            The enrollment summary is then left to `rebuild_summary`
+
+        Returns
+        -------
+        success/failure, inserted/message : tuple
+            inserted maps each table name to the number of new rows
+        """
+
+        inserted = {}
+        enrolled = []
+        deltas = Counter()
+        # table -> natural key -> id of the new rows of indexed tables
+        new_ids = {}
+
+        # called once per chunk of an upload
+        with intentional_batch('bulk_create'):
+            try:
+                for model, key_column, records in batch:
+                    if key_column is None:
+                        existing = self.get_existing_enrollments(records)
+                    else:
+                        existing = self.get_ids_by_key(key_column, records)
+
+                    new_records = [
+                        record.dict()
+                        for key, record in records.items()
+                        if key not in existing
+                    ]
+
+                    if new_records and ignore_conflicts:
+                        inserted[model.__tablename__] = self.__insert_ignoring_conflicts(model, new_records)
+                    else:
+                        if new_records and self.key_index.indexes(model.__tablename__):
+                            new_ids[model.__tablename__] = self.__insert_returning_ids(model, key_column, new_records)
+                        elif new_records:
+                            self.db.execute(insert(model), new_records)
+                        inserted[model.__tablename__] = len(new_records)
+
+                    if model is models.Enrollment:
+                        enrolled = [record["student_id"] for record in new_records]
+
+                    # the racing inserts ignore_conflicts skips are not known
+                    # here, so its callers rebuild the summary afterwards
+                    if ignore_conflicts:
+                        continue
+
+                    if model is models.Enrollment:
+                        deltas.update(self.__enrollment_deltas(
+                            [(record["student_id"], record["subject_id"]) for record in new_records], 1
+                        ))
+                    elif model is models.Student:
+                        deltas.update(self.__student_deltas(
+                            [record["dept_id"] for record in new_records], 1
+                        ))
+
+                self.__apply_summary(deltas)
+                self.db.commit()
+
+                for table, ids in new_ids.items():
+                    for key, id in ids.items():
+                        self.key_index.set(table, key, id)
+
+                SUBJECTS_CACHE.invalidate(enrolled)
+                return True, inserted
+
+            except Exception as e:
+                self.db.rollback()
+                return False, str(e)
+
+
+    def __insert_returning_ids(self, model, key_column, records: list):
+        """
+        Inserts the records of the model and returns natural key -> id
+        of the new rows, with RETURNING where the dialect has it for
+        a multi-row insert and with one more query otherwise
+        """
+
+        table = model.__table__
+        key = table.c[key_column.key]
+        connection = self.db.connection()
+
+        if connection.dialect.insert_executemany_returning:
+            rows = connection.execute(insert(table).returning(key, table.c.id), records)
+        else:
+            connection.execute(insert(table), records)
+            rows = connection.execute(
+                select(key, table.c.id)
+                .where(key.in_([record[key_column.key] for record in records]))
+            )
+
+        return dict(rows.all())
+
+
+    def __insert_ignoring_conflicts(self, model, records: list):
+        """
+        Inserts the records of the model, skipping those whose primary
+        key exists, and returns the number inserted
+
+        Raises
+        ------
+        ValueError
+            If a record conflicts on another unique key, e.g. an email
+        """
+
+        key = list(model.__table__.primary_key.columns)
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect == 'sqlite':
+            statement = sqlite_insert(model).on_conflict_do_nothing(index_elements=key)
+        elif dialect == 'mysql':
+            # MySQL can not target the conflict: ON DUPLICATE KEY UPDATE
+            # fires on any unique key and, with the FOUND_ROWS flag
+            # SQLAlchemy sets, counts a skipped row as inserted, so the
+            # rows INSERT IGNORE skips are checked to exist below
+            statement = mysql_insert(model).prefix_with('IGNORE')
+        else:
+            statement = insert(model)
+
+        # the connection, as the ORM bulk insert of a session reports no rowcount
+        inserted = self.db.connection().execute(statement, records).rowcount
+
+        if dialect == 'mysql' and inserted < len(records):
+            ids = [tuple(record[column.name] for column in key) for record in records]
+            existing = self.db.scalar(
+                select(func.count())
+                .select_from(model)
+                .where(tuple_(*key).in_(ids))
+            )
+
+            if existing < len(records):
+                raise ValueError(
+                    f"{len(records) - existing} {model.__tablename__} rows conflict "
+                    f"with existing rows on a key other than the primary key"
+                )
+
+        return inserted
+
+
+    def __enrollment_deltas(self, pairs, sign: int):
+        """
+        What adding (sign 1) or removing (sign -1) the enrollments
+        changes in the summary of their subjects, teachers and departments
+
+        Parameters
+        ----------
+        pairs : Iterable[tuple[int, int]]
+            the (student_id, subject_id) pairs
+
+        Returns
+        -------
+        Counter
+            (scope, scope_id, column) -> change
+        """
+
+        deltas = Counter()
+        pairs = list(pairs)
+
+        if not pairs:
+            return deltas
+
+        owners = {
+            id: (teacher_id, dept_id)
+            for id, teacher_id, dept_id in self.db.execute(
+                select(models.Subject.id, models.Subject.teacher_id, models.Subject.dept_id)
+                .where(models.Subject.id.in_({subject_id for _, subject_id in pairs}))
+            )
+        }
+
+        # an enrollment of a missing subject is not counted anywhere
+        for _, subject_id in pairs:
+            if subject_id in owners:
+                add_enrollments(deltas, subject_id, *owners[subject_id], sign)
+
+        return deltas
+
+
+    def __student_deltas(self, dept_ids: list, sign: int):
+        """
+        What adding (sign 1) or removing (sign -1) students of
+        the departments changes in the summary
+
+        Returns
+        -------
+        Counter
+            (scope, scope_id, column) -> change
+        """
+
+        deltas = Counter()
+
+        for dept_id in dept_ids:
+            if dept_id is not None:
+                deltas[('departments', int(dept_id), 'students')] += sign
+
+        return deltas
+
+
+    def __summary_keys(self, updates: list):
+        """
+        The subjects and students whose summary counts an update
+        request may move, by changing which teacher or department
+        they count towards or which subject an enrollment is in
+
+        Returns
+        -------
+        subject_ids, student_ids : tuple[set, set]
+        """
+
+        subject_ids, student_ids = set(), set()
+
+        for item in updates:
+            fields = item.updated_fields
+            record_id = item.record_id if isinstance(item.record_id, list) else [item.record_id]
+
+            if item.table_name == 'subjects' and {'id', 'teacher_id', 'dept_id'} & set(fields):
+                subject_ids.add(record_id[0])
+                subject_ids.add(fields.get('id', record_id[0]))
+            elif item.table_name == 'students' and {'id', 'dept_id'} & set(fields):
+                student_ids.add(record_id[0])
+                student_ids.add(fields.get('id', record_id[0]))
+            elif item.table_name == 'enrollments' and 'subject_id' in fields and len(record_id) == 2:
+                subject_ids.add(record_id[1])
+                subject_ids.add(fields['subject_id'])
+
+        return subject_ids, student_ids
+
+
+    def __summary_contributions(self, subject_ids: set, student_ids: set):
+        """
+        What the subjects and students add to the summary right now,
+        from their live enrollments; the difference between two calls
+        around a write is that write's change to the summary
+
+        Returns
+        -------
+        Counter
+            (scope, scope_id, column) -> count
+        """
+
+        counts = Counter()
+
+        if subject_ids:
+            rows = self.db.execute(
+                select(
+                    models.Subject.id,
+                    models.Subject.teacher_id,
+                    models.Subject.dept_id,
+                    func.count(models.Enrollment.student_id)
+                )
+                .outerjoin(models.Enrollment, models.Enrollment.subject_id == models.Subject.id)
+                .where(models.Subject.id.in_(subject_ids))
+                .group_by(models.Subject.id, models.Subject.teacher_id, models.Subject.dept_id)
+            )
+
+            for subject_id, teacher_id, dept_id, enrollments in rows:
+                add_enrollments(counts, subject_id, teacher_id, dept_id, enrollments)
+
+        if student_ids:
+            counts.update(self.__student_deltas(
+                self.db.scalars(
+                    select(models.Student.dept_id)
+                    .where(models.Student.id.in_(student_ids))
+                ).all(),
+                1
+            ))
+
+        return counts
+
+
+    def __apply_summary(self, deltas: Counter):
+        """
+        Adds the changes to the summary rows within the current
+        transaction, creating the rows not counted yet
+
+        Rows are touched in key order, so concurrent writers lock them
+        in the same order instead of deadlocking.
+        """
+
+        rows = {}
+
+        for (scope, scope_id, column), delta in deltas.items():
+            if delta:
+                row = rows.setdefault((scope, scope_id), {"enrollments": 0, "students": 0})
+                row[column] += delta
+
+        if not rows:
+            return
+
+        keys = sorted(rows)
+        table = models.EnrollmentSummary.__table__
+
+        self.__insert_ignoring_conflicts(models.EnrollmentSummary, [
+            {"scope": scope, "scope_id": scope_id, "enrollments": 0, "students": 0}
+            for scope, scope_id in keys
+        ])
+
+        self.db.execute(
+            update(table)
+            .where(and_(
+                table.c.scope == bindparam("pk_scope"),
+                table.c.scope_id == bindparam("pk_scope_id")
+            ))
+            .values(
+                enrollments=table.c.enrollments + bindparam("add_enrollments"),
+                students=table.c.students + bindparam("add_students")
+            ),
+            [
+                {
+                    "pk_scope": scope,
+                    "pk_scope_id": scope_id,
+                    "add_enrollments": rows[scope, scope_id]["enrollments"],
+                    "add_students": rows[scope, scope_id]["students"]
+                }
+                for scope, scope_id in keys
+            ]
+        )
+
+
+    def __live_summary(self):
+        """
+        The summary counted from the enrollments and students
+        with GROUP BY, what the summary table should hold
+
+        Returns
+        -------
+        Counter
+            (scope, scope_id, column) -> count
+        """
+
+        counts = Counter()
+
+        for scope, column in (
+            ('subjects', models.Enrollment.subject_id),
+            ('teachers', models.Subject.teacher_id),
+            ('departments', models.Subject.dept_id),
+        ):
+            rows = self.db.execute(
+                select(column, func.count())
+                .select_from(models.Enrollment)
+                .join(models.Subject, models.Subject.id == models.Enrollment.subject_id)
+                .where(column.is_not(None))
+                .group_by(column)
+            )
+
+            for scope_id, count in rows:
+                counts[(scope, scope_id, 'enrollments')] = count
+
+        rows = self.db.execute(
+            select(models.Student.dept_id, func.count())
+            .where(models.Student.dept_id.is_not(None))
+            .group_by(models.Student.dept_id)
+        )
+
+        for dept_id, count in rows:
+            counts[('departments', dept_id, 'students')] = count
+
+        return counts
+
+
+    def rebuild_summary(self):
+        """
+        Recounts the whole enrollment summary from the enrollments
+        and students in one transaction
+
+        Returns
+        -------
+        success/failure, rows/message : tuple
+            rows is the number of summary rows written
+        """
+
+        try:
+            rows = {}
+
+            for (scope, scope_id, column), count in self.__live_summary().items():
+                row = rows.setdefault(
+                    (scope, scope_id),
+                    {"scope": scope, "scope_id": scope_id, "enrollments": 0, "students": 0}
+                )
+                row[column] = count
+
+            self.db.execute(delete(models.EnrollmentSummary))
+
+            if rows:
+                self.db.execute(insert(models.EnrollmentSummary), list(rows.values()))
+
+            self.db.commit()
+            return True, len(rows)
+
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def get_summary_drift(self):
+        """
+        Compares the enrollment summary with a live GROUP BY
+
+        Returns
+        -------
+        list[dict]
+            scope, scope_id, column, stored and actual of every
+            count that differs, empty if the summary is consistent
+        """
+
+        stored = Counter()
+
+        for row in self.db.scalars(select(models.EnrollmentSummary)):
+            stored[(row.scope, row.scope_id, 'enrollments')] = row.enrollments
+            stored[(row.scope, row.scope_id, 'students')] = row.students
+
+        actual = self.__live_summary()
+
+        drift = []
+
+        for scope, scope_id, column in sorted(set(stored) | set(actual)):
+            key = (scope, scope_id, column)
+
+            if stored[key] != actual[key]:
+                drift.append({
+                    "scope": scope,
+                    "scope_id": scope_id,
+                    "column": column,
+                    "stored": stored[key],
+                    "actual": actual[key]
+                })
+
+        return drift
+
+
+    def list_summary(self, scope: str, after: int = None, limit: int = 100):
+        """
+        Fetches one page of the enrollment summary of a scope in id
+        order, with the name of each subject, teacher or department
+
+        Every record of the scope is listed, those without a
+        summary row with zero counts
+
+        Parameters
+        ----------
+        scope : str
+            'subjects', 'teachers' or 'departments'
+        after : Optional[int]
+            the id of the last record of the previous page
+        limit : int
+            the page size
+
+        Returns
+        -------
+        rows, has_more : tuple
+            id, name, enrollments and students of each record, and
+            whether another page follows
+        """
+
+        model, name = {
+            'subjects': (models.Subject, models.Subject.subj_name),
+            'teachers': (models.Teacher, models.Teacher.teacher_name),
+            'departments': (models.Department, models.Department.dept_name),
+        }[scope]
+        summary = models.EnrollmentSummary
+
+        statement = (
+            select(
+                model.id,
+                name,
+                func.coalesce(summary.enrollments, 0),
+                func.coalesce(summary.students, 0)
+            )
+            .outerjoin(summary, and_(summary.scope == scope, summary.scope_id == model.id))
+        )
+
+        if after is not None:
+            statement = statement.where(model.id > after)
+
+        rows = self.db.execute(statement.order_by(model.id).limit(limit + 1)).all()
+
+        return [
+            {
+                "id": id,
+                "name": record_name,
+                "enrollments": enrollments,
+                "students": students if scope == 'departments' else None
+            }
+            for id, record_name, enrollments, students in rows[:limit]
+        ], len(rows) > limit
+
+
+    def create_job(self, job_id: str, format: str, path: str):
+        """
+        Records a queued ingest job for a spooled upload
+
+        Parameters
+        ----------
+        job_id : str
+            the id handed back to the client
+        format : str
+            'csv' or 'json'
+        path : str
+            where the upload is spooled
+
+        Returns
+        -------
+        success/failure, job/message : tuple
+        """
+
+        try:
+            job = models.IngestJob(
+                id=job_id,
+                format=format,
+                status='queued',
+                path=path,
+                rows_parsed=0,
+                rows_failed=0,
+                counts={},
+                errors=[],
+                error_count=0
+            )
+            self.db.add(job)
+
+            self.db.commit()
+            self.db.refresh(job)
+
+            return True, job
+
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def get_job(self, job_id: str):
+        """
+        Fetches the ingest job with the given id, as it is in the db now
+
+        Returns
+        -------
+        models.IngestJob or None
+        """
+
+        return self.db.scalars(
+            select(models.IngestJob)
+            .where(models.IngestJob.id == job_id)
+            .execution_options(populate_existing=True)
+        ).first()
+
+
+    def get_job_ids(self, statuses: list):
+        """
+        Fetches the ids of the jobs in any of the statuses, oldest first
+
+        Returns
+        -------
+        list[str]
+        """
+
+        return self.db.scalars(
+            select(models.IngestJob.id)
+            .where(models.IngestJob.status.in_(statuses))
+            .order_by(models.IngestJob.created_at)
+        ).all()
+
+
+    def update_job(self, job_id: str, expected_status: list = None, expected_owner: str = None, **values):
+        """
+        Sets fields of an ingest job and commits
+
+        Parameters
+        ----------
+        job_id : str
+            the id of the job
+        expected_status : Optional[list[str]]
+            only update the job while it is in one of these statuses,
+            so two workers can not both claim it
+        expected_owner : Optional[str]
+            only update the job while this JobManager owns it,
+            so a worker whose job was taken over stops writing to it
+        **values
+            the columns to set
+
+        Returns
+        -------
+        bool
+            whether the job was updated
+        """
+
+        statement = (
+            update(models.IngestJob)
+            .where(models.IngestJob.id == job_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+        if expected_status is not None:
+            statement = statement.where(models.IngestJob.status.in_(expected_status))
+
+        if expected_owner is not None:
+            statement = statement.where(models.IngestJob.owner == expected_owner)
+
+        updated = self.db.execute(statement).rowcount
+        self.db.commit()
+
+        return updated == 1
+
+
+    def heartbeat_jobs(self, owner: str):
+        """
+        Records that the JobManager is alive on the jobs it runs
+
+        Returns
+        -------
+        int
+            the number of jobs it runs
+        """
+
+        updated = self.db.execute(
+            update(models.IngestJob)
+            .where(models.IngestJob.owner == owner)
+            .where(models.IngestJob.status.in_(['running', 'cancelling']))
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+
+        return updated
+
+
+    def requeue_stale_jobs(self, stale_before: datetime):
+        """
+        Takes the jobs back from owners that stopped sending heartbeats
+        before `stale_before`: a running job is queued again to resume
+        from its last recorded chunk, a cancelling one is cancelled
+
+        Returns
+        -------
+        int
+            the number of jobs taken back
+        """
+
+        stale = lease_expired(models.IngestJob.heartbeat_at, stale_before)
+        taken = 0
+
+        for status, new_status in (('running', 'queued'), ('cancelling', 'cancelled')):
+            taken += self.db.execute(
+                update(models.IngestJob)
+                .where(models.IngestJob.status == status)
+                .where(stale)
+                .values(status=new_status, owner=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+        self.db.commit()
+
+        return taken
+
+
+    def claim_upload(self, key: str, format: str, digest: str = None, owner: str = None):
+        """
+        Records an upload as running under its key, unless the
+        key is already recorded; the primary key makes the claim
+        atomic, so of two identical uploads only one runs. A running
+        claim whose owner stopped renewing it is taken over
+
+        Parameters
+        ----------
+        key : str
+            see models.UploadRecord.key
+        format : str
+            'csv' or 'json'
+        digest : Optional[str]
+            the SHA-256 of the upload, if it was hashed
+        owner : Optional[str]
+            the process running the upload, which renews the
+            claim with `renew_upload_claims`
+
+        Returns
+        -------
+        claimed, record : tuple
+            True and None once claimed, or False and the existing
+            models.UploadRecord, None if it was released meanwhile
+        """
+
+        claim = dict(format=format, digest=digest, status='running', owner=owner, heartbeat_at=datetime.utcnow())
+
+        try:
+            self.db.add(models.UploadRecord(key=key, **claim))
+            self.db.commit()
+            return True, None
+
+        except exc.IntegrityError:
+            self.db.rollback()
+
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.job_lease_seconds)
+        taken = self.db.execute(
+            update(models.UploadRecord)
+            .where(models.UploadRecord.key == key)
+            .where(models.UploadRecord.status == 'running')
+            .where(lease_expired(models.UploadRecord.heartbeat_at, stale_before))
+            .values(**claim)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+
+        if taken:
+            return True, None
+
+        return False, self.db.scalars(
+            select(models.UploadRecord)
+            .where(models.UploadRecord.key == key)
+            .execution_options(populate_existing=True)
+        ).first()
+
+
+    def finish_upload(self, key: str, result: dict):
+        """
+        Stores the result of a claimed upload and marks it done
+
+        Returns
+        -------
+        success/failure, message : tuple
+        """
+
+        try:
+            self.db.execute(
+                update(models.UploadRecord)
+                .where(models.UploadRecord.key == key)
+                .values(status='done', result=result)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+
+            return True, "Upload recorded."
+
+        except Exception as e:
+            self.db.rollback()
+            return False, str(e)
+
+
+    def release_upload(self, key: str, owner: str = None):
+        """
+        Drops the claim of an upload that failed, so it can be
+        retried, unless another process took the claim over
+        """
+
+        statement = (
+            delete(models.UploadRecord)
+            .where(models.UploadRecord.key == key)
+            .where(models.UploadRecord.status == 'running')
+        )
+
+        if owner is not None:
+            statement = statement.where(models.UploadRecord.owner == owner)
+
+        self.db.rollback()
+        self.db.execute(statement)
+        self.db.commit()
+
+
+    def renew_upload_claims(self, owner: str):
+        """
+        Records that the process is alive on the uploads it runs
+
+        Returns
+        -------
+        int
+            the number of claims renewed
+        """
+
+        renewed = self.db.execute(
+            update(models.UploadRecord)
+            .where(models.UploadRecord.owner == owner)
+            .where(models.UploadRecord.status == 'running')
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+
+        return renewed
+
+
+def release_upload_claims():
+    """
+    Drops the claims of the uploads whose process stopped renewing
+    them, e.g. one killed mid-upload, which would otherwise block
+    their retries; the claims of live processes stay
+    """
+
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.job_lease_seconds)
+
+    with engine.begin() as conn:
+        conn.execute(
+            delete(models.UploadRecord)
+            .where(models.UploadRecord.status == 'running')
+            .where(lease_expired(models.UploadRecord.heartbeat_at, stale_before))
+        )
+
+
+def lease_expired(heartbeat_at, stale_before: datetime):
+    """
+    Whether the heartbeat column of a job or upload claim is older
+    than `stale_before`, or was never set
+    """
+
+    return or_(heartbeat_at.is_(None), heartbeat_at < stale_before)
+
+
+def add_enrollments(counts: Counter, subject_id: int, teacher_id: int, dept_id: int, n: int):
+    """
+    Adds n enrollments of a subject to the summary counts of the
+    subject, its teacher and its department
+    """
+
+    for scope, scope_id in (('subjects', subject_id), ('teachers', teacher_id), ('departments', dept_id)):
+        if scope_id is not None:
+            counts[(scope, scope_id, 'enrollments')] += n
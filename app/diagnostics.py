@@ -0,0 +1,315 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+import logging
+import time
+import sys
+import re
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+
+logger = logging.getLogger("diagnostics")
+
+# a parenthesised list of bound parameters in any paramstyle, e.g. (?, ?)
+PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+
+# a run of parameter lists, e.g. the rows of a VALUES or of a tuple IN
+PARAMETER_LISTS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+
+# statements the db can EXPLAIN
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+class NPlusOneError(Exception):
+    """
+    Raised by a strict `diagnose` block that repeated a statement shape
+    """
+
+
+class QueryLog:
+    """
+    The statements run inside one `diagnose` block, e.g. one request
+    """
+
+    def __init__(self, n_plus_one_threshold: int, slow_query_ms: float):
+        """
+        Parameters
+        ----------
+        n_plus_one_threshold : int
+            most runs of one statement shape before it is flagged
+        slow_query_ms : float
+            statements slower than this are logged
+        """
+
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_query_ms = slow_query_ms
+
+        # statement shape -> times run
+        self.shapes = Counter()
+        self.slow = []
+
+        # label -> runs of the `intentional_batch` blocks, and statement
+        # shape -> most times it ran inside a single one of them
+        self.batches = Counter()
+        self.batch_shapes = Counter()
+
+
+    @property
+    def repeated(self) -> dict:
+        """the shapes run more than the threshold, with their counts"""
+
+        return {
+            shape: count
+            for shapes in (self.shapes, self.batch_shapes)
+            for shape, count in shapes.items()
+            if count > self.n_plus_one_threshold
+        }
+
+
+# the QueryLog of the current `diagnose` block
+CURRENT_LOG = ContextVar("current_query_log", default=None)
+
+# the shapes of the current `intentional_batch` block
+CURRENT_BATCH = ContextVar("current_batch_shapes", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The statement with its parameter lists collapsed, so lookups
+    that differ only in how many values they bind compare equal
+    """
+
+    shape = PARAMETER_LIST.sub("(?...)", statement)
+    shape = PARAMETER_LISTS.sub("(?...)", shape)
+
+    return " ".join(shape.split())
+
+
+def explain(conn, statement: str, parameters) -> str:
+    """
+    The db's plan for the statement, or why there is none
+
+    Runs on the raw DBAPI cursor of the same connection, so
+    it is not itself timed, counted or explained
+    """
+
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return "(not explainable)"
+
+    if conn.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+
+    # an executemany is explained with its first parameter set
+    if isinstance(parameters, list):
+        parameters = parameters[0] if parameters else ()
+
+    try:
+        cursor = conn.connection.cursor()
+
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return "\n".join(" | ".join(str(value) for value in row) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+
+
+def instrument_engine(engine):
+    """
+    Times every statement the engine sends, logging the slow ones
+    with their parameters and plan and counting each statement shape
+    in the QueryLog of the current `diagnose` block
+
+    Safe to call more than once per engine
+
+    Parameters
+    ----------
+    engine : Engine
+        a sync engine, or the `sync_engine` of an async one
+    """
+
+    if event.contains(engine, "after_cursor_execute", after_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("diagnostics_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["diagnostics_start"].pop()) * 1000
+
+    log = CURRENT_LOG.get()
+
+    if log is not None:
+        # one executemany already carries all the rows of its batch
+        if not executemany:
+            shapes = CURRENT_BATCH.get()
+            (log.shapes if shapes is None else shapes)[statement_shape(statement)] += 1
+
+        slow_query_ms = log.slow_query_ms
+    else:
+        slow_query_ms = settings.slow_query_ms
+
+    if elapsed_ms >= slow_query_ms:
+        params = repr(parameters)
+        if len(params) > 500:
+            params = params[:500] + "..."
+
+        plan = explain(conn, statement, parameters)
+
+        logger.warning(
+            "slow query, %.1f ms\n%s\nparameters: %s\nplan:\n%s",
+            elapsed_ms, statement, params, plan
+        )
+
+        if log is not None:
+            log.slow.append((statement, elapsed_ms))
+
+
+def handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("diagnostics_start")
+
+        if starts:
+            starts.pop()
+
+
+@contextmanager
+def diagnose(
+        engine,
+        n_plus_one_threshold: int = None,
+        slow_query_ms: float = None,
+        strict: bool = False,
+        label: str = None
+    ):
+    """
+    Watches the statements run inside the block for N+1 patterns
+
+    Every statement shape run more than `n_plus_one_threshold` times
+    is logged when the block exits, and raises NPlusOneError in
+    strict mode. Turn strict mode on in tests so a hot path that
+    starts issuing a query per item fails:
+
+        with repo.diagnose(strict=True, n_plus_one_threshold=3):
+            Getter(repo).get_subjects_by_student(1)
+
+    Parameters
+    ----------
+    engine : Engine
+        the engine to watch, instrumented if it is not yet
+    n_plus_one_threshold : Optional[int]
+        defaults to `settings.n_plus_one_threshold`
+    slow_query_ms : Optional[float]
+        defaults to `settings.slow_query_ms`
+    strict : bool
+        raise NPlusOneError instead of only logging
+    label : Optional[str]
+        names the block in the log, e.g. the request's route
+
+    Yields
+    ------
+    QueryLog
+        the shapes counted and the slow statements seen
+
+    Raises
+    ------
+    NPlusOneError
+        in strict mode, if a statement shape repeated too often
+    """
+
+    instrument_engine(engine)
+
+    log = QueryLog(
+        n_plus_one_threshold=(
+            settings.n_plus_one_threshold if n_plus_one_threshold is None
+            else n_plus_one_threshold
+        ),
+        slow_query_ms=settings.slow_query_ms if slow_query_ms is None else slow_query_ms
+    )
+    token = CURRENT_LOG.set(log)
+
+    try:
+        yield log
+    finally:
+        CURRENT_LOG.reset(token)
+
+    repeated = log.repeated
+
+    if repeated:
+        report = "\n".join(f"{count} x {shape}" for shape, count in repeated.items())
+        message = (
+            f"{label or 'block'} ran {len(repeated)} statement shape(s) more than "
+            f"{log.n_plus_one_threshold} times:\n{report}"
+        )
+
+        if strict:
+            raise NPlusOneError(message)
+
+        logger.warning("possible N+1, %s", message)
+
+
+@contextmanager
+def intentional_batch(label: str):
+    """
+    Marks one run of a loop that repeats its statements on purpose,
+    e.g. the lookups and inserts of one chunk of a bulk upload
+
+    The statements inside are counted per run instead of across the
+    block, so the loop over the chunks is not reported as N+1, while
+    a statement per item within one chunk still is
+
+    Parameters
+    ----------
+    label : str
+        names the loop in the QueryLog, e.g. 'bulk_create'
+    """
+
+    log = CURRENT_LOG.get()
+
+    if log is None:
+        yield
+        return
+
+    shapes = Counter()
+    token = CURRENT_BATCH.set(shapes)
+
+    try:
+        yield
+    finally:
+        CURRENT_BATCH.reset(token)
+
+        log.batches[label] += 1
+        for shape, count in shapes.items():
+            log.batch_shapes[shape] = max(log.batch_shapes[shape], count)
+
+
+class DiagnosticsMiddleware:
+    """
+    ASGI middleware running each HTTP request inside `diagnose`,
+    so the requests with N+1 patterns are logged with their route
+    """
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with diagnose(self.engine, label=f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
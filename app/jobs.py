@@ -0,0 +1,358 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import BinaryIO
+import logging
+import shutil
+import socket
+import uuid
+import os
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from crud import SQLRepository
+from business import Uploader, add_counts
+from parsers import open_decompressed
+
+logger = logging.getLogger("jobs")
+
+
+class JobManager:
+    """
+    Runs uploads as background jobs: the payload is spooled to
+    disk, a job row tracks its progress, and a pool of worker
+    threads inserts it through Uploader one chunk at a time
+
+    Progress is saved after every chunk, so a job interrupted by a
+    restart resumes from the last chunk it recorded. A chunk that
+    was committed but not yet recorded is inserted again, and its
+    records are skipped as existing.
+
+    Every app process runs workers. A job is owned by the process
+    running it, which refreshes the job's heartbeat every
+    `settings.job_heartbeat_seconds`; a job whose heartbeat is older
+    than `settings.job_lease_seconds` is taken over by the first
+    process to notice, and its old owner stops at its next chunk.
+    The same heartbeat renews the upload claims the process holds,
+    see SQLRepository.claim_upload.
+    """
+
+    def __init__(self, session_factory, spool_dir: str = None, workers: int = None):
+        """
+        Parameters
+        ----------
+        session_factory : sessionmaker
+            opens the session of each job and of each status call
+        spool_dir : Optional[str]
+            where uploads wait, defaults to `settings.job_spool_dir`
+        workers : Optional[int]
+            jobs run at once, defaults to `settings.job_workers`
+        """
+
+        self.session_factory = session_factory
+        self.spool_dir = spool_dir or settings.job_spool_dir
+        self.workers = workers or settings.job_workers
+
+        # names this process in the jobs it runs, fits IngestJob.owner
+        self.owner = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.__executor = None
+        self.__monitor = None
+        self.__stopping = Event()
+        # the jobs in this process's pool, queued or running
+        self.__submitted = set()
+        self.__lock = Lock()
+
+
+    def start(self):
+        """
+        Starts the worker pool and the heartbeat, and resumes the
+        queued jobs and the ones whose owner stopped
+        """
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.__stopping.clear()
+        self.__executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="ingest"
+        )
+
+        self.__take_over()
+
+        self.__monitor = Thread(target=self.__watch, name="ingest-heartbeat", daemon=True)
+        self.__monitor.start()
+
+
+    def shutdown(self):
+        """
+        Stops the workers after their current chunk, leaving
+        their jobs queued to be resumed by any process
+        """
+
+        self.__stopping.set()
+
+        if self.__monitor is not None:
+            self.__monitor.join()
+            self.__monitor = None
+
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True, cancel_futures=True)
+            self.__executor = None
+
+
+    def submit(self, file: BinaryIO, format: str):
+        """
+        Spools the upload to disk and queues it
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file
+        format : str
+            'csv' or 'json'
+
+        Returns
+        -------
+        models.IngestJob
+            the queued job
+
+        Raises
+        ------
+        RuntimeError
+            If the job could not be recorded
+        """
+
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.spool_dir, f"{job_id}.{format}")
+
+        with open(path, 'wb') as spool:
+            shutil.copyfileobj(file, spool, settings.upload_read_size)
+
+        with self.session_factory() as db:
+            success, job = SQLRepository(db).create_job(job_id, format, path)
+
+        if not success:
+            os.remove(path)
+            raise RuntimeError(job)
+
+        self.__submit(job_id)
+        return job
+
+
+    def get(self, job_id: str):
+        """
+        Returns
+        -------
+        models.IngestJob or None
+        """
+
+        with self.session_factory() as db:
+            return SQLRepository(db).get_job(job_id)
+
+
+    def cancel(self, job_id: str):
+        """
+        Cancels a queued job at once and a running one after its
+        current chunk; the rows already committed stay
+
+        Returns
+        -------
+        models.IngestJob or None
+        """
+
+        with self.session_factory() as db:
+            repo = SQLRepository(db)
+
+            if repo.update_job(job_id, expected_status=['queued'], status='cancelled'):
+                self.__remove_spool(repo.get_job(job_id))
+            else:
+                repo.update_job(job_id, expected_status=['running'], status='cancelling')
+
+            return repo.get_job(job_id)
+
+
+    def __watch(self):
+        """
+        Refreshes the heartbeat of this process's jobs and upload
+        claims and takes over the stale jobs, until shutdown
+        """
+
+        while not self.__stopping.wait(settings.job_heartbeat_seconds):
+            try:
+                with self.session_factory() as db:
+                    repo = SQLRepository(db)
+                    repo.heartbeat_jobs(self.owner)
+                    repo.renew_upload_claims(self.owner)
+
+                self.__take_over()
+            except Exception:
+                # the next beat tries again, well within the lease
+                logger.exception("Job heartbeat failed")
+
+
+    def __take_over(self):
+        """
+        Queues the jobs whose owner's lease ran out and submits
+        the queued jobs not yet in this process's pool
+        """
+
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.job_lease_seconds)
+
+        with self.session_factory() as db:
+            repo = SQLRepository(db)
+            repo.requeue_stale_jobs(stale_before)
+            job_ids = repo.get_job_ids(['queued'])
+
+        for job_id in job_ids:
+            self.__submit(job_id)
+
+
+    def __submit(self, job_id: str):
+        with self.__lock:
+            if job_id in self.__submitted or self.__stopping.is_set():
+                return
+
+            self.__submitted.add(job_id)
+
+        self.__executor.submit(self.__run, job_id)
+
+
+    def __run(self, job_id: str):
+        """
+        Ingests one job in a worker thread
+        """
+
+        try:
+            self.__ingest(job_id)
+        finally:
+            with self.__lock:
+                self.__submitted.discard(job_id)
+
+
+    def __ingest(self, job_id: str):
+        """
+        Claims a queued job and ingests it, writing to the job row
+        only while this process still owns it
+        """
+
+        with self.session_factory() as db:
+            repo = SQLRepository(db)
+
+            # another worker took it, or it was cancelled while queued
+            if not repo.update_job(job_id, expected_status=['queued'], status='running',
+                                   owner=self.owner, heartbeat_at=datetime.utcnow()):
+                return
+
+            job = repo.get_job(job_id)
+            progress = {
+                "rows_parsed": job.rows_parsed,
+                "rows_failed": job.rows_failed,
+                "counts": dict(job.counts),
+                "errors": list(job.errors),
+                "error_count": job.error_count,
+            }
+
+            try:
+                with open(job.path, 'rb') as spool:
+                    # a compressed upload is spooled as it came
+                    file = open_decompressed(spool)
+
+                    if job.format == 'csv':
+                        chunks = self.__csv_chunks(Uploader(repo), file, progress)
+                    else:
+                        chunks = self.__json_chunks(Uploader(repo), file, progress)
+
+                    for _ in chunks:
+                        if self.__stopping.is_set():
+                            repo.update_job(job_id, expected_owner=self.owner,
+                                            status='queued', owner=None, **progress)
+                            return
+
+                        # the job row is re-read after each chunk to see a cancel
+                        if not repo.update_job(job_id, expected_status=['running'], expected_owner=self.owner,
+                                               heartbeat_at=datetime.utcnow(), **progress):
+                            # taken over after a missed heartbeat, the new owner resumes it
+                            if repo.update_job(job_id, expected_owner=self.owner,
+                                               status='cancelled', **progress):
+                                self.__remove_spool(job)
+                            return
+
+                if repo.update_job(job_id, expected_owner=self.owner, status='done', **progress):
+                    self.__remove_spool(job)
+
+            except Exception as e:
+                db.rollback()
+                record_error(progress, {"rows": None, "error": str(e)})
+                repo.update_job(job_id, expected_owner=self.owner, status='failed', **progress)
+
+
+    def __csv_chunks(self, uploader: Uploader, file: BinaryIO, progress: dict):
+        """
+        Ingests the CSV rows after `rows_parsed`, adding each
+        chunk to the progress before yielding
+        """
+
+        for rows, inserted, error in uploader.iter_csv(file, skip_rows=progress["rows_parsed"]):
+            first = progress["rows_parsed"] + 1
+            progress["rows_parsed"] += len(rows)
+
+            if error is None:
+                add_counts(progress["counts"], len(rows), inserted)
+            elif isinstance(error, list):
+                # the chunk had invalid rows and none of it was inserted
+                progress["rows_failed"] += len(rows)
+                for row_error in error:
+                    record_error(progress, {
+                        "rows": [row_error["row"]] * 2,
+                        "column": row_error["column"],
+                        "error": row_error["error"]
+                    })
+            else:
+                progress["rows_failed"] += len(rows)
+                record_error(progress, {"rows": [first, progress["rows_parsed"]], "error": error})
+
+            yield
+
+
+    def __json_chunks(self, uploader: Uploader, file: BinaryIO, progress: dict):
+        """
+        Ingests the JSON elements after `rows_parsed`, yielding
+        after every `settings.ingest_chunk_size` of them
+        """
+
+        items = uploader.iter_json(file, skip_items=progress["rows_parsed"])
+
+        for table, outcome, message in items:
+            progress["rows_parsed"] += 1
+
+            if outcome in ('inserted', 'skipped'):
+                table_counts = progress["counts"].setdefault(table, {"inserted": 0, "skipped": 0})
+                table_counts[outcome] += 1
+            else:
+                progress["rows_failed"] += 1
+                record_error(progress, {"rows": [progress["rows_parsed"]] * 2, "error": message})
+
+            if progress["rows_parsed"] % settings.ingest_chunk_size == 0:
+                yield
+
+        yield
+
+
+    def __remove_spool(self, job):
+        if job is not None and os.path.exists(job.path):
+            os.remove(job.path)
+
+
+def record_error(progress: dict, error: dict):
+    """
+    Counts an error, keeping the first `settings.job_max_errors`
+    for the job's error report
+    """
+
+    progress["error_count"] += 1
+
+    if len(progress["errors"]) < settings.job_max_errors:
+        progress["errors"].append(error)
@@ -1,134 +1,791 @@
-import uvicorn
-from fastapi import FastAPI, UploadFile, File
-from typing import Literal
-import sys
-
-# for relative imports
-sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
-
-from app import (
-    GETTER,
-    SETTER,
-    UPLOADER,
-    DELETER
-)
-
-# initializing app instance
-app = FastAPI()
-
-
-@app.post('/upload')
-async def upload_data(
-        format: Literal['csv', 'json'],
-        file: UploadFile = File(...)
-    ):
-    """
-    Endpoint to upload data and insert it into the database.
-
-    Parameters
-    ----------
-    file : UploadFile
-        the file to be uploaded
-
-    Returns
-    -------
-    message : dict
-        success : A success or failure boolean
-        message : Success or error message
-
-    Raises
-    ------
-    ValueError
-        if a third value for `format` query parameter is passed
-    """
-
-    # waiting for the uploading file
-    content = await file.read()
-
-    if format == 'csv':
-        message = UPLOADER.upload_csv(content)
-    elif format == 'json':
-        message = UPLOADER.upload_json(content)
-    else:
-        raise ValueError('Invalid Value for `format` parameter. Expected `csv` or `json`.')
-
-    return message
-
-
-@app.get('/students/{student_id}/subjects')
-def get_subjects_by_student(student_id: int):
-    """
-    Retrieve subjects enrolled by a specific student.
-
-    Parameters
-    ----------
-    student_id : int
-        the student's id in the db
-
-    subjects : list[models.Subject]
-    """
-
-    subjects = GETTER.get_subjects_by_student(student_id)
-
-    return subjects
-
-
-@app.put('/update')
-async def update_record(
-        file: UploadFile = File(...)
-    ):
-    """
-    Updates the given fields of the records.
-
-    Parameters
-    ----------
-    file : UploadFile
-        the JSON file to be uploaded
-
-    Returns
-    -------
-    message : dict
-        success : A success or failure boolean
-        message : Success or error message
-    """
-
-    content = await file.read()
-    message = SETTER.update_record(content)
-
-    return message   
-
-
-@app.delete('/delete')
-def delete_enrollment(student_id: int, subject_id: int):
-    """
-    Deletes the enrollment of a student
-
-    Parameters
-    ----------
-    student_id : int
-        the student's id in the db
-    subject_id : int
-        the subject's id in the db
-
-    Returns
-    -------
-    message : dict
-        success : A success or failure boolean
-        message : Success or error message
-    """
-
-    message = DELETER.delete_enrollment(
-        student_id=student_id, 
-        subject_id=subject_id
-    )
-
-    return message
-
-
-@app.get('/')
-def home_page():
-    return {"message": "This is HOME!"}
-
-
-if __name__ == '__main__':
+import uvicorn
+from fastapi import FastAPI, UploadFile, File, Depends, Query, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from sqlalchemy.orm import Session
+from typing import List, Literal, Optional, Union
+import inspect
+import sys
+
+# for relative imports
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from scripts import schemas
+from scripts import database
+from scripts.database import SessionLocal, get_db, get_async_db
+from app import (
+    SQLRepository,
+    AsyncSQLRepository,
+    Exporter,
+    JobManager,
+    ParallelUploader,
+    SUBJECTS_CACHE,
+    MetricsMiddleware,
+    DiagnosticsMiddleware,
+    instrument_engine,
+    render_metrics,
+    init_db,
+    release_upload_claims,
+    open_decompressed,
+    digest_stream,
+    DecompressionError
+)
+
+# uploads accepted as background jobs, run by a pool of worker threads
+jobs = JobManager(SessionLocal)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens the db when the server starts rather than when this
+    module is imported, so an import needs no db and each worker
+    process opens its own connections.
+
+    Checks the schema version and starts the ingest workers,
+    resuming the jobs a restart interrupted, and releases the
+    upload claims no live process renews; on shutdown, stops the
+    workers after their current chunk and closes the pool.
+    """
+
+    await run_in_threadpool(init_db)
+    await run_in_threadpool(release_upload_claims)
+    await run_in_threadpool(jobs.start)
+
+    yield
+
+    await run_in_threadpool(jobs.shutdown)
+    database.engine.dispose()
+
+    if settings.db_async:
+        await database.async_engine.dispose()
+
+
+# the JSON encoder of every endpoint that does not pick its own response
+if settings.orjson_responses:
+    import orjson  # noqa: F401, fails here rather than on the first response
+
+    default_response_class = ORJSONResponse
+else:
+    default_response_class = JSONResponse
+
+# initializing app instance
+app = FastAPI(lifespan=lifespan, default_response_class=default_response_class)
+
+@app.exception_handler(DecompressionError)
+async def decompression_error(request, error: DecompressionError):
+    """
+    A 400 for a compressed upload found corrupt or cut short while
+    it was parsed; like a parse error, the rows before it stay
+    """
+
+    return JSONResponse(status_code=400, content={"detail": str(error)})
+
+
+# per route latency and per request SQL statement counts
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(database.engine)
+
+    if settings.db_async:
+        instrument_engine(database.async_engine.sync_engine)
+
+# slow query log and N+1 detection per request
+if settings.db_diagnostics:
+    app.add_middleware(
+        DiagnosticsMiddleware,
+        engine=database.async_engine.sync_engine if settings.db_async else database.engine
+    )
+
+
+# the services behind the endpoints, on the sync or the async engine
+if settings.db_async:
+    from app import (
+        AsyncGetter as Getter,
+        AsyncSetter as Setter,
+        AsyncUploader as Uploader,
+        AsyncDeleter as Deleter
+    )
+
+    async def get_repo(db: AsyncSession = Depends(get_async_db)):
+        """
+        Provides an async SQL repository bound to the session of the current request
+        """
+
+        return AsyncSQLRepository(db)
+
+else:
+    from app import (
+        Getter,
+        Setter,
+        Uploader,
+        Deleter
+    )
+
+    def get_repo(db: Session = Depends(get_db)):
+        """
+        Provides a SQL repository bound to the session of the current request
+        """
+
+        return SQLRepository(db)
+
+
+async def run(method, *args, **kwargs):
+    """
+    Awaits a service method, running the sync ones
+    on the thread pool so they never block the event loop
+    """
+
+    if inspect.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+
+    return await run_in_threadpool(method, *args, **kwargs)
+
+
+def open_upload(file: UploadFile):
+    """
+    The uploaded file, decompressed as it is read when it is
+    gzip or zstd, see parsers.open_decompressed
+
+    Raises
+    ------
+    HTTPException
+        If the file's Content-Encoding is not supported
+    """
+
+    try:
+        return open_decompressed(file.file, file.headers.get('content-encoding'))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+
+@app.post('/upload')
+async def upload_data(
+        format: Literal['csv', 'json'],
+        response: Response,
+        file: UploadFile = File(...),
+        workers: Optional[int] = Query(None, ge=1, le=64),
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        repo = Depends(get_repo)
+    ):
+    """
+    Endpoint to upload data and insert it into the database.
+
+    The payload is parsed straight from the spooled upload
+    in fixed-size reads, so memory stays flat for large files.
+    A gzip or zstd file, by its Content-Encoding or its first bytes,
+    is decompressed as it is parsed; the parallel ingest spools the
+    decompressed CSV to disk, where it splits it into ranges.
+
+    A successful upload is recorded under the SHA-256 of its bytes,
+    or under its Idempotency-Key header when given, and a repeat of
+    it gets the recorded result back without being parsed, with an
+    `Idempotent-Replayed: true` header. A repeat that arrives while
+    the first is still running gets a 409.
+
+    Parameters
+    ----------
+    file : UploadFile
+        the file to be uploaded, optionally gzip or zstd compressed
+    workers : Optional[int]
+        processes parsing a CSV in parallel, defaults to
+        `settings.ingest_workers`; 1 ingests it in the request
+    idempotency_key : Optional[str]
+        names the upload instead of its digest, so a retry that
+        differs only in formatting is still recognised
+
+    Returns
+    -------
+    message : dict
+        success : A success or failure boolean
+        message : Success or error message
+
+    Raises
+    ------
+    ValueError
+        if a third value for `format` query parameter is passed
+    """
+
+    workers = workers or settings.ingest_workers
+    uploader = Uploader(repo)
+
+    if idempotency_key is not None:
+        key, digest = f"key:{idempotency_key}", None
+    elif settings.upload_dedup:
+        digest = await run_in_threadpool(digest_stream, file.file)
+        key = f"sha256:{format}:{digest}"
+    else:
+        key = None
+
+    stream = open_upload(file)
+
+    if key is not None:
+        # the job workers' heartbeat renews the claims of this process
+        result = await run(uploader.claim_upload, key, format, digest, jobs.owner)
+
+        if result is not None:
+            response.headers['Idempotent-Replayed'] = 'true'
+            return result
+
+    try:
+        if format == 'csv' and workers > 1:
+            message = await run_in_threadpool(ParallelUploader(workers=workers).upload_csv, stream)
+        elif format == 'csv':
+            message = await run(uploader.upload_csv, stream)
+        elif format == 'json':
+            message = await run(uploader.upload_json, stream)
+        else:
+            raise ValueError('Invalid Value for `format` parameter. Expected `csv` or `json`.')
+
+    except BaseException:
+        if key is not None:
+            await run(uploader.release_upload, key, jobs.owner)
+        raise
+
+    if key is not None:
+        await run(uploader.finish_upload, key, message)
+
+    return message
+
+
+@app.post('/jobs', status_code=202, response_model=schemas.IngestJob)
+async def create_job(
+        format: Literal['csv', 'json'],
+        file: UploadFile = File(...)
+    ):
+    """
+    Accepts an upload as a background job and returns at once.
+
+    The file is spooled to disk and inserted by a worker in
+    chunks, like `/upload`; poll `/jobs/{job_id}` for progress.
+
+    Parameters
+    ----------
+    format : str
+        `csv` or `json`, as for `/upload`
+    file : UploadFile
+        the file to be uploaded, optionally gzip or zstd
+        compressed, told apart by its first bytes
+
+    Returns
+    -------
+    job : schemas.IngestJob
+        the queued job
+    """
+
+    return await run_in_threadpool(jobs.submit, file.file, format)
+
+
+@app.get('/jobs/{job_id}', response_model=schemas.IngestJob)
+async def get_job(job_id: str):
+    """
+    Progress of an ingest job.
+
+    Returns
+    -------
+    job : schemas.IngestJob
+        status, rows parsed and failed, and the records
+        inserted and skipped per table
+
+    Raises
+    ------
+    HTTPException
+        If the job does not exist
+    """
+
+    job = await run_in_threadpool(jobs.get, job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+    return job
+
+
+@app.post('/jobs/{job_id}/cancel', response_model=schemas.IngestJob)
+async def cancel_job(job_id: str):
+    """
+    Cancels a queued job, or a running one after its current chunk.
+    The chunks already inserted are kept.
+
+    Returns
+    -------
+    job : schemas.IngestJob
+
+    Raises
+    ------
+    HTTPException
+        If the job does not exist
+    """
+
+    job = await run_in_threadpool(jobs.cancel, job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+    return job
+
+
+@app.get('/jobs/{job_id}/errors', response_model=schemas.IngestJobErrors)
+async def get_job_errors(job_id: str):
+    """
+    The error report of an ingest job: each failed chunk, or JSON
+    element, with its row numbers and why it failed.
+
+    Returns
+    -------
+    report : schemas.IngestJobErrors
+
+    Raises
+    ------
+    HTTPException
+        If the job does not exist
+    """
+
+    job = await run_in_threadpool(jobs.get, job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+    return job
+
+
+@app.get('/students/{student_id}/subjects', response_model=List[schemas.Subject])
+async def get_subjects_by_student(
+        student_id: int,
+        repo = Depends(get_repo)
+    ):
+    """
+    Retrieve subjects enrolled by a specific student.
+
+    Parameters
+    ----------
+    student_id : int
+        the student's id in the db
+
+    Returns
+    -------
+    subjects : list[schemas.Subject]
+    """
+
+    subjects = await run(Getter(repo).get_subjects_by_student, student_id)
+
+    return subjects
+
+
+# page size of the listing endpoints
+PAGE_LIMIT = Query(100, ge=1, le=1000)
+
+
+@app.get('/students', response_model=schemas.Page[schemas.Student])
+async def list_students(
+        dept_id: Optional[int] = None,
+        email: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the students in id order, one page at a time.
+
+    Parameters
+    ----------
+    dept_id, email : Optional
+        filters on the indexed columns
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Student]
+    """
+
+    return await run(
+        Getter(repo).list_records,
+        'students', {'dept_id': dept_id, 'email': email}, after, limit
+    )
+
+
+@app.get('/teachers', response_model=schemas.Page[schemas.Teacher])
+async def list_teachers(
+        dept_id: Optional[int] = None,
+        email: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the teachers in id order, one page at a time.
+
+    Parameters
+    ----------
+    dept_id, email : Optional
+        filters on the indexed columns
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Teacher]
+    """
+
+    return await run(
+        Getter(repo).list_records,
+        'teachers', {'dept_id': dept_id, 'email': email}, after, limit
+    )
+
+
+@app.get('/departments', response_model=schemas.Page[schemas.Department])
+async def list_departments(
+        dept_name: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the departments in id order, one page at a time.
+
+    Parameters
+    ----------
+    dept_name : Optional[str]
+        filter on the indexed column
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Department]
+    """
+
+    return await run(
+        Getter(repo).list_records,
+        'departments', {'dept_name': dept_name}, after, limit
+    )
+
+
+@app.get('/subjects', response_model=schemas.Page[schemas.Subject])
+async def list_subjects(
+        dept_id: Optional[int] = None,
+        teacher_id: Optional[int] = None,
+        subj_name: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the subjects in id order, one page at a time.
+
+    Parameters
+    ----------
+    dept_id, teacher_id, subj_name : Optional
+        filters on the indexed columns
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Subject]
+    """
+
+    return await run(
+        Getter(repo).list_records,
+        'subjects',
+        {'dept_id': dept_id, 'teacher_id': teacher_id, 'subj_name': subj_name},
+        after, limit
+    )
+
+
+@app.get(
+    '/subjects/{subject_id}/students',
+    response_model=Union[schemas.Page[schemas.Student], schemas.SubjectStudentCount]
+)
+async def list_students_by_subject(
+        subject_id: int,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        count_only: bool = False,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the students enrolled in a subject in id order,
+    one page at a time, or counts them.
+
+    Parameters
+    ----------
+    subject_id : int
+        the subject's id in the db
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+    count_only : bool
+        return only the number of students
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Student]
+    count : schemas.SubjectStudentCount
+        with `count_only`
+    """
+
+    return await run(
+        Getter(repo).list_students_by_subject,
+        subject_id, after, limit, count_only
+    )
+
+
+@app.get('/stats/{scope}', response_model=schemas.Page[schemas.EnrollmentSummary])
+async def list_summary(
+        scope: Literal['subjects', 'teachers', 'departments'],
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the enrollments of each subject, of each teacher's
+    subjects or of each department's subjects, and the students
+    of each department, in id order, one page at a time.
+
+    Served from the summary table the writes keep up to date,
+    see `python -m scripts.summary` to rebuild or check it.
+
+    Parameters
+    ----------
+    scope : str
+        `subjects`, `teachers` or `departments`
+    after : Optional[str]
+        the `next_cursor` of the previous page
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.EnrollmentSummary]
+    """
+
+    return await run(Getter(repo).list_summary, scope, after, limit)
+
+
+@app.get('/enrollments', response_model=schemas.Page[schemas.Enrollment])
+async def list_enrollments(
+        student_id: Optional[int] = None,
+        after: Optional[str] = None,
+        limit: int = PAGE_LIMIT,
+        repo = Depends(get_repo)
+    ):
+    """
+    Lists the enrollments in (student_id, subject_id) order,
+    one page at a time.
+
+    Parameters
+    ----------
+    student_id : Optional[int]
+        filter on the leading primary key column
+    after : Optional[str]
+        the `next_cursor` of the previous page, `student_id,subject_id`
+    limit : int
+        the page size, at most 1000
+
+    Returns
+    -------
+    page : schemas.Page[schemas.Enrollment]
+    """
+
+    return await run(
+        Getter(repo).list_records,
+        'enrollments', {'student_id': student_id}, after, limit
+    )
+
+
+@app.get('/export/{table_name}')
+async def export_table(
+        table_name: Literal['students', 'teachers', 'departments', 'subjects', 'enrollments', 'roster'],
+        format: Literal['csv', 'ndjson'] = 'csv',
+        compress: bool = False
+    ):
+    """
+    Streams a whole table, or the roster of every enrollment
+    with its student, subject, teacher and department.
+
+    The rows are read in keyset pages and sent batch by batch,
+    so memory stays flat and the first bytes go out at once.
+
+    Parameters
+    ----------
+    table_name : str
+        the table to export, or `roster`
+    format : str
+        `csv` in the layout `/upload?format=csv` reads, the
+        roster for `enrollments` as well, or `ndjson` in the
+        layout `/upload?format=json` reads
+    compress : bool
+        gzip the stream
+
+    Returns
+    -------
+    StreamingResponse
+        the export as an attachment
+    """
+
+    def stream():
+        # the response outlives the request's dependencies,
+        # so the stream holds its own session until it is done
+        db = SessionLocal()
+
+        try:
+            yield from Exporter(SQLRepository(db)).export(table_name, format, compress)
+        finally:
+            db.close()
+
+    filename = f"{table_name}.{format}"
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+
+    if compress:
+        filename += '.gz'
+        media_type = 'application/gzip'
+
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.put('/update')
+async def update_record(
+        file: UploadFile = File(...),
+        repo = Depends(get_repo)
+    ):
+    """
+    Updates the given fields of the records.
+
+    Parameters
+    ----------
+    file : UploadFile
+        the JSON file to be uploaded, optionally gzip or zstd
+        compressed as for `/upload`
+
+    Returns
+    -------
+    message : dict
+        success : A success or failure boolean
+        message : Success or error message
+    """
+
+    message = await run(Setter(repo).update_record, open_upload(file))
+
+    return message   
+
+
+@app.delete('/delete')
+async def delete_enrollment(
+        student_id: int,
+        subject_id: int,
+        repo = Depends(get_repo)
+    ):
+    """
+    Deletes the enrollment of a student
+
+    Parameters
+    ----------
+    student_id : int
+        the student's id in the db
+    subject_id : int
+        the subject's id in the db
+
+    Returns
+    -------
+    message : dict
+        success : A success or failure boolean
+        message : Success or error message
+    """
+
+    message = await run(
+        Deleter(repo).delete_enrollment,
+        student_id=student_id, 
+        subject_id=subject_id
+    )
+
+    return message
+
+
+@app.delete('/enrollments', response_model=schemas.EnrollmentDeleteResponse)
+async def delete_enrollments(
+        request: schemas.EnrollmentDeleteRequest,
+        repo = Depends(get_repo)
+    ):
+    """
+    Deletes many enrollments at once: a list of
+    (student_id, subject_id) pairs, or every enrollment
+    of one student or of one subject
+
+    Parameters
+    ----------
+    request : schemas.EnrollmentDeleteRequest
+        exactly one of enrollments, student_id or subject_id
+
+    Returns
+    -------
+    message : dict
+        success : A success or failure boolean
+        message : Success or error message
+        deleted : how many enrollments were removed
+        missing : the requested pairs that were not enrolled
+    """
+
+    message = await run(Deleter(repo).delete_enrollments, request)
+
+    return message
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics():
+    """
+    Request latency histograms per route and SQL statement
+    counts and times, in the Prometheus text format
+
+    Returns
+    -------
+    PlainTextResponse
+    """
+
+    return PlainTextResponse(
+        render_metrics(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get('/cache/stats')
+def cache_stats():
+    """
+    Counters of the in-process caches
+
+    Returns
+    -------
+    stats : dict
+        subjects : hits, misses, invalidations, evictions and size
+            of the student subjects cache
+        key_index : hits and misses of the natural key index
+            and the size of each table's index
+    """
+
+    return {
+        "subjects": SUBJECTS_CACHE.stats(),
+        "key_index": SQLRepository.key_index.stats()
+    }
+
+
+@app.get('/')
+def home_page():
+    return {"message": "This is HOME!"}
+
+
+if __name__ == '__main__':
     uvicorn.run(app, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,265 @@
+from contextvars import ContextVar
+from threading import Lock
+from sqlalchemy import event
+import time
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+# seconds, from a cached read up to a large upload
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# statements per request
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000)
+
+
+class Histogram:
+    """
+    Prometheus histogram with labels, rendered in the text format
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple):
+        """
+        Parameters
+        ----------
+        name : str
+            the metric name
+        help : str
+            the HELP line
+        labels : tuple[str]
+            the label names, given in the same order to `observe`
+        buckets : tuple[float]
+            the upper bounds, +Inf is added
+        """
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+
+        # label values -> [count per bucket..., +Inf count, sum]
+        self.__series = {}
+        self.__lock = Lock()
+
+
+    def observe(self, value: float, *label_values):
+        """records one value"""
+
+        with self.__lock:
+            series = self.__series.get(label_values)
+
+            if series is None:
+                series = self.__series[label_values] = [0] * (len(self.buckets) + 2)
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+
+            series[-2] += 1
+            series[-1] += value
+
+
+    def render(self) -> list:
+        """the lines of the metric, cumulative buckets then sum and count"""
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        with self.__lock:
+            series = {labels: list(values) for labels, values in self.__series.items()}
+
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(
+                f'{name}="{escape(value)}"'
+                for name, value in zip(self.labels, label_values)
+            )
+            prefix = labels + "," if labels else ""
+
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-2]}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+            lines.append(f"{self.name}_count{suffix} {values[-2]}")
+
+        return lines
+
+
+class Counter:
+    """
+    Prometheus counter without labels
+    """
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+        self.__lock = Lock()
+
+
+    def inc(self, amount: float = 1):
+        with self.__lock:
+            self.value += amount
+
+
+    def render(self) -> list:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}"
+        ]
+
+
+def escape(value) -> str:
+    """escapes a label value for the text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class QueryStats:
+    """
+    Statements run and seconds spent in the db by one request
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# the QueryStats of the request being served, the threadpool
+# and run_sync both carry it over from the request's context
+CURRENT_QUERIES = ContextVar("current_queries", default=None)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ("method", "route", "status"),
+    LATENCY_BUCKETS
+)
+
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements run while serving a request.",
+    ("method", "route"),
+    QUERY_BUCKETS
+)
+
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing SQL statements while serving a request.",
+    ("method", "route"),
+    LATENCY_BUCKETS
+)
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements run, in or out of a request.")
+
+DB_TIME = Counter("db_query_duration_seconds_total", "Time spent executing SQL statements.")
+
+
+def instrument_engine(engine):
+    """
+    Times every statement the engine sends, adding it to
+    the totals and to the QueryStats of the current request
+
+    Safe to call more than once per engine
+
+    Parameters
+    ----------
+    engine : Engine
+        a sync engine, or the `sync_engine` of an async one
+    """
+
+    if event.contains(engine, "after_cursor_execute", after_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_query(time.perf_counter() - conn.info["query_start"].pop())
+
+
+def handle_error(context):
+    # a failed statement still took its time and counts
+    starts = context.connection.info.get("query_start") if context.connection else None
+
+    if starts:
+        record_query(time.perf_counter() - starts.pop())
+
+
+def record_query(seconds: float):
+    """adds one statement to the totals and to the current request"""
+
+    DB_QUERIES.inc()
+    DB_TIME.inc(seconds)
+
+    stats = CURRENT_QUERIES.get()
+
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request per route, and
+    reporting its db statements in the X-DB-Query-Count and
+    X-DB-Time-Ms response headers
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = CURRENT_QUERIES.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-db-query-count", str(stats.count).encode()),
+                    (b"x-db-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+                ]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            CURRENT_QUERIES.reset(token)
+
+            # the route template, not the path, keeps the label set small
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            method = scope["method"]
+
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method, route, status)
+            REQUEST_QUERIES.observe(stats.count, method, route)
+            REQUEST_DB_TIME.observe(stats.seconds, method, route)
+
+
+def render_metrics() -> str:
+    """every metric in the Prometheus text format"""
+
+    lines = []
+
+    for metric in (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, DB_QUERIES, DB_TIME):
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,429 @@
+from fastapi import HTTPException
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO
+import multiprocessing
+import tempfile
+import shutil
+import csv
+import os
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from scripts import models, schemas
+from scripts.database import SessionLocal, engine
+from crud import SQLRepository
+from cache import SUBJECTS_CACHE
+from parsers import iter_lines
+from business import CSV_ENTITIES, batched
+from validation import BatchValidator, ErrorReport
+
+# the entities every student row refers to, inserted before the students
+DIMENSIONS = [entity for entity in CSV_ENTITIES if entity[1] is not models.Student]
+
+
+class ParallelUploader:
+    """
+    Ingests a roster CSV in a pool of processes
+
+    The file is split into byte ranges on line boundaries, and the
+    workers parse and validate the ranges side by side, in three passes:
+
+    1. every worker validates its range, see BatchValidator, and
+       collects its departments, teachers and subjects; unless a row
+       is invalid, this process inserts the new ones in one
+       transaction, in the order they first appear in the file
+    2. every worker inserts the students of its range
+    3. every worker inserts the enrollments of its range, once every
+       student they reference exists
+
+    Departments, teachers and subjects are matched on their natural
+    keys, and the new ones get their ids from the db, not from the
+    file; as with Uploader.upload_csv, the dept_id, teacher_id and
+    subj_id the rows reference are stored as they are. Students are
+    inserted with the std_id of the file as their id, as with
+    Uploader.upload_csv, so a student whose rows straddle two ranges
+    is inserted once.
+
+    Workers open their own connection and commit chunk by chunk. The
+    enrollment summary is rebuilt once the workers are done.
+
+    A range is validated on its own, so an id, natural key or row
+    repeated in two ranges is not reported; the repeated student or
+    enrollment is skipped on insert.
+
+    Quoted fields must not contain line breaks, which a range boundary
+    could fall inside; such files go through Uploader.upload_csv.
+    """
+
+    def __init__(self, session_factory=None, workers: int = None):
+        """
+        Parameters
+        ----------
+        session_factory : Optional[sessionmaker]
+            opens the session of the first pass, defaults to SessionLocal
+        workers : Optional[int]
+            processes in the pool, defaults to `settings.ingest_workers`
+        """
+
+        self.session_factory = session_factory or SessionLocal
+        self.workers = workers or settings.ingest_workers
+
+
+    def upload_csv(self, file: BinaryIO, chunk_size: int = None):
+        """
+        Spools the CSV payload to disk and ingests it in parallel
+
+        Parameters
+        ----------
+        file : BinaryIO
+            the uploaded file
+        chunk_size : Optional[int]
+            rows per transaction, defaults to `settings.ingest_chunk_size`
+
+        Returns
+        -------
+        success/failure, message, counts : dict
+            as returned by Uploader.upload_csv
+
+        Raises
+        ------
+        HTTPException
+            If a row is invalid, listing every invalid row, before
+            anything is inserted
+            OR If a range fails to insert; the chunks committed before
+            it stay
+        """
+
+        os.makedirs(settings.job_spool_dir, exist_ok=True)
+
+        spool = tempfile.NamedTemporaryFile(dir=settings.job_spool_dir, suffix='.csv', delete=False)
+
+        try:
+            with spool:
+                shutil.copyfileobj(file, spool, settings.upload_read_size)
+
+            return self.upload_path(spool.name, chunk_size)
+        finally:
+            os.remove(spool.name)
+
+
+    def upload_path(self, path: str, chunk_size: int = None):
+        """
+        Ingests a CSV file on disk in parallel, see `upload_csv`
+        """
+
+        chunk_size = chunk_size or settings.ingest_chunk_size
+        header, ranges = partition(path, self.workers * 2)
+
+        if not ranges:
+            return {"success": True, "message": "Data Inserted Successfully!", "counts": {}}
+
+        # spawned, as forking a process that runs threads can deadlock
+        pool = ProcessPoolExecutor(
+            max_workers=min(self.workers, len(ranges)),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        )
+
+        tables = []
+        if 'std_name' in header:
+            tables.append('students')
+        if 'subj_name' in header and 'std_name' in header:
+            tables.append('enrollments')
+
+        try:
+            with pool:
+                counts = self.__run(pool, path, header, ranges, tables, chunk_size)
+        finally:
+            # the workers' writes are not known to this process's cache,
+            # nor to the enrollment summary, see SQLRepository.bulk_create
+            SUBJECTS_CACHE.invalidate_all()
+
+            with self.session_factory() as db:
+                success, message = SQLRepository(db).rebuild_summary()
+
+        if not success:
+            raise HTTPException(status_code=500, detail=message)
+
+        return {
+            "success": True,
+            "message": "Data Inserted Successfully!",
+            "counts": counts
+        }
+
+
+    def __run(self, pool: ProcessPoolExecutor, path: str, header: list, ranges: list, tables: list, chunk_size: int):
+        """
+        Runs the three passes over the ranges
+
+        Returns
+        -------
+        dict
+            the inserted/skipped rows per table
+        """
+
+        scans = [
+            pool.submit(scan_dimensions, path, header, start, end, chunk_size)
+            for start, end in ranges
+        ]
+        counts = self.__insert_dimensions([scan.result() for scan in scans])
+
+        # every student is in before an enrollment refers to it
+        for table in tables:
+            results = [
+                pool.submit(ingest_range, path, header, start, end, table, chunk_size)
+                for start, end in ranges
+            ]
+
+            rows, inserted = 0, 0
+            for result in results:
+                range_rows, range_inserted, error = result.result()
+
+                if error is not None:
+                    raise HTTPException(status_code=400, detail=error)
+
+                rows += range_rows
+                inserted += range_inserted
+
+            counts[table] = {"inserted": inserted, "skipped": rows - inserted}
+
+        return counts
+
+
+    def __insert_dimensions(self, scans: list):
+        """
+        Inserts the departments, teachers and subjects the workers
+        found, each at its first appearance in the file
+
+        Returns
+        -------
+        dict
+            the inserted/skipped rows per table
+        """
+
+        rows = 0
+        merged = {column: {} for column, *_ in DIMENSIONS}
+        report = ErrorReport()
+
+        for found, range_rows, range_report in scans:
+            # the rows of a range are numbered from its start
+            report.extend(range_report, offset=rows)
+            rows += range_rows
+
+            for column, records in found.items():
+                for key, record in records.items():
+                    merged[column].setdefault(key, record)
+
+        if report.count:
+            raise HTTPException(
+                status_code=400,
+                detail=report.detail("Invalid rows, nothing was inserted.")
+            )
+
+        batch = [
+            (model, key_column, merged[column])
+            for column, model, key_column, get_key, build in DIMENSIONS
+            if merged[column]
+        ]
+
+        if not batch:
+            return {}
+
+        with self.session_factory() as db:
+            success, inserted = SQLRepository(db).bulk_create(batch=batch)
+
+        if not success:
+            raise HTTPException(status_code=400, detail=inserted)
+
+        return {
+            table: {"inserted": n_inserted, "skipped": rows - n_inserted}
+            for table, n_inserted in inserted.items()
+        }
+
+
+def partition(path: str, parts: int):
+    """
+    Splits a CSV file into byte ranges that start and end on line
+    boundaries, after the header
+
+    Returns
+    -------
+    header, ranges : tuple[list[str], list[tuple[int, int]]]
+        the column names, and the (start, end) offset of each
+        non-empty range
+    """
+
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as file:
+        header = next(csv.reader([file.readline().decode('utf-8')]), [])
+        bounds = [file.tell()]
+
+        for n in range(1, parts):
+            # the range starts after the line its nominal offset falls in
+            file.seek(bounds[0] + (size - bounds[0]) * n // parts - 1)
+            file.readline()
+
+            if bounds[-1] < file.tell() < size:
+                bounds.append(file.tell())
+
+    bounds.append(size)
+
+    return header, [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+class RangeReader:
+    """
+    A binary file that ends at the end of a byte range
+    """
+
+    def __init__(self, file: BinaryIO, start: int, end: int):
+        self.file = file
+        self.remaining = end - start
+
+        file.seek(start)
+
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size)
+        self.remaining -= len(data)
+
+        return data
+
+
+def read_range(file: BinaryIO, header: list, start: int, end: int):
+    """
+    Yields the CSV rows of a byte range as dicts
+    """
+
+    return csv.DictReader(iter_lines(RangeReader(file, start, end)), fieldnames=header)
+
+
+def init_worker():
+    # a worker never uses connections opened before it started
+    engine.dispose(close=False)
+
+
+def scan_dimensions(path: str, header: list, start: int, end: int, chunk_size: int):
+    """
+    Validates every row of a range, and collects the first
+    row of each department, teacher and subject, in a worker
+
+    Returns
+    -------
+    found, rows, report : tuple
+        column -> natural key -> schemas.*Create in order of
+        appearance, the rows read, and the ErrorReport of the
+        range, its rows numbered from 1 at the range's start
+    """
+
+    found = {column: {} for column, *_ in DIMENSIONS}
+    entities = [entity for entity in DIMENSIONS if entity[0] in header]
+    validator = BatchValidator(header)
+    report = ErrorReport()
+    rows = 0
+
+    try:
+        with open(path, 'rb') as file:
+            for chunk in batched(read_range(file, header, start, end), chunk_size):
+                errors = validator.validate(chunk, rows + 1)
+                rows += len(chunk)
+
+                if errors:
+                    report.add(errors)
+                    continue
+
+                for row in chunk:
+                    for column, model, key_column, get_key, build in entities:
+                        records = found[column]
+                        key = get_key(row)
+
+                        if key not in records:
+                            records[key] = build(row)
+
+    except Exception as e:
+        report.add([{"row": None, "column": None, "error": str(e)}])
+
+    return found, rows, report
+
+
+def ingest_range(path: str, header: list, start: int, end: int, table: str, chunk_size: int):
+    """
+    Inserts the students or the enrollments of a range in chunks,
+    in a worker, once scan_dimensions has validated its rows
+
+    Returns
+    -------
+    rows, inserted, error : tuple
+        the rows read, the new records, and None or the error
+        of the chunk that stopped the range
+    """
+
+    rows, inserted = 0, 0
+    validator = BatchValidator(header)
+
+    with SessionLocal() as db, open(path, 'rb') as file:
+        repo = SQLRepository(db)
+
+        for chunk in batched(read_range(file, header, start, end), chunk_size):
+            try:
+                validator.coerce(chunk)
+
+                if table == 'students':
+                    batch = [(models.Student, models.Student.id, build_students(chunk))]
+                else:
+                    batch = [(models.Enrollment, None, build_enrollments(chunk))]
+            except Exception as e:
+                return rows, inserted, str(e)
+
+            success, result = repo.bulk_create(batch=batch, ignore_conflicts=True)
+
+            if not success:
+                return rows, inserted, result
+
+            rows += len(chunk)
+            inserted += result[table]
+
+    return rows, inserted, None
+
+
+def build_students(rows: list) -> dict:
+    """
+    std_id -> schemas.Student of a chunk, keeping the std_id as the id
+    """
+
+    records = {}
+
+    for row in rows:
+        key = row['std_id']
+
+        if key not in records:
+            records[key] = schemas.Student.construct(
+                id=key,
+                email=row['std_email'],
+                std_name=row['std_name'],
+                dept_id=row['dept_id']
+            )
+
+    return records
+
+
+def build_enrollments(rows: list) -> dict:
+    """
+    (student_id, subject_id) -> schemas.EnrollmentCreate of a chunk
+    """
+
+    records = {}
+
+    for row in rows:
+        records[(row['std_id'], row['subj_id'])] = schemas.EnrollmentCreate.construct(
+            student_id=row['std_id'],
+            subject_id=row['subj_id']
+        )
+
+    return records
@@ -0,0 +1,375 @@
+import codecs
+import hashlib
+import json
+import sys
+import zlib
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+
+# Content-Encoding -> the compression it names, None for none
+CONTENT_ENCODINGS = {
+    'gzip': 'gzip',
+    'x-gzip': 'gzip',
+    'zstd': 'zstd',
+    'identity': None,
+}
+
+# the JSON literals a read may cut short, e.g. `tr` of `true`
+JSON_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+
+# the bytes each compressed format starts with
+MAGIC_BYTES = {
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+# compressed bytes fed to the decompressor at a time, what they
+# inflate to is held until the parser reads it
+COMPRESSED_READ_SIZE = 64 * 1024
+
+
+class DecompressionError(Exception):
+    """A gzip or zstd upload that is corrupt or cut short"""
+
+
+class DecompressedReader:
+    """
+    Reads a gzip or zstd stream decompressed, frame after frame
+
+    gzip.GzipFile raises the codec's own errors on a corrupt
+    stream, and zstandard's stream_reader reads a stream cut
+    short inside a frame as if it ended there; here both raise
+    a DecompressionError, so a damaged upload is never taken
+    for a shorter file.
+    """
+
+    def __init__(self, stream, compression: str, new_frame, codec_error):
+        """
+        Parameters
+        ----------
+        stream : BinaryIO
+            the compressed stream
+        compression : str
+            'gzip' or 'zstd', named in the errors
+        new_frame : Callable
+            returns a decompressobj for the next frame, one with
+            `decompress`, `eof` and `unused_data`
+        codec_error : type
+            the error the decompressobj raises on corrupt data
+        """
+
+        self.stream = stream
+        self.compression = compression
+        self.new_frame = new_frame
+        self.codec_error = codec_error
+
+        self.frame = None
+        self.pending = bytearray()
+        self.eof = False
+
+
+    def __feed(self):
+        # decompresses the next piece of the stream, starting
+        # a new frame for the bytes after one that ended
+        data = self.stream.read(COMPRESSED_READ_SIZE)
+
+        if not data:
+            self.eof = True
+
+            if self.frame is not None:
+                raise DecompressionError(
+                    f"The {self.compression} stream ends early, the upload was cut short."
+                )
+
+        while data:
+            if self.frame is None:
+                self.frame = self.new_frame()
+
+            try:
+                self.pending += self.frame.decompress(data)
+            except self.codec_error as e:
+                raise DecompressionError(f"The {self.compression} stream is corrupt: {e}")
+
+            data = b''
+
+            if self.frame.eof:
+                data = self.frame.unused_data
+                self.frame = None
+
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Up to `size` decompressed bytes, all of the rest when
+        negative, b'' at the end of the stream
+
+        Raises
+        ------
+        DecompressionError
+            If the stream is corrupt or ends inside a frame
+        """
+
+        while not self.eof and (size < 0 or len(self.pending) < size):
+            self.__feed()
+
+        if size < 0:
+            size = len(self.pending)
+
+        chunk = bytes(self.pending[:size])
+        del self.pending[:size]
+
+        return chunk
+
+
+def open_decompressed(stream, content_encoding: str = None):
+    """
+    Wraps an uploaded stream in a reader that decompresses it
+    as it is read, if it is gzip or zstd compressed
+
+    The compression is taken from the Content-Encoding when given,
+    otherwise from the first bytes of the stream. The stream is
+    decompressed a COMPRESSED_READ_SIZE at a time, so the parsers
+    see the same fixed-size reads as with an uncompressed upload,
+    see DecompressedReader.
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        a seekable file-like object e.g. UploadFile.file
+    content_encoding : Optional[str]
+        the upload's Content-Encoding header
+
+    Returns
+    -------
+    BinaryIO
+        the DecompressedReader, or the stream itself
+
+    Raises
+    ------
+    ValueError
+        If the Content-Encoding is not supported,
+        or zstandard is not installed for a zstd upload
+    """
+
+    if content_encoding:
+        name = content_encoding.strip().lower()
+
+        if name not in CONTENT_ENCODINGS:
+            raise ValueError(
+                f"Unsupported Content-Encoding {content_encoding!r}, "
+                f"expected one of {', '.join(CONTENT_ENCODINGS)}."
+            )
+
+        compression = CONTENT_ENCODINGS[name]
+    else:
+        start = stream.tell()
+        head = stream.read(max(map(len, MAGIC_BYTES.values())))
+        stream.seek(start)
+
+        compression = next(
+            (name for name, magic in MAGIC_BYTES.items() if head.startswith(magic)),
+            None
+        )
+
+    if compression == 'gzip':
+        # 16 + MAX_WBITS reads the gzip header and trailer
+        return DecompressedReader(
+            stream, compression, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), zlib.error
+        )
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd uploads need the zstandard package installed.")
+
+        return DecompressedReader(
+            stream, compression, zstandard.ZstdDecompressor().decompressobj, zstandard.ZstdError
+        )
+
+    return stream
+
+
+def digest_stream(stream, read_size: int = None) -> str:
+    """
+    SHA-256 of the rest of a seekable stream, read in fixed-size
+    chunks; the stream is left where it was
+
+    Returns
+    -------
+    str
+        the hex digest
+    """
+
+    read_size = read_size or settings.upload_read_size
+    start = stream.tell()
+    digest = hashlib.sha256()
+
+    while chunk := stream.read(read_size):
+        digest.update(chunk)
+
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+def iter_lines(stream, read_size: int = None):
+    """
+    Reads a binary stream in fixed-size chunks
+    and yields its decoded lines one at a time
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        the file-like object to read from e.g. UploadFile.file
+    read_size : Optional[int]
+        bytes per read, defaults to `settings.upload_read_size`
+
+    Yields
+    ------
+    str
+        each line, with its line ending as the csv module expects
+    """
+
+    read_size = read_size or settings.upload_read_size
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+
+    while True:
+        chunk = stream.read(read_size)
+        lines = (pending + decoder.decode(chunk, final=not chunk)).split('\n')
+
+        # the last piece may be an incomplete line
+        pending = lines.pop()
+
+        for line in lines:
+            yield line + '\n'
+
+        if not chunk:
+            break
+
+    if pending:
+        yield pending
+
+
+def iter_json_items(stream, read_size: int = None):
+    """
+    Reads a binary stream in fixed-size chunks and yields
+    the elements of a top-level JSON array one at a time,
+    or each value of an NDJSON stream
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        the file-like object to read from e.g. UploadFile.file
+    read_size : Optional[int]
+        bytes per read, defaults to `settings.upload_read_size`
+
+    Yields
+    ------
+    Any
+        each decoded element
+
+    Raises
+    ------
+    ValueError
+        If the payload is not valid JSON, or the array is
+        followed by anything but whitespace
+    """
+
+    read_size = read_size or settings.upload_read_size
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = json.JSONDecoder()
+
+    buffer, pos, eof = '', 0, False
+
+    def read_more():
+        # drops the consumed text so only the current element is held
+        nonlocal buffer, pos, eof
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + decoder.decode(chunk, final=eof)
+        pos = 0
+
+    def next_char():
+        # skips whitespace, returns '' at the end of the stream
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return ''
+
+            read_more()
+
+    def next_value():
+        nonlocal pos
+        next_char()
+
+        while True:
+            try:
+                value, end = parser.raw_decode(buffer, pos)
+
+                # a value running into the end of the buffer may be cut
+                # short, e.g. `12` of `12.5` split across two reads; any
+                # other text after it is left to the separator check
+                rest = buffer[end:end + 3]
+                if eof or (rest and (rest[0] in ',] \t\r\n' or len(rest) > 2)):
+                    pos = end
+                    return value
+
+            except json.JSONDecodeError as e:
+                # reading more only helps an error at the end of the buffer,
+                # so a malformed payload is not read to its end
+                if eof or not cut_short(e, buffer):
+                    raise
+
+            read_more()
+
+    if next_char() == '[':
+        pos += 1
+
+        if next_char() == ']':
+            return
+
+        while True:
+            yield next_value()
+
+            separator = next_char()
+            pos += 1
+
+            if separator == ']':
+                break
+            if separator != ',':
+                raise ValueError(f"Expected ',' or ']' in the JSON array, got {separator!r}")
+
+        trailing = next_char()
+        if trailing:
+            raise ValueError(f"Expected the end of the file after the JSON array, got {trailing!r}")
+
+    else:
+        # NDJSON, one value after another
+        while next_char():
+            yield next_value()
+
+
+def cut_short(error: json.JSONDecodeError, buffer: str) -> bool:
+    """
+    Whether a decode error may come from the buffer ending mid-value,
+    rather than from malformed JSON before its end
+    """
+
+    if error.pos >= len(buffer) or error.msg.startswith('Unterminated string'):
+        return True
+
+    # an escape or a literal split across two reads
+    if error.msg.startswith('Invalid \\uXXXX escape'):
+        return len(buffer) - error.pos <= 6
+
+    if error.msg == 'Expecting value':
+        return any(literal.startswith(buffer[error.pos:]) for literal in JSON_LITERALS)
+
+    return False
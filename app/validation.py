@@ -0,0 +1,372 @@
+from sqlalchemy import Integer, String
+from itertools import islice
+from operator import itemgetter
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+from scripts import models
+
+# CSV header -> the column its values are stored in,
+# whose type and length they have to fit
+CSV_COLUMNS = {
+    'dept_id': models.Department.id,
+    'dept_name': models.Department.dept_name,
+    'teacher_id': models.Teacher.id,
+    'teacher_name': models.Teacher.teacher_name,
+    'teacher_email': models.Teacher.email,
+    'subj_id': models.Subject.id,
+    'subj_name': models.Subject.subj_name,
+    'description': models.Subject.description,
+    'std_id': models.Student.id,
+    'std_name': models.Student.std_name,
+    'std_email': models.Student.email,
+}
+
+EMAIL_COLUMNS = {'teacher_email', 'std_email'}
+
+# the header that puts an entity in a file -> the headers its
+# records are built from, see business.CSV_ENTITIES
+ENTITY_COLUMNS = {
+    'dept_name': ('dept_name',),
+    'teacher_name': ('teacher_name', 'teacher_email', 'dept_id'),
+    'subj_name': ('subj_name', 'description', 'dept_id', 'teacher_id'),
+    'std_name': ('std_id', 'std_name', 'std_email', 'dept_id'),
+}
+
+# (id header, natural key header): in one file an id names
+# a single record and a natural key belongs to a single id
+KEY_COLUMNS = [
+    ('dept_id', 'dept_name'),
+    ('teacher_id', 'teacher_email'),
+    ('subj_id', 'subj_name'),
+    ('std_id', 'std_email'),
+]
+
+# (headers that put the entity in a file, headers of its key): the
+# first that applies is what a row of the file is, and may not repeat
+ROW_KEYS = [
+    (('std_name', 'subj_name'), ('std_id', 'subj_id')),
+    (('std_name',), ('std_id',)),
+    (('subj_name',), ('subj_id',)),
+    (('teacher_name',), ('teacher_id',)),
+    (('dept_name',), ('dept_id',)),
+]
+
+
+class BatchValidator:
+    """
+    Validates the rows of a CSV upload chunk by chunk, one column at
+    a time, in place of building a pydantic model for every row
+
+    Each column of a chunk is checked in a single pass: integers,
+    emails, and lengths against the String columns of the models, with
+    the fast path of converting or measuring the whole column at once.
+    Every error of the chunk is collected with its row number. The ids,
+    natural keys and row keys seen are remembered, so a file that
+    reuses a key for another record or repeats a row is caught across
+    chunks too. Only the first `settings.upload_unique_keys` of each
+    kind are kept, see SeenKeys; in a larger file a repeat of a key
+    past them is caught within its chunk, and across chunks is left
+    to the db, which skips it as existing.
+    """
+
+    def __init__(self, header: list):
+        """
+        Parameters
+        ----------
+        header : list[str]
+            the CSV header of the file
+        """
+
+        present = set(header)
+        required = set()
+
+        for column, columns in ENTITY_COLUMNS.items():
+            if column in present:
+                required.update(columns)
+
+        if {'std_name', 'subj_name'} <= present:
+            required.update(('std_id', 'subj_id'))
+
+        # a required column the file lacks fails on every row
+        self.columns = [column for column in header if column in CSV_COLUMNS]
+        self.missing = sorted(required - present)
+        self.columns += self.missing
+
+        self.int_columns = [
+            column for column in self.columns
+            if isinstance(CSV_COLUMNS[column].type, Integer)
+        ]
+
+        # id header, key header, id -> key, key -> id
+        self.keys = [
+            (id_column, key_column, SeenKeys(), SeenKeys())
+            for id_column, key_column in KEY_COLUMNS
+            if id_column in present and key_column in present
+        ]
+
+        self.row_key = next(
+            (
+                key for columns, key in ROW_KEYS
+                if present.issuperset(columns) and present.issuperset(key)
+            ),
+            None
+        )
+        # row key -> the row it was first seen in
+        self.rows_seen = SeenKeys()
+
+
+    def validate(self, rows: list, first_row: int = 1):
+        """
+        Checks a chunk of rows, converting the integer columns of the
+        rows in place so their records can be built without validation
+
+        Parameters
+        ----------
+        rows : list[dict]
+            the chunk, as read by csv.DictReader
+        first_row : int
+            the number of the chunk's first row in the file,
+            1 for the row after the header
+
+        Returns
+        -------
+        list[dict]
+            {row, column, error} for every problem in the chunk,
+            in row order; empty if the chunk is valid
+        """
+
+        errors = []
+        invalid = set()
+        columns = {}
+
+        for column in self.columns:
+            if column in self.missing:
+                values = [None] * len(rows)
+            else:
+                # csv.DictReader fills the fields of a short row with None
+                values = list(map(itemgetter(column), rows))
+
+            column_errors, values = check_column(column, values)
+            columns[column] = values
+
+            for index, error in column_errors:
+                errors.append({"row": first_row + index, "column": column, "error": error})
+                invalid.add(index)
+
+            if column in self.int_columns:
+                for row, value in zip(rows, values):
+                    row[column] = value
+
+        valid = [index for index in range(len(rows)) if index not in invalid]
+
+        def valid_values(column):
+            values = columns[column]
+            return values if not invalid else [values[index] for index in valid]
+
+        for id_column, key_column, keys_by_id, ids_by_key in self.keys:
+            ids, keys = valid_values(id_column), valid_values(key_column)
+            conflicts = {}
+
+            # a chunk repeats few pairs, e.g. one per subject
+            for id, key in dict.fromkeys(zip(ids, keys)):
+                known_key = keys_by_id.setdefault(id, key)
+                known_id = ids_by_key.setdefault(key, id)
+
+                if known_key != key:
+                    conflicts[(id, key)] = f"{id_column} {id} is {known_key!r} in an earlier row"
+                elif known_id != id:
+                    conflicts[(id, key)] = f"already used by {id_column} {known_id}"
+
+            keys_by_id.end_chunk()
+            ids_by_key.end_chunk()
+
+            if conflicts:
+                for index, id, key in zip(valid, ids, keys):
+                    error = conflicts.get((id, key))
+                    if error is not None:
+                        errors.append({"row": first_row + index, "column": key_column, "error": error})
+
+        if self.row_key is not None:
+            row_keys = list(zip(*map(valid_values, self.row_key)))
+            first_seen = dict(zip(row_keys, (first_row + index for index in valid)))
+
+            if len(first_seen) == len(valid) and self.rows_seen.isdisjoint(first_seen):
+                self.rows_seen.update(first_seen)
+            else:
+                for key, index in zip(row_keys, valid):
+                    seen = self.rows_seen.setdefault(key, first_row + index)
+
+                    if seen != first_row + index:
+                        errors.append({
+                            "row": first_row + index,
+                            "column": ','.join(self.row_key),
+                            "error": f"duplicate of row {seen}"
+                        })
+
+            self.rows_seen.end_chunk()
+
+        errors.sort(key=lambda error: error["row"])
+
+        return errors
+
+
+    def coerce(self, rows: list):
+        """
+        Converts the integer columns of rows in place,
+        for rows that already passed `validate`
+        """
+
+        for column in self.int_columns:
+            for row in rows:
+                row[column] = int(row[column])
+
+
+class SeenKeys:
+    """
+    The keys seen in a file and what each was first seen with, as
+    a dict would hold them, but keeping at most `max_size` of the
+    file's keys; past that, a chunk's keys are dropped at its end
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = settings.upload_unique_keys if max_size is None else max_size
+        self.file = {}
+        self.chunk = {}
+
+
+    def setdefault(self, key, value):
+        if key in self.file:
+            return self.file[key]
+
+        return self.chunk.setdefault(key, value)
+
+
+    def isdisjoint(self, keys) -> bool:
+        return self.file.keys().isdisjoint(keys) and self.chunk.keys().isdisjoint(keys)
+
+
+    def update(self, values: dict):
+        self.chunk.update(values)
+
+
+    def end_chunk(self):
+        """
+        Keeps the chunk's keys while there is room
+        """
+
+        room = self.max_size - len(self.file)
+
+        if room >= len(self.chunk):
+            self.file.update(self.chunk)
+        elif room > 0:
+            self.file.update(islice(self.chunk.items(), room))
+
+        self.chunk = {}
+
+
+def check_column(column: str, values: list):
+    """
+    Checks the values of one column against its model column
+
+    Returns
+    -------
+    errors, values : tuple
+        (index, error) of each invalid value, and the values with
+        the integers converted and the invalid ones as they were
+    """
+
+    column_type = CSV_COLUMNS[column].type
+
+    if isinstance(column_type, Integer):
+        try:
+            # one call for the whole column when every value is good
+            return [], list(map(int, values))
+        except (TypeError, ValueError):
+            pass
+
+        errors, converted = [], []
+        for index, value in enumerate(values):
+            try:
+                converted.append(int(value))
+            except TypeError:
+                errors.append((index, "missing value"))
+                converted.append(value)
+            except ValueError:
+                errors.append((index, f"{value!r} is not an integer"))
+                converted.append(value)
+
+        return errors, converted
+
+    errors = []
+    length = column_type.length if isinstance(column_type, String) else None
+
+    try:
+        # one pass over the whole column when every value fits
+        fits = length is None or max(map(len, values), default=0) <= length
+        fits = fits and None not in values
+    except TypeError:
+        fits = False
+
+    if not fits:
+        for index, value in enumerate(values):
+            if value is None:
+                errors.append((index, "missing value"))
+            elif length is not None and len(value) > length:
+                errors.append((index, f"longer than {length} characters"))
+
+    if column in EMAIL_COLUMNS:
+        errors += [
+            (index, "Invalid email format")
+            for index, value in enumerate(values)
+            if value is not None and '@' not in value
+        ]
+
+    return errors, values
+
+
+class ErrorReport:
+    """
+    The first `settings.upload_max_errors` row errors
+    of an upload, and how many there were
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.count = 0
+
+
+    def add(self, errors: list, offset: int = 0):
+        """
+        Adds row errors, moving their row numbers by `offset`
+        """
+
+        self.count += len(errors)
+
+        for error in errors[:max(settings.upload_max_errors - len(self.errors), 0)]:
+            if error["row"] is not None:
+                error = {**error, "row": error["row"] + offset}
+            self.errors.append(error)
+
+
+    def extend(self, report: 'ErrorReport', offset: int = 0):
+        """
+        Adds the errors of another report, e.g. of a part of the file
+        """
+
+        self.add(report.errors, offset)
+        self.count += report.count - len(report.errors)
+
+
+    def detail(self, message: str) -> dict:
+        """
+        The body of the 400 response
+        """
+
+        return {
+            "message": message,
+            "error_count": self.count,
+            "errors": self.errors
+        }
@@ -0,0 +1,114 @@
+"""Shared setup for the benchmark scripts.
+
+The benchmarks run against a throwaway SQLite database unless
+`DATABASE_URL` points somewhere else (e.g. a MySQL test schema).
+Run them from the project root, e.g. `python -m benchmarks.upload_csv`.
+"""
+import contextlib
+import csv
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the app modules import each other by bare name
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+
+def use_sqlite(filename: str = "benchmark.db") -> str:
+    """Points the app at a fresh SQLite file unless a url is already set.
+
+    Must be called before anything from `app` or `scripts` is imported.
+    """
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(ROOT, filename)
+        if os.path.exists(path):
+            os.remove(path)
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    return os.environ["DATABASE_URL"]
+
+
+def reset_db():
+    """Drops and recreates every table."""
+    from scripts import models  # noqa: F401, registers the tables
+    from scripts.database import Base, engine
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def make_repo():
+    """Returns a repository on a fresh session, as a request would get."""
+    from crud import SQLRepository
+    from scripts.database import SessionLocal
+
+    return SQLRepository(SessionLocal())
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Counts the statements sent to the db inside the block.
+
+        with count_queries() as queries:
+            ...
+        print(queries.count, queries.statements)
+    """
+    from sqlalchemy import event
+    from scripts.database import engine
+
+    counter = type("QueryCounter", (), {"count": 0, "statements": []})()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        counter.count += 1
+        counter.statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def timed(func, *args, **kwargs):
+    """Calls `func` and returns its result with the elapsed seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name: str, seconds: float, rows: int):
+    """Prints one benchmark line."""
+    print(f"{name:<24} {seconds:>10.2f} s {rows / seconds:>12,.0f} rows/s")
+
+
+ROSTER_HEADER = [
+    "dept_id", "dept_name", "teacher_id", "teacher_name", "teacher_email",
+    "subj_id", "subj_name", "description", "std_id", "std_name", "std_email"
+]
+
+
+def roster_rows(rows: int, departments: int = 10, teachers: int = 200, subjects: int = 500):
+    """Yields CSV roster rows with one student and enrollment each,
+    cycling through the departments, teachers and subjects."""
+    for i in range(rows):
+        dept = i % departments + 1
+        teacher = i % teachers + 1
+        subject = i % subjects + 1
+        yield [
+            dept, f"Department {dept}",
+            teacher, f"Teacher {teacher}", f"teacher.{teacher}@email.com",
+            subject, f"Subject {subject}", f"Description of subject {subject}",
+            i + 1, f"Student {i + 1}", f"student.{i + 1}@email.com"
+        ]
+
+
+def generate_csv(rows: int) -> bytes:
+    """Builds an in-memory roster file of `rows` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ROSTER_HEADER)
+    writer.writerows(roster_rows(rows))
+    return buffer.getvalue().encode("utf-8")
@@ -0,0 +1,81 @@
+"""Measures CSV uploads plain, gzip and zstd compressed: the bytes sent,
+the parse throughput with the decompression streamed in, and the full
+`Uploader.upload_csv` into the db.
+
+    python -m benchmarks.compressed_upload --students 20000
+
+Throughput is counted in uncompressed MB, so the rates compare directly.
+"""
+import argparse
+import gzip
+import io
+import tracemalloc
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from business import Uploader
+from crud import SQLRepository
+from parsers import iter_lines, open_decompressed
+from scripts.generate_data import School, write_csv
+
+
+def compressors():
+    """name -> bytes -> compressed bytes, zstd only if installed"""
+    found = {"plain": lambda data: data, "gzip": lambda data: gzip.compress(data, 6)}
+
+    try:
+        import zstandard
+        found["zstd"] = zstandard.ZstdCompressor(level=3).compress
+    except ImportError:
+        print("zstandard is not installed, skipping zstd")
+
+    return found
+
+
+def parse(payload: bytes) -> int:
+    """Reads every line of the upload as upload_csv does, returns the count."""
+    return sum(1 for _ in iter_lines(open_decompressed(io.BytesIO(payload))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    file = io.StringIO()
+    write_csv(School(students=args.students, seed=args.seed), file)
+    data = file.getvalue().encode()
+    megabytes = len(data) / 2**20
+    rows = data.count(b"\n") - 1
+
+    print(f"{rows:,} rows, {megabytes:.1f} MB uncompressed")
+    print(f"{'':<8} {'size':>10} {'ratio':>7} {'parse':>12} {'peak':>9} {'upload_csv':>12}")
+
+    for name, compress in compressors().items():
+        payload = compress(data)
+
+        tracemalloc.start()
+        lines, seconds = common.timed(parse, payload)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        assert lines == rows + 1
+
+        common.reset_db()
+        for table in ("departments", "teachers", "subjects"):
+            SQLRepository.key_index.invalidate(table)
+
+        _, upload_seconds = common.timed(
+            Uploader(common.make_repo()).upload_csv, open_decompressed(io.BytesIO(payload))
+        )
+
+        print(
+            f"{name:<8} {len(payload) / 2**20:>7.1f} MB {len(data) / len(payload):>6.1f}x "
+            f"{megabytes / seconds:>7.1f} MB/s {peak:>6.1f} MB {rows / upload_seconds:>7,.0f} rows/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Hammers `GET /students/{id}/subjects` from many threads against a
+live server and checks every response, so sessions shared between
+concurrent requests show up as errors or wrong results.
+
+    python -m benchmarks.concurrent_reads --readers 200 --modes sync async
+
+Each mode starts its own uvicorn process on the same seeded database,
+with `DB_ASYNC` off or on. Exits non-zero if any request fails or
+returns another student's data.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import common
+
+SUBJECTS = 500
+
+
+def serve(port: int, mode: str) -> subprocess.Popen:
+    """Starts the app in its own process and waits until it accepts."""
+    env = dict(
+        os.environ,
+        DB_ASYNC=str(mode == "async"),
+        PYTHONPATH=os.pathsep.join([common.ROOT, os.path.join(common.ROOT, "app")])
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=common.ROOT, env=env
+    )
+
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+
+
+def fetch(port: int, student_id: int) -> bool:
+    """Requests one student's subjects and checks the answer."""
+    url = f"http://127.0.0.1:{port}/students/{student_id}/subjects"
+
+    try:
+        with urllib.request.urlopen(url) as response:
+            subjects = json.load(response)
+    except Exception as e:
+        print(f"student {student_id}: {e}", file=sys.stderr)
+        return False
+
+    # each generated student is enrolled in exactly one subject
+    expected = (student_id - 1) % SUBJECTS + 1
+    return [subject["id"] for subject in subjects] == [expected]
+
+
+def hammer(port: int, readers: int, student_ids: list):
+    """Sends all requests from `readers` threads, returns (seconds, failures)."""
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda id: fetch(port, id), student_ids))
+
+    return time.perf_counter() - start, results.count(False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    common.use_sqlite()
+    common.reset_db()
+
+    from business import Uploader
+
+    Uploader(common.make_repo()).upload_csv(
+        io.BytesIO(common.generate_csv(args.students))
+    )
+
+    student_ids = [random.randint(1, args.students) for _ in range(args.requests)]
+    total_failures = 0
+
+    for mode in args.modes:
+        server = serve(args.port, mode)
+
+        try:
+            seconds, failures = hammer(args.port, args.readers, student_ids)
+        finally:
+            server.terminate()
+            server.wait()
+
+        total_failures += failures
+        print(
+            f"{mode:>6}: {args.requests:,} requests from {args.readers} readers, "
+            f"{args.requests / seconds:,.0f} req/s, {failures} failures"
+        )
+
+    sys.exit(1 if total_failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compares a dashboard page of per-teacher and per-department counts
+computed with GROUP BY over the enrollments against the same page read
+from the enrollment summary table, and times a full rebuild.
+
+    python -m benchmarks.enrollment_summary --students 500000 --per-student 4
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from sqlalchemy import func, insert, select
+
+from scripts import models
+from scripts.database import engine
+
+
+def load(args, batch: int = 50_000):
+    """Inserts the school straight into the tables, leaving the summary empty."""
+    rng = random.Random(args.seed)
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Department), [
+            {"id": id, "dept_name": f"Department {id}"} for id in range(1, args.departments + 1)
+        ])
+        conn.execute(insert(models.Teacher), [
+            {"id": id, "teacher_name": f"Teacher {id}", "email": f"teacher.{id}@email.com",
+             "dept_id": (id - 1) % args.departments + 1}
+            for id in range(1, args.teachers + 1)
+        ])
+        conn.execute(insert(models.Subject), [
+            {"id": id, "subj_name": f"Subject {id}", "dept_id": (id - 1) % args.departments + 1,
+             "teacher_id": (id - 1) % args.teachers + 1}
+            for id in range(1, args.subjects + 1)
+        ])
+
+        for start in range(1, args.students + 1, batch):
+            ids = range(start, min(start + batch, args.students + 1))
+
+            conn.execute(insert(models.Student), [
+                {"id": id, "std_name": f"Student {id}", "email": f"student.{id}@email.com",
+                 "dept_id": rng.randint(1, args.departments)}
+                for id in ids
+            ])
+            conn.execute(insert(models.Enrollment), [
+                {"student_id": id, "subject_id": subject_id}
+                for id in ids
+                for subject_id in rng.sample(range(1, args.subjects + 1), args.per_student)
+            ])
+
+
+def group_by_page(db, scope: str, limit: int):
+    """The page counted live, as the dashboards did."""
+    model, column = {
+        "teachers": (models.Teacher, models.Subject.teacher_id),
+        "departments": (models.Department, models.Subject.dept_id),
+    }[scope]
+
+    counts = (
+        select(column.label("id"), func.count().label("enrollments"))
+        .select_from(models.Enrollment)
+        .join(models.Subject, models.Subject.id == models.Enrollment.subject_id)
+        .group_by(column)
+        .subquery()
+    )
+
+    return db.execute(
+        select(model.id, func.coalesce(counts.c.enrollments, 0))
+        .outerjoin(counts, counts.c.id == model.id)
+        .order_by(model.id)
+        .limit(limit)
+    ).all()
+
+
+def median_ms(func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500_000)
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--teachers", type=int, default=200)
+    parser.add_argument("--subjects", type=int, default=500)
+    parser.add_argument("--per-student", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    common.reset_db()
+    _, seconds = common.timed(load, args)
+    enrollments = args.students * args.per_student
+    common.report("load enrollments", seconds, enrollments)
+
+    repo = common.make_repo()
+
+    (success, rows), seconds = common.timed(repo.rebuild_summary)
+    print(f"rebuild_summary          {seconds:>10.2f} s {rows:>12,} rows")
+
+    print(f"\n{enrollments:,} enrollments, median of {args.runs}, 100 rows a page")
+    print(f"{'':<14} {'GROUP BY':>12} {'summary':>12} {'speedup':>9}")
+
+    for scope in ("teachers", "departments"):
+        live = median_ms(lambda: group_by_page(repo.db, scope, 100), args.runs)
+        summary = median_ms(lambda: repo.list_summary(scope, limit=100), args.runs)
+        print(f"{scope:<14} {live:>9.2f} ms {summary:>9.2f} ms {live / summary:>8.0f}x")
+
+    _, seconds = common.timed(repo.get_summary_drift)
+    print(f"\nconsistency check        {seconds:>10.2f} s")
+
+
+if __name__ == "__main__":
+    main()
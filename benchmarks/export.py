@@ -0,0 +1,78 @@
+"""Streams the roster export (`GET /export/roster`, through
+`Exporter.export`) of a large db and reports the time to the first
+chunk, the throughput and the peak Python memory, against loading
+every row with `.all()` first.
+
+    python -m benchmarks.export --rows 200000
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from business import Exporter, Uploader, ROSTER_COLUMNS
+
+
+def stream(repo, compress: bool):
+    """Drains the export, returning (first chunk s, total s, bytes)."""
+    start = time.perf_counter()
+    first = None
+    size = 0
+
+    for chunk in Exporter(repo).export("roster", "csv", compress):
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+
+    return first, time.perf_counter() - start, size
+
+
+def load_all(repo):
+    """The buffered equivalent: every row in memory before the first byte."""
+    start = time.perf_counter()
+    rows = [row for batch in repo.stream_roster(batch_size=10 ** 9) for row in batch]
+
+    buffer = io.StringIO()
+    buffer.write(",".join(ROSTER_COLUMNS) + "\n")
+    for row in rows:
+        buffer.write(",".join(str(value) for value in row) + "\n")
+    size = len(buffer.getvalue().encode())
+
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, size
+
+
+def measure(name: str, func, *args):
+    tracemalloc.start()
+    first, total, size = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<16} first chunk {first * 1000:>9.1f} ms  total {total:>6.2f} s"
+        f"  {size / 2 ** 20:>7.1f} MB out  peak {peak / 2 ** 20:>7.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    common.reset_db()
+    _, seconds = common.timed(
+        Uploader(common.make_repo()).upload_csv, io.BytesIO(common.generate_csv(args.rows))
+    )
+    print(f"seeded {args.rows:,} enrollments in {seconds:.1f} s")
+
+    measure("stream", stream, common.make_repo(), False)
+    measure("stream gzip", stream, common.make_repo(), True)
+    measure("load all", load_all, common.make_repo())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Counts the natural key lookups that reach the db when uploading
+`data/test.csv` scaled up, with and without the natural key index.
+
+    python -m benchmarks.key_lookups --copies 10000 --uploads 2
+
+The file is repeated with fresh student ids so departments, teachers
+and subjects recur on every row, then uploaded `--uploads` times.
+"""
+import argparse
+import csv
+import io
+import os
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from config import settings
+from cache import NaturalKeyIndex
+from crud import SQLRepository
+from business import Uploader
+
+LOOKUP_TABLES = ["departments", "teachers", "subjects"]
+
+
+def scaled_test_csv(copies: int) -> bytes:
+    """data/test.csv repeated, renumbering the students of each copy."""
+    with open(os.path.join(common.ROOT, "data", "test.csv"), newline="") as file:
+        rows = list(csv.DictReader(file))
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+
+    for copy in range(copies):
+        for row in rows:
+            std_id = copy * len(rows) + int(row["std_id"])
+            writer.writerow(dict(
+                row,
+                std_id=std_id,
+                std_name=f"{row['std_name']} {std_id}",
+                std_email=f"student.{std_id}@email.com"
+            ))
+
+    return buffer.getvalue().encode("utf-8")
+
+
+def run(content: bytes, uploads: int, max_size: int):
+    """Uploads the content on an empty db, counting lookup queries per table."""
+    SQLRepository.key_index = NaturalKeyIndex(
+        tables=LOOKUP_TABLES, max_size=max_size, ttl=settings.key_index_ttl
+    )
+    common.reset_db()
+
+    with common.count_queries() as queries:
+        _, seconds = common.timed(
+            lambda: [
+                Uploader(common.make_repo()).upload_csv(io.BytesIO(content))
+                for _ in range(uploads)
+            ]
+        )
+
+    lookups = {
+        table: sum(
+            statement.startswith("SELECT") and f"FROM {table}" in statement
+            for statement in queries.statements
+        )
+        for table in LOOKUP_TABLES
+    }
+
+    return lookups, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=10_000)
+    parser.add_argument("--uploads", type=int, default=2)
+    args = parser.parse_args()
+
+    content = scaled_test_csv(args.copies)
+    rows = args.copies * 3 * args.uploads
+
+    for name, max_size in (("without index", 0), ("with index", settings.key_index_max_size)):
+        lookups, seconds = run(content, args.uploads, max_size)
+        print(f"{name:<14} {seconds:>7.2f} s, {rows / seconds:>9,.0f} rows/s, db lookups {lookups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Times page 1 and deep pages of `GET /students` (through
+`Getter.list_records`) on a large table, keyset versus OFFSET.
+
+    python -m benchmarks.list_pages --rows 1000000 --pages 1 100 10000
+"""
+import argparse
+
+from sqlalchemy import insert, select
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from scripts import models
+from business import Getter, batched
+
+PAGE_SIZE = 100
+
+
+def seed(repo, rows: int):
+    """`rows` students spread over 10 departments, inserted in batches."""
+    repo.db.execute(insert(models.Department), [
+        {"id": i, "dept_name": f"Department {i}"} for i in range(1, 11)
+    ])
+
+    students = (
+        {"std_name": f"Student {i}", "email": f"student.{i}@email.com", "dept_id": i % 10 + 1}
+        for i in range(1, rows + 1)
+    )
+    for batch in batched(students, 50_000):
+        repo.db.execute(insert(models.Student), batch)
+
+    repo.db.commit()
+
+
+def offset_page(repo, page: int):
+    """The OFFSET equivalent of a page, for comparison."""
+    return repo.db.scalars(
+        select(models.Student)
+        .order_by(models.Student.id)
+        .offset((page - 1) * PAGE_SIZE)
+        .limit(PAGE_SIZE)
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    common.reset_db()
+    repo = common.make_repo()
+    _, seconds = common.timed(seed, repo, args.rows)
+    print(f"seeded {args.rows:,} students in {seconds:.1f} s")
+
+    getter = Getter(repo)
+
+    for page in args.pages:
+        # the cursor a client holds after reading page - 1
+        after = str((page - 1) * PAGE_SIZE) if page > 1 else None
+
+        _, keyset = common.timed(lambda: [
+            getter.list_records("students", {}, after, PAGE_SIZE) for _ in range(args.repeat)
+        ])
+        _, offset = common.timed(lambda: [
+            offset_page(repo, page) for _ in range(args.repeat)
+        ])
+
+        print(
+            f"page {page:>6,}: keyset {keyset / args.repeat * 1000:>8.2f} ms, "
+            f"offset {offset / args.repeat * 1000:>8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measures how `ParallelUploader` scales with its worker processes
+against the single-process `Uploader.upload_csv`, on a generated roster.
+
+    python -m benchmarks.parallel_ingest --students 200000 --workers 1 2 4 8
+
+SQLite takes one writer at a time, so past the parsing the workers
+queue for its lock; point `DATABASE_URL` at MySQL to see the inserts scale.
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from business import Uploader
+from crud import SQLRepository
+from parallel import ParallelUploader
+from scripts.generate_data import School, write_csv
+
+
+def reset():
+    """An empty db, without the ids this process remembers from the last run."""
+    common.reset_db()
+    for table in ("departments", "teachers", "subjects"):
+        SQLRepository.key_index.invalidate(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    school = School(students=args.students, seed=args.seed)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", delete=False) as file:
+        write_csv(school, file)
+
+    try:
+        with open(file.name, "rb") as roster:
+            rows = sum(1 for _ in roster) - 1
+
+        print(
+            f"{rows:,} rows, {os.path.getsize(file.name) / 2**20:.1f} MB, "
+            f"{os.cpu_count()} cores on {common.use_sqlite()}"
+        )
+
+        reset()
+        with open(file.name, "rb") as roster:
+            _, baseline = common.timed(
+                Uploader(common.make_repo()).upload_csv, roster, chunk_size=args.chunk_size
+            )
+        common.report("upload_csv", baseline, rows)
+
+        for workers in args.workers:
+            reset()
+            result, seconds = common.timed(
+                ParallelUploader(workers=workers).upload_path, file.name, chunk_size=args.chunk_size
+            )
+            common.report(f"parallel, {workers} workers", seconds, rows)
+            print(f"{'':<24} {baseline / seconds:>10.2f} x upload_csv")
+
+        print(result["counts"])
+
+    finally:
+        os.remove(file.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Times serving 1, 100 and 10,000 subjects through FastAPI's
+`response_model` validation and JSON encoding, from hydrated ORM
+objects and from the row tuples the repository now returns, with the
+`json` module and with orjson.
+
+    python -m benchmarks.serialization --runs 20
+
+The db is only read once up front, so the response timings are the
+serialization alone plus the in-process request overhead. FastAPI
+validates and encodes the items to plain dicts before the response
+class sees them, so `render` times the JSON encoding by itself.
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+
+from scripts import models, schemas
+from scripts.database import SessionLocal, engine
+
+SIZES = (1, 100, 10_000)
+
+
+def load(subjects: int):
+    with engine.begin() as conn:
+        conn.execute(insert(models.Department), [{"id": 1, "dept_name": "Benchmarks"}])
+        conn.execute(insert(models.Teacher), [
+            {"id": 1, "teacher_name": "Teacher 1", "email": "teacher.1@email.com", "dept_id": 1}
+        ])
+        conn.execute(insert(models.Subject), [
+            {"id": id, "subj_name": f"Subject {id}", "description": f"Description of subject {id}",
+             "dept_id": 1, "teacher_id": 1}
+            for id in range(1, subjects + 1)
+        ])
+
+
+def make_app(results: dict) -> FastAPI:
+    """One endpoint per source and response class, serving `results`."""
+    app = FastAPI()
+
+    def add(path, source, response_class):
+        @app.get(path, response_model=List[schemas.Subject], response_class=response_class)
+        def endpoint(size: int):
+            return results[source][size]
+
+    for source in results:
+        add(f"/{source}/json", source, JSONResponse)
+        add(f"/{source}/orjson", source, ORJSONResponse)
+
+    return app
+
+
+def median_ms(func, runs: int) -> float:
+    func()  # builds the route's validators before timing
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    common.reset_db()
+    load(max(SIZES))
+
+    with SessionLocal() as db:
+        results = {
+            "orm": {size: db.scalars(select(models.Subject).limit(size)).all() for size in SIZES},
+            "rows": {size: db.execute(select(models.Subject.__table__).limit(size)).all() for size in SIZES},
+        }
+
+        # time building each source too, as a request pays for it
+        fetch = {
+            "orm": lambda size: db.scalars(select(models.Subject).limit(size)).all(),
+            "rows": lambda size: db.execute(select(models.Subject.__table__).limit(size)).all(),
+        }
+
+        print(f"median of {args.runs}, milliseconds")
+        print(
+            f"{'':<14} {'':>8} {'response':^17} {'render':^17}\n"
+            f"{'items':>7} {'source':<6} {'fetch':>8} {'json':>8} {'orjson':>8} {'json':>8} {'orjson':>8}"
+        )
+
+        with TestClient(make_app(results)) as client:
+            for size in SIZES:
+                content = jsonable_encoder([schemas.Subject.from_orm(row) for row in results["rows"][size]])
+                rendered = {
+                    name: median_ms(lambda: response_class(content), args.runs)
+                    for name, response_class in (("json", JSONResponse), ("orjson", ORJSONResponse))
+                }
+
+                for source in results:
+                    fetched = median_ms(lambda: (db.expunge_all(), fetch[source](size)), args.runs)
+                    served = {
+                        name: median_ms(lambda: client.get(f"/{source}/{name}?size={size}"), args.runs)
+                        for name in ("json", "orjson")
+                    }
+                    print(
+                        f"{size:>7,} {source:<6} {fetched:>8.2f} "
+                        f"{served['json']:>8.2f} {served['orjson']:>8.2f} "
+                        f"{rendered['json']:>8.2f} {rendered['orjson']:>8.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measures the cold start of the app in fresh interpreters: importing
+`main`, running its lifespan startup, and serving the first request.
+
+    python -m benchmarks.startup --runs 5 --path /departments
+
+Then compares the startup schema version check with the `create_all`
+it replaced, on a db whose tables exist.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from crud import create_tables, init_db
+
+# runs in a fresh interpreter and prints its timings as JSON
+CHILD = """
+import json, sys, time
+from fastapi.testclient import TestClient
+
+sys.path[:0] = [sys.argv[1], sys.argv[1] + "/app"]
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    status = client.get(sys.argv[2]).status_code
+    served = time.perf_counter()
+
+print(json.dumps({
+    "import": imported - start,
+    "startup": started - imported,
+    "first request": served - started,
+    "status": status,
+}))
+"""
+
+
+def cold_start(path: str) -> dict:
+    """Timings of one fresh interpreter, in seconds."""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, common.ROOT, path],
+        env=os.environ,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/departments", help="the first request")
+    args = parser.parse_args()
+
+    from scripts.database import Base, engine
+    Base.metadata.drop_all(bind=engine)
+
+    # the first start creates the schema, the others only check it
+    first = cold_start(args.path)
+    runs = [cold_start(args.path) for _ in range(args.runs)]
+
+    print(f"{'':<16} {'empty db':>10} {'median of ' + str(args.runs):>14}")
+    for step in ("import", "startup", "first request"):
+        median = statistics.median(run[step] for run in runs)
+        print(f"{step:<16} {first[step] * 1000:>7.1f} ms {median * 1000:>11.1f} ms")
+
+    statuses = {run["status"] for run in runs} | {first["status"]}
+    print(f"first request statuses: {sorted(statuses)}")
+
+    # after one call each, so statement compilation is not timed
+    repeat = 200
+    create_tables()
+    init_db()
+
+    _, seconds = common.timed(lambda: [create_tables() for _ in range(repeat)])
+    print(f"create_all on existing tables {seconds / repeat * 1000:>7.2f} ms")
+    _, seconds = common.timed(lambda: [init_db() for _ in range(repeat)])
+    print(f"schema version check          {seconds / repeat * 1000:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Times a student's subject list for a growing number of enrollments,
+straight from `SQLRepository.get_subject_by_student` and through the
+cache in `Getter.get_subjects_by_student`, and checks the db read stays
+a single query.
+
+    python -m benchmarks.student_subjects --calls 1000
+
+Exits non-zero if any lookup issues more than one statement, which is
+how an N+1 regression on this read path shows up.
+"""
+import argparse
+import sys
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from scripts import models
+from business import Getter
+
+ENROLLMENTS = [0, 1, 10, 100]
+
+
+def seed(repo):
+    """One department and teacher, max(ENROLLMENTS) subjects, and one
+    student per entry of ENROLLMENTS enrolled in that many subjects."""
+    db = repo.db
+    subjects = max(ENROLLMENTS)
+
+    db.add(models.Department(id=1, dept_name="Department"))
+    db.add(models.Teacher(id=1, teacher_name="Teacher", email="teacher@email.com", dept_id=1))
+    db.add_all(
+        models.Subject(id=i, subj_name=f"Subject {i}", description="", dept_id=1, teacher_id=1)
+        for i in range(1, subjects + 1)
+    )
+
+    for student_id, enrollments in enumerate(ENROLLMENTS, start=1):
+        db.add(models.Student(id=student_id, std_name=f"Student {student_id}",
+                              email=f"student.{student_id}@email.com", dept_id=1))
+        db.add_all(
+            models.Enrollment(student_id=student_id, subject_id=i)
+            for i in range(1, enrollments + 1)
+        )
+
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    common.reset_db()
+    repo = common.make_repo()
+    seed(repo)
+    getter = Getter(repo)
+    failed = False
+
+    for student_id, enrollments in enumerate(ENROLLMENTS, start=1):
+        with common.count_queries() as queries:
+            _, seconds = common.timed(
+                lambda: [repo.get_subject_by_student(student_id) for _ in range(args.calls)]
+            )
+
+        _, cached_seconds = common.timed(
+            lambda: [getter.get_subjects_by_student(student_id) for _ in range(args.calls)]
+        )
+
+        per_call = queries.count / args.calls
+        failed |= per_call > 1
+        print(
+            f"{enrollments:>4} subjects: {args.calls / seconds:>8,.0f} calls/s uncached, "
+            f"{per_call:g} queries/call, {args.calls / cached_seconds:>10,.0f} calls/s cached"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Times the students-of-a-subject lookups, a count and a first and
+a middle page, with and without the enrollments' subject index.
+
+    python -m benchmarks.subject_students --students 500000 --per-student 4
+
+The enrollments are bulk loaded without the index, measured, then
+measured again once the index is built.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from sqlalchemy import insert
+
+from scripts import models
+from scripts.database import engine
+
+
+def load(students: int, subjects: int, per_student: int, seed: int, batch: int = 50_000):
+    """Inserts the students, the subjects and `per_student`
+    random enrollments each, in large multi-row inserts."""
+    rng = random.Random(seed)
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Department), [{"id": 1, "dept_name": "Benchmarks"}])
+        conn.execute(insert(models.Subject), [
+            {"id": id, "subj_name": f"Subject {id}", "dept_id": 1}
+            for id in range(1, subjects + 1)
+        ])
+
+        for start in range(1, students + 1, batch):
+            ids = range(start, min(start + batch, students + 1))
+
+            conn.execute(insert(models.Student), [
+                {"id": id, "std_name": f"Student {id}", "email": f"student.{id}@email.com", "dept_id": 1}
+                for id in ids
+            ])
+            conn.execute(insert(models.Enrollment), [
+                {"student_id": id, "subject_id": subject_id}
+                for id in ids
+                for subject_id in rng.sample(range(1, subjects + 1), per_student)
+            ])
+
+
+def measure(subject_ids: list, middle: int) -> dict:
+    """Median milliseconds of each lookup over the subjects."""
+    repo = common.make_repo()
+    timings = {"count": [], "first page": [], "middle page": []}
+
+    for subject_id in subject_ids:
+        for name, lookup in (
+            ("count", lambda: repo.count_students_by_subject(subject_id)),
+            ("first page", lambda: repo.get_students_by_subject(subject_id, limit=100)),
+            ("middle page", lambda: repo.get_students_by_subject(subject_id, after=middle, limit=100)),
+        ):
+            start = time.perf_counter()
+            lookup()
+            timings[name].append((time.perf_counter() - start) * 1000)
+
+    repo.db.close()
+    return {name: statistics.median(values) for name, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500_000)
+    parser.add_argument("--subjects", type=int, default=500)
+    parser.add_argument("--per-student", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = next(
+        index for index in models.Enrollment.__table__.indexes
+        if index.name == "ix_enrollments_subject_id"
+    )
+
+    common.reset_db()
+    index.drop(bind=engine)
+
+    _, seconds = common.timed(load, args.students, args.subjects, args.per_student, args.seed)
+    enrollments = args.students * args.per_student
+    common.report("load enrollments", seconds, enrollments)
+
+    subject_ids = random.Random(args.seed).sample(range(1, args.subjects + 1), args.lookups)
+    middle = args.students // 2
+
+    without = measure(subject_ids, middle)
+
+    _, seconds = common.timed(index.create, bind=engine)
+    print(f"index built in {seconds:.2f} s")
+
+    with_index = measure(subject_ids, middle)
+
+    print(f"\n{enrollments:,} enrollments, median of {args.lookups} subjects")
+    print(f"{'':<14} {'no index':>12} {'index':>12} {'speedup':>9}")
+    for name in without:
+        print(
+            f"{name:<14} {without[name]:>9.2f} ms {with_index[name]:>9.2f} ms "
+            f"{without[name] / with_index[name]:>8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,616 @@
+"""Times every `SQLRepository` method and every service operation
+at several data sizes and saves the results as JSON, so two runs
+can be compared for regressions.
+
+    python -m benchmarks.suite run --sizes 1000 10000 --output base.json
+    python -m benchmarks.suite run --sizes 1000 10000 --output new.json
+    python -m benchmarks.suite compare base.json new.json --threshold 0.2
+
+Each size is seeded with that many students, each enrolled in one
+subject, through the bulk CSV upload. For every case the suite reports
+ops/sec, statements per op and the peak Python memory of one op.
+Cases that consume rows (deletes, enrollments) insert their own
+fixture rows first, untimed, so the seeded data stays the same size.
+Set `DATABASE_URL` to run against MySQL instead of SQLite.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from sqlalchemy import func, insert, select
+
+from benchmarks import common
+
+common.use_sqlite("suite.db")
+
+from scripts import models, schemas
+from scripts.database import engine
+from crud import SQLRepository
+from cache import SUBJECTS_CACHE
+from business import Uploader, Getter, Setter, Deleter, Exporter
+
+# rows per call for the operations that take a batch
+BATCH = 100
+
+# ops run under tracemalloc after the timed ones
+MEMORY_OPS = 3
+
+# name, op(repo, arg), prepare(ctx, n) -> n args, most ops per run
+Case = namedtuple("Case", "name op prepare max_ops")
+
+CASES = []
+
+
+class Context:
+    """The seeded size, a seeded rng and a supply of unused names."""
+
+    def __init__(self, repo, size: int, seed: int = 0):
+        self.repo = repo
+        self.size = size
+        self.random = random.Random(seed)
+        self.counter = 0
+
+    def students(self, n: int):
+        """n random seeded student ids."""
+        return [self.random.randint(1, self.size) for _ in range(n)]
+
+    def unique(self, n: int):
+        """n numbers never handed out before in this run."""
+        start = self.counter
+        self.counter += n
+        return list(range(start, start + n))
+
+    def next_student_id(self) -> int:
+        return (self.repo.db.scalar(select(func.max(models.Student.id))) or 0) + 1
+
+    def fresh_students(self, n: int, enroll: bool = True):
+        """Inserts n new students, enrolled in one subject each,
+        and returns their (student_id, subject_id) pairs."""
+        db = self.repo.db
+        first = self.next_student_id()
+        ids = range(first, first + n)
+
+        db.execute(insert(models.Student), [
+            {"id": i, "std_name": f"Fixture {i}", "email": f"fixture.{i}@email.com", "dept_id": 1}
+            for i in ids
+        ])
+        pairs = [(i, i % 500 + 1) for i in ids]
+        if enroll:
+            db.execute(insert(models.Enrollment), [
+                {"student_id": student, "subject_id": subject} for student, subject in pairs
+            ])
+        db.commit()
+        return pairs
+
+    def fresh_jobs(self, n: int, status: str = "queued", owner: str = None):
+        """Inserts n jobs that never run and returns their ids."""
+        db = self.repo.db
+        ids = [f"bench-{i}" for i in self.unique(n)]
+
+        db.execute(insert(models.IngestJob), [
+            {"id": i, "format": "csv", "status": status, "path": f"{i}.csv",
+             "owner": owner, "heartbeat_at": datetime.datetime.utcnow()}
+            for i in ids
+        ])
+        db.commit()
+        return ids
+
+    def fresh_claims(self, n: int):
+        """Inserts n running upload claims of "bench" and returns their keys."""
+        db = self.repo.db
+        keys = [f"key:bench-{i}" for i in self.unique(n)]
+
+        db.execute(insert(models.UploadRecord), [
+            {"key": key, "format": "csv", "status": "running",
+             "owner": "bench", "heartbeat_at": datetime.datetime.utcnow()}
+            for key in keys
+        ])
+        db.commit()
+        return keys
+
+
+def case(name: str, prepare=None, max_ops: int = None):
+    """Registers a benchmark case; `prepare` defaults to random students."""
+    def register(op):
+        CASES.append(Case(name, op, prepare or (lambda ctx, n: ctx.students(n)), max_ops))
+        return op
+    return register
+
+
+def drain(chunks):
+    for _ in chunks:
+        pass
+
+
+def subject_of(student_id: int) -> int:
+    """The subject `common.roster_rows` enrolls a seeded student in."""
+    return (student_id - 1) % 500 + 1
+
+
+def chunks(items, size: int = BATCH):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def new_students(ctx, n):
+    return [
+        schemas.StudentCreate(
+            std_name=f"New {i}", email=f"new.{i}@email.com", dept_id=1
+        )
+        for i in ctx.unique(n)
+    ]
+
+
+def roster_file(ctx, n):
+    """n roster CSVs of BATCH new students in seeded subjects,
+    numbered with the ids the uploads will give them."""
+    files = []
+    first = ctx.next_student_id()
+    for numbers in chunks(list(range(first, first + n * BATCH))):
+        rows = []
+        for number, row in zip(numbers, common.roster_rows(BATCH)):
+            row[8:] = [number, f"Upload {number}", f"upload.{number}@email.com"]
+            rows.append(row)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(common.ROSTER_HEADER)
+        writer.writerows(rows)
+        files.append(buffer.getvalue().encode())
+    return files
+
+
+def json_file(ctx, n):
+    """n JSON arrays of BATCH new students."""
+    return [
+        json.dumps([
+            {"std_name": f"Json {i}", "email": f"json.{i}@email.com", "dept_id": 1}
+            for i in numbers
+        ]).encode()
+        for numbers in chunks(ctx.unique(n * BATCH))
+    ]
+
+
+def summary_scope(student: int) -> str:
+    return ("subjects", "teachers", "departments")[student % 3]
+
+
+def update_items(ctx, n):
+    """n update requests renaming BATCH random students each."""
+    return [
+        [
+            {"table_name": "students", "record_id": student, "updated_fields": {"std_name": f"Renamed {number}"}}
+            for student, number in zip(ctx.students(BATCH), ctx.unique(BATCH))
+        ]
+        for _ in range(n)
+    ]
+
+
+# SQLRepository
+
+@case("repo.create_department", lambda ctx, n: ctx.unique(n))
+def _(repo, i):
+    repo.create_department(schemas.DepartmentCreate(dept_name=f"Dept {i}"))
+
+
+@case("repo.create_teacher", lambda ctx, n: ctx.unique(n))
+def _(repo, i):
+    repo.create_teacher(schemas.TeacherCreate(
+        teacher_name=f"Teacher {i}", email=f"new.teacher.{i}@email.com", dept_id=1
+    ))
+
+
+@case("repo.create_subject", lambda ctx, n: ctx.unique(n))
+def _(repo, i):
+    repo.create_subject(schemas.SubjectCreate(
+        subj_name=f"Subj {i}", description="benchmark", dept_id=1, teacher_id=1
+    ))
+
+
+@case("repo.create_student", new_students)
+def _(repo, student):
+    repo.create_student(student)
+
+
+@case("repo.create_enrollment", lambda ctx, n: ctx.fresh_students(n, enroll=False))
+def _(repo, pair):
+    repo.create_enrollment(schemas.EnrollmentCreate(student_id=pair[0], subject_id=pair[1]))
+
+
+@case("repo.get_student_by_email")
+def _(repo, student):
+    repo.get_student_by_email(f"student.{student}@email.com")
+
+
+@case("repo.get_student_by_id")
+def _(repo, student):
+    repo.get_student_by_id(student)
+
+
+@case("repo.get_department")
+def _(repo, student):
+    repo.get_department(f"Department {(student - 1) % 10 + 1}")
+
+
+@case("repo.get_teacher")
+def _(repo, student):
+    repo.get_teacher(f"teacher.{(student - 1) % 200 + 1}@email.com")
+
+
+@case("repo.get_subject")
+def _(repo, student):
+    repo.get_subject(f"Subject {subject_of(student)}")
+
+
+@case("repo.get_department_id")
+def _(repo, student):
+    repo.get_department_id(f"Department {(student - 1) % 10 + 1}")
+
+
+@case("repo.get_teacher_id")
+def _(repo, student):
+    repo.get_teacher_id(f"teacher.{(student - 1) % 200 + 1}@email.com")
+
+
+@case("repo.get_subject_id")
+def _(repo, student):
+    repo.get_subject_id(f"Subject {subject_of(student)}")
+
+
+@case("repo.get_enrollment")
+def _(repo, student):
+    repo.get_enrollment(student, subject_of(student))
+
+
+@case("repo.get_subject_by_student")
+def _(repo, student):
+    repo.get_subject_by_student(student)
+
+
+@case("repo.get_students_by_subject")
+def _(repo, student):
+    repo.get_students_by_subject(subject_of(student), limit=BATCH)
+
+
+@case("repo.count_students_by_subject")
+def _(repo, student):
+    repo.count_students_by_subject(subject_of(student))
+
+
+@case("repo.update_records", update_items)
+def _(repo, items):
+    repo.update_records(schemas.UpdateRequest(updates=items))
+
+
+@case("repo.delete_enrollments", lambda ctx, n: ctx.fresh_students(n))
+def _(repo, pair):
+    repo.delete_enrollments(*pair)
+
+
+@case("repo.get_enrollment_pairs")
+def _(repo, student):
+    repo.get_enrollment_pairs(student_id=student)
+
+
+@case("repo.delete_enrollment_pairs", lambda ctx, n: chunks(ctx.fresh_students(n * BATCH)))
+def _(repo, pairs):
+    repo.delete_enrollment_pairs(pairs)
+
+
+@case("repo.delete_student", lambda ctx, n: [s for s, _ in ctx.fresh_students(n, enroll=False)])
+def _(repo, student):
+    repo.delete_student(student)
+
+
+@case("repo.list_records")
+def _(repo, student):
+    repo.list_records(models.Student, {}, (student,), BATCH)
+
+
+@case("repo.stream_records", max_ops=5)
+def _(repo, _):
+    drain(repo.stream_records(models.Student, {"id": "id", "std_name": "std_name"}, 1000))
+
+
+@case("repo.stream_roster", max_ops=5)
+def _(repo, _):
+    drain(repo.stream_roster(1000))
+
+
+@case("repo.get_ids_by_key", lambda ctx, n: [ctx.students(BATCH) for _ in range(n)])
+def _(repo, students):
+    repo.get_ids_by_key(models.Subject.subj_name, {f"Subject {subject_of(s)}" for s in students})
+
+
+@case("repo.get_existing_enrollments", lambda ctx, n: [ctx.students(BATCH) for _ in range(n)])
+def _(repo, students):
+    repo.get_existing_enrollments([(s, subject_of(s)) for s in students])
+
+
+@case("repo.bulk_create", lambda ctx, n: chunks(new_students(ctx, n * BATCH)))
+def _(repo, students):
+    repo.bulk_create([
+        (models.Student, models.Student.email, {student.email: student for student in students})
+    ])
+
+
+@case("repo.create_job", lambda ctx, n: ctx.unique(n))
+def _(repo, i):
+    repo.create_job(f"new-{i}", "csv", f"new-{i}.csv")
+
+
+@case("repo.get_job", lambda ctx, n: ctx.fresh_jobs(n))
+def _(repo, job_id):
+    repo.get_job(job_id)
+
+
+@case("repo.get_job_ids")
+def _(repo, _):
+    repo.get_job_ids(["queued"])
+
+
+@case("repo.update_job", lambda ctx, n: ctx.fresh_jobs(n))
+def _(repo, job_id):
+    repo.update_job(job_id, expected_status=["queued"], status="running",
+                    owner="bench", heartbeat_at=datetime.datetime.utcnow())
+
+
+@case("repo.heartbeat_jobs", lambda ctx, n: ctx.fresh_jobs(n, "running", "bench"))
+def _(repo, _):
+    repo.heartbeat_jobs("bench")
+
+
+@case("repo.requeue_stale_jobs", lambda ctx, n: ctx.fresh_jobs(n, "running", "stale"))
+def _(repo, _):
+    repo.requeue_stale_jobs(datetime.datetime.utcnow())
+
+
+@case("repo.claim_upload", lambda ctx, n: ctx.unique(n))
+def _(repo, i):
+    repo.claim_upload(f"key:new-{i}", "csv", owner="bench")
+
+
+@case("repo.finish_upload", lambda ctx, n: ctx.fresh_claims(n))
+def _(repo, key):
+    repo.finish_upload(key, {"success": True, "message": "Data Inserted Successfully!"})
+
+
+@case("repo.release_upload", lambda ctx, n: ctx.fresh_claims(n))
+def _(repo, key):
+    repo.release_upload(key, "bench")
+
+
+@case("repo.renew_upload_claims", lambda ctx, n: ctx.fresh_claims(n))
+def _(repo, _):
+    repo.renew_upload_claims("bench")
+
+
+@case("repo.list_summary")
+def _(repo, student):
+    repo.list_summary(summary_scope(student), limit=BATCH)
+
+
+@case("repo.rebuild_summary", max_ops=5)
+def _(repo, _):
+    repo.rebuild_summary()
+
+
+@case("repo.get_summary_drift", max_ops=5)
+def _(repo, _):
+    repo.get_summary_drift()
+
+
+# services
+
+@case("Uploader.upload_csv", roster_file)
+def _(repo, content):
+    Uploader(repo).upload_csv(io.BytesIO(content))
+
+
+@case("Uploader.upload_json", json_file)
+def _(repo, content):
+    Uploader(repo).upload_json(io.BytesIO(content))
+
+
+@case("Getter.get_subjects_by_student")
+def _(repo, student):
+    Getter(repo).get_subjects_by_student(student)
+
+
+@case("Getter.list_records")
+def _(repo, student):
+    Getter(repo).list_records("students", {}, str(student), BATCH)
+
+
+@case("Getter.list_students_by_subject")
+def _(repo, student):
+    Getter(repo).list_students_by_subject(subject_of(student), limit=BATCH)
+
+
+@case("Getter.list_summary")
+def _(repo, student):
+    Getter(repo).list_summary(summary_scope(student), limit=BATCH)
+
+
+@case("Setter.update_record", lambda ctx, n: [json.dumps(items).encode() for items in update_items(ctx, n)])
+def _(repo, content):
+    Setter(repo).update_record(io.BytesIO(content))
+
+
+@case("Deleter.delete_enrollment", lambda ctx, n: ctx.fresh_students(n))
+def _(repo, pair):
+    Deleter(repo).delete_enrollment(*pair)
+
+
+@case("Deleter.delete_enrollments", lambda ctx, n: chunks(ctx.fresh_students(n * BATCH)))
+def _(repo, pairs):
+    Deleter(repo).delete_enrollments(schemas.EnrollmentDeleteRequest(enrollments=[
+        {"student_id": student, "subject_id": subject} for student, subject in pairs
+    ]))
+
+
+@case("Exporter.export", max_ops=5)
+def _(repo, _):
+    drain(Exporter(repo).export("students", "csv"))
+
+
+def clear_caches():
+    """Every case starts from cold in-process caches."""
+    SUBJECTS_CACHE.backend.clear()
+    for table in ("departments", "teachers", "subjects"):
+        SQLRepository.key_index.invalidate(table)
+
+
+def measure(case: Case, ctx: Context, ops: int) -> dict:
+    if case.max_ops:
+        ops = min(ops, case.max_ops)
+
+    clear_caches()
+    args = case.prepare(ctx, ops + MEMORY_OPS)
+    repo = common.make_repo()
+
+    with common.count_queries() as queries:
+        start = time.perf_counter()
+        for arg in args[:ops]:
+            case.op(repo, arg)
+        seconds = time.perf_counter() - start
+
+    peak = 0
+    tracemalloc.start()
+    for arg in args[ops:]:
+        tracemalloc.reset_peak()
+        case.op(repo, arg)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    repo.db.close()
+
+    return {
+        "case": case.name,
+        "size": ctx.size,
+        "ops": ops,
+        "seconds": seconds,
+        "ops_per_sec": ops / seconds,
+        "queries_per_op": queries.count / ops,
+        "peak_kb": peak / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=common.ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    cases = [c for c in CASES if not args.filter or any(f in c.name for f in args.filter)]
+    results = []
+
+    for size in args.sizes:
+        common.reset_db()
+        _, seconds = common.timed(
+            Uploader(common.make_repo()).upload_csv, io.BytesIO(common.generate_csv(size))
+        )
+        print(f"\nseeded {size:,} students in {seconds:.1f} s")
+        print(f"{'case':<34} {'ops/s':>10} {'queries/op':>11} {'peak KB':>9}")
+
+        seed_repo = common.make_repo()
+        ctx = Context(seed_repo, size, args.seed)
+
+        for c in cases:
+            result = measure(c, ctx, args.ops)
+            results.append(result)
+            print(
+                f"{c.name:<34} {result['ops_per_sec']:>10,.1f}"
+                f" {result['queries_per_op']:>11.2f} {result['peak_kb']:>9.1f}"
+            )
+
+        seed_repo.db.close()
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ops": args.ops,
+            "sizes": args.sizes,
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w") as file:
+        json.dump(output, file, indent=2)
+    print(f"\nsaved {len(results)} results to {args.output}")
+
+
+def compare(args):
+    """Exits 1 if any case lost more than `threshold` of its ops/sec
+    or sends at least half a statement per op more than the baseline
+    (smaller differences are cache hits varying with the sample)."""
+    with open(args.baseline) as file:
+        baseline = {(r["case"], r["size"]): r for r in json.load(file)["results"]}
+    with open(args.current) as file:
+        current = json.load(file)["results"]
+
+    regressions = 0
+    print(f"{'case':<34} {'size':>8} {'old ops/s':>10} {'new ops/s':>10} {'change':>8}  queries/op")
+
+    for new in current:
+        old = baseline.get((new["case"], new["size"]))
+        if old is None:
+            continue
+
+        change = new["ops_per_sec"] / old["ops_per_sec"] - 1
+        slower = change < -args.threshold
+        more_queries = new["queries_per_op"] - old["queries_per_op"] >= 0.5
+        flag = "  REGRESSION" if slower or more_queries else ""
+        regressions += bool(flag)
+
+        print(
+            f"{new['case']:<34} {new['size']:>8,} {old['ops_per_sec']:>10,.1f}"
+            f" {new['ops_per_sec']:>10,.1f} {change:>+8.1%}"
+            f"  {old['queries_per_op']:.2f} -> {new['queries_per_op']:.2f}{flag}"
+        )
+
+    print(f"\n{regressions} regression(s) at a {args.threshold:.0%} threshold")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time every case and save the results")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    run_parser.add_argument("--ops", type=int, default=100, help="timed ops per case")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--filter", nargs="*", help="only cases whose name contains one of these")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="largest accepted drop in ops/sec, e.g. 0.2 for 20%%")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
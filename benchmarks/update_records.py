@@ -0,0 +1,70 @@
+"""Times `Setter.update_record` on a generated update file against the
+previous one-UPDATE-per-item path.
+
+    python -m benchmarks.update_records --items 10000
+
+The file mixes renames of students, teachers and subjects, so it forms
+a few groups of identical column sets.
+"""
+import argparse
+import io
+import json
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from scripts import models
+from business import Uploader, Setter
+
+STUDENTS = 10_000
+
+
+def update_file(items: int) -> bytes:
+    """`items` update entries cycling over the seeded rows."""
+    updates = []
+
+    for i in range(items):
+        if i % 10 == 0:
+            table, record_id, fields = "teachers", i % 200 + 1, {"teacher_name": f"Teacher {i}"}
+        elif i % 10 == 1:
+            table, record_id, fields = "subjects", i % 500 + 1, {"description": f"Updated {i}"}
+        else:
+            table, record_id, fields = "students", i % STUDENTS + 1, {"std_name": f"Student {i}", "dept_id": i % 10 + 1}
+
+        updates.append({"table_name": table, "record_id": record_id, "updated_fields": fields})
+
+    return json.dumps(updates).encode("utf-8")
+
+
+def per_item_update(repo, file_content: bytes):
+    """The original engine: one query(...).update(...) per item."""
+    for item in json.loads(file_content):
+        model = models.TABLES[item["table_name"]]
+        repo.db.query(model).filter(model.id == item["record_id"]).update(item["updated_fields"])
+
+    repo.db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    args = parser.parse_args()
+
+    common.reset_db()
+    Uploader(common.make_repo()).upload_csv(io.BytesIO(common.generate_csv(STUDENTS)))
+    content = update_file(args.items)
+
+    with common.count_queries() as queries:
+        result, seconds = common.timed(Setter(common.make_repo()).update_record, io.BytesIO(content))
+    common.report("grouped executemany", seconds, args.items)
+    print(f"{'':<24} {queries.count} statements, updated {result['updated']}")
+
+    with common.count_queries() as queries:
+        _, seconds = common.timed(per_item_update, common.make_repo(), content)
+    common.report("one UPDATE per item", seconds, args.items)
+    print(f"{'':<24} {queries.count} statements")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares the bulk CSV ingest of `Uploader.upload_csv` with the
+previous row-by-row path on a generated roster file.
+
+    python -m benchmarks.upload_csv --rows 100000
+"""
+import argparse
+import csv
+import io
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from scripts import schemas
+from business import Uploader
+
+
+def row_by_row_upload(repo, file_content: bytes):
+    """The original ingest: a lookup and a committed insert per cell."""
+    for row in csv.DictReader(io.StringIO(file_content.decode("utf-8"))):
+        if not repo.get_department(dept_name=row["dept_name"]):
+            repo.create_department(schemas.DepartmentCreate(dept_name=row["dept_name"]))
+
+        if not repo.get_teacher(email=row["teacher_email"]):
+            repo.create_teacher(schemas.TeacherCreate(
+                email=row["teacher_email"],
+                teacher_name=row["teacher_name"],
+                dept_id=row["dept_id"]
+            ))
+
+        if not repo.get_subject(subj_name=row["subj_name"]):
+            repo.create_subject(schemas.SubjectCreate(
+                subj_name=row["subj_name"],
+                description=row["description"],
+                dept_id=row["dept_id"],
+                teacher_id=row["teacher_id"]
+            ))
+
+        if not repo.get_student_by_id(id=row["std_id"]):
+            repo.create_student(schemas.StudentCreate(
+                email=row["std_email"],
+                std_name=row["std_name"],
+                dept_id=row["dept_id"]
+            ))
+
+        if not repo.get_enrollment(student_id=row["std_id"], subject_id=row["subj_id"]):
+            repo.create_enrollment(schemas.EnrollmentCreate(
+                student_id=row["std_id"],
+                subject_id=row["subj_id"]
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--skip-row-by-row", action="store_true")
+    args = parser.parse_args()
+
+    content = common.generate_csv(args.rows)
+    print(f"{args.rows:,} rows, {len(content) / 2**20:.1f} MB on {common.use_sqlite()}")
+
+    repo = common.make_repo()
+
+    common.reset_db()
+    result, seconds = common.timed(
+        Uploader(repo).upload_csv, io.BytesIO(content), chunk_size=args.chunk_size
+    )
+    common.report("bulk upload_csv", seconds, args.rows)
+    print(result["counts"])
+
+    # everything exists now, so this measures the skip path
+    result, seconds = common.timed(
+        Uploader(repo).upload_csv, io.BytesIO(content), chunk_size=args.chunk_size
+    )
+    common.report("bulk re-upload", seconds, args.rows)
+    print(result["counts"])
+
+    if not args.skip_row_by_row:
+        common.reset_db()
+        _, seconds = common.timed(row_by_row_upload, repo, content)
+        common.report("row-by-row", seconds, args.rows)
+
+
+if __name__ == "__main__":
+    main()
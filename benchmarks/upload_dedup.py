@@ -0,0 +1,59 @@
+"""Times POST /upload of a roster file the first time, again with the
+stored result replayed by its digest, and again with `upload_dedup`
+off, when the rows are looked up and skipped one chunk at a time.
+
+    python -m benchmarks.upload_dedup --students 20000
+
+The replay still reads the whole file once to hash it.
+"""
+import argparse
+import io
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from fastapi.testclient import TestClient
+
+from config import settings
+from scripts.generate_data import School, write_csv
+
+import main as app_main
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    file = io.StringIO()
+    write_csv(School(students=args.students, seed=args.seed), file)
+    data = file.getvalue().encode()
+    rows = data.count(b"\n") - 1
+
+    common.reset_db()
+
+    def upload():
+        response = client.post("/upload?format=csv", files={"file": ("roster.csv", data)})
+        assert response.status_code == 200, response.text
+        return response
+
+    with TestClient(app_main.app) as client:
+        response, seconds = common.timed(upload)
+        common.report("first upload", seconds, rows)
+        first = seconds
+
+        response, seconds = common.timed(upload)
+        assert response.headers.get("Idempotent-Replayed") == "true"
+        common.report("replayed by digest", seconds, rows)
+        print(f"{'':<24} {first / seconds:>10.1f} x first upload")
+
+        settings.upload_dedup = False
+        response, seconds = common.timed(upload)
+        assert response.headers.get("Idempotent-Replayed") is None
+        common.report("dedup off, all skipped", seconds, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Measures the peak RSS of a CSV upload for growing file sizes,
+streamed from disk versus read into memory first.
+
+    python -m benchmarks.upload_memory --sizes 10 100 1000
+
+Each upload runs in its own process so the peaks do not mix.
+"""
+import argparse
+import csv
+import io
+import os
+import resource
+import subprocess
+import sys
+
+from benchmarks import common
+from scripts.generate_data import ROSTER_HEADER, School, iter_roster
+
+
+def write_roster(path: str, megabytes: int):
+    """Streams generated roster rows to `path` until it reaches the size."""
+    target = megabytes * 2**20
+
+    # rows are ~200 bytes and students have ~3, generate a few more than needed
+    school = School(students=max(target // 400, 500))
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(ROSTER_HEADER)
+
+        for row in iter_roster(school):
+            writer.writerow(row)
+            if file.tell() >= target:
+                break
+
+
+def upload(path: str, mode: str):
+    """Child process: uploads the file and prints its peak RSS in MB."""
+    common.use_sqlite(f"benchmark_{os.getpid()}.db")
+    common.reset_db()
+
+    from business import Uploader
+
+    with open(path, "rb") as file:
+        stream = file if mode == "stream" else io.BytesIO(file.read())
+        result, seconds = common.timed(Uploader(common.make_repo()).upload_csv, stream)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rows = result["counts"]["enrollments"]["inserted"]
+    print(f"{peak:.0f} {seconds:.1f} {rows}")
+
+    os.remove(common.use_sqlite().removeprefix("sqlite:///"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="file sizes in MB")
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return upload(*args.child)
+
+    print(f"{'file':>8} {'mode':>8} {'rows':>10} {'seconds':>8} {'peak RSS':>10}")
+
+    for size in args.sizes:
+        path = os.path.join(common.ROOT, f"benchmark_{size}MB.csv")
+        write_roster(path, size)
+
+        for mode in ("stream", "read"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.upload_memory", "--child", path, mode],
+                cwd=common.ROOT, capture_output=True, text=True, check=True
+            ).stdout.split()
+            peak, seconds, rows = output[-3:]
+            print(f"{size:>6}MB {mode:>8} {int(rows):>10,} {seconds:>8} {peak:>8}MB")
+
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
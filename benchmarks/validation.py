@@ -0,0 +1,124 @@
+"""Compares building the records of roster chunks with a pydantic
+model per record, as `Uploader.upload_csv` did, against validating the
+chunks column by column with `BatchValidator` and constructing the
+records unvalidated, and times collecting the errors of a bad file.
+
+    python -m benchmarks.validation --students 20000 --chunk-size 1000
+
+Only the CPU work is timed, the db is not touched.
+"""
+import argparse
+import csv
+import io
+
+from benchmarks import common
+
+common.use_sqlite()
+
+from business import CSV_ENTITIES, batched
+from scripts import schemas
+from scripts.generate_data import School, write_csv
+from validation import BatchValidator
+
+# what CSV_ENTITIES built before, validating every record
+PYDANTIC_BUILDERS = {
+    'dept_name': lambda row: schemas.DepartmentCreate(dept_name=row.get('dept_name')),
+    'teacher_name': lambda row: schemas.TeacherCreate(
+        email=row.get('teacher_email'), teacher_name=row.get('teacher_name'), dept_id=row.get('dept_id')
+    ),
+    'subj_name': lambda row: schemas.SubjectCreate(
+        subj_name=row.get('subj_name'), description=row.get('description'),
+        dept_id=row.get('dept_id'), teacher_id=row.get('teacher_id')
+    ),
+    'std_name': lambda row: schemas.StudentCreate(
+        email=row.get('std_email'), std_name=row.get('std_name'), dept_id=row.get('dept_id')
+    ),
+}
+
+
+def read_chunks(text: str, chunk_size: int) -> list:
+    return list(batched(csv.DictReader(io.StringIO(text)), chunk_size))
+
+
+def build_pydantic(chunks: list):
+    for chunk in chunks:
+        for column, model, key_column, get_key, build in CSV_ENTITIES:
+            records = {}
+            for row in chunk:
+                key = row.get(column) if column != 'std_name' else int(row.get('std_id'))
+                if key not in records:
+                    records[key] = PYDANTIC_BUILDERS[column](row)
+
+        for row in chunk:
+            schemas.EnrollmentCreate(student_id=row.get('std_id'), subject_id=row.get('subj_id'))
+
+
+def build_columnar(chunks: list, header: list):
+    validator = BatchValidator(header)
+    first_row = 1
+    errors = []
+
+    for chunk in chunks:
+        chunk_errors = validator.validate(chunk, first_row)
+        first_row += len(chunk)
+
+        if chunk_errors:
+            errors += chunk_errors
+            continue
+
+        for column, model, key_column, get_key, build in CSV_ENTITIES:
+            records = {}
+            for row in chunk:
+                key = get_key(row)
+                if key not in records:
+                    records[key] = build(row)
+
+        for row in chunk:
+            schemas.EnrollmentCreate.construct(student_id=row['std_id'], subject_id=row['subj_id'])
+
+    return errors
+
+
+def corrupt(text: str, every: int) -> str:
+    """Blanks the student email of every `every`th row."""
+    lines = text.splitlines()
+    for index in range(every, len(lines), every):
+        fields = lines[index].split(',')
+        fields[-1] = 'no email'
+        lines[index] = ','.join(fields)
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--bad-every", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    file = io.StringIO()
+    write_csv(School(students=args.students, seed=args.seed), file)
+    text = file.getvalue()
+    header = text.split('\n', 1)[0].split(',')
+    rows = text.count('\n') - 1
+
+    print(f"{rows:,} rows in chunks of {args.chunk_size:,}")
+
+    # the rows are converted in place, so each run reads them afresh
+    _, seconds = common.timed(build_pydantic, read_chunks(text, args.chunk_size))
+    common.report("pydantic per record", seconds, rows)
+    baseline = seconds
+
+    _, seconds = common.timed(build_columnar, read_chunks(text, args.chunk_size), header)
+    common.report("columnar + construct", seconds, rows)
+    print(f"{'':<24} {baseline / seconds:>10.2f} x pydantic")
+
+    bad = read_chunks(corrupt(text, args.bad_every), args.chunk_size)
+    errors, seconds = common.timed(build_columnar, bad, header)
+    common.report("columnar, bad file", seconds, rows)
+    print(f"{len(errors):,} errors collected, the first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
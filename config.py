@@ -1,30 +1,111 @@
-"""This module extracts information from our `.env` file.
-"""
-import os
-
-# pydantic used for data validation: https://pydantic-docs.helpmanual.io/
-from pydantic import BaseSettings
-
-
-def return_full_path(filename: str = ".env") -> str:
-    """Uses os to return the correct path of the `.env` file."""
-    absolute_path = os.path.abspath(__file__)
-    directory_name = os.path.dirname(absolute_path)
-    full_path = os.path.join(directory_name, filename)
-    return full_path
-
-
-class Settings(BaseSettings):
-    """Uses pydantic to define settings for project."""
-
-    db_user: str
-    db_pass: str
-    db_host: str
-    db_name: str
-
-    class Config:
-        env_file = return_full_path(".env")
-
-
-# Create instance of `Settings` class
+"""This module extracts information from our `.env` file.
+"""
+import os
+from typing import Optional
+
+# pydantic used for data validation: https://pydantic-docs.helpmanual.io/
+from pydantic import BaseSettings
+
+
+def return_full_path(filename: str = ".env") -> str:
+    """Uses os to return the correct path of the `.env` file."""
+    absolute_path = os.path.abspath(__file__)
+    directory_name = os.path.dirname(absolute_path)
+    full_path = os.path.join(directory_name, filename)
+    return full_path
+
+
+class Settings(BaseSettings):
+    """Uses pydantic to define settings for project."""
+
+    db_user: str
+    db_pass: str
+    db_host: str
+    db_name: str
+
+    # overrides the MySQL url built from the fields above,
+    # e.g. `sqlite:///school.db` for local runs and benchmarks
+    database_url: Optional[str] = None
+
+    # connection pool of the engine, one connection per concurrent request
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 3600
+    db_pool_pre_ping: bool = True
+
+    # serve the endpoints through the async engine
+    # (aiomysql, or aiosqlite for a sqlite database_url)
+    db_async: bool = False
+
+    # create the missing tables at startup when the schema version is
+    # behind the models; turn off where migrations own the schema
+    db_create_schema: bool = True
+
+    # in-process cache of each student's subjects, 0 entries disables it
+    cache_max_size: int = 10000
+    cache_ttl: float = 60
+
+    # natural key -> id index of departments, teachers and subjects,
+    # most keys held per table, and seconds a key is trusted: a key
+    # renamed by another worker is only seen here once it expires
+    key_index_max_size: int = 10000
+    key_index_ttl: float = 30
+
+    # number of rows committed per transaction by the bulk ingest
+    ingest_chunk_size: int = 1000
+
+    # number of enrollments removed per transaction by the bulk delete
+    delete_chunk_size: int = 1000
+
+    # processes parsing a CSV upload in parallel, 1 ingests it in the request
+    ingest_workers: int = 1
+
+    # bytes read from an uploaded file at a time
+    upload_read_size: int = 1024 * 1024
+
+    # invalid rows listed in the 400 response of a CSV upload
+    upload_max_errors: int = 100
+
+    # ids, natural keys and row keys a CSV upload remembers per kind to
+    # catch their reuse anywhere in the file; past that, only within a chunk
+    upload_unique_keys: int = 100_000
+
+    # answer an upload whose bytes match an earlier successful one with
+    # that upload's result; an Idempotency-Key header works either way
+    upload_dedup: bool = True
+
+    # encode the JSON responses with orjson instead of the json module
+    orjson_responses: bool = False
+
+    # rows fetched per keyset page by the exports
+    export_batch_size: int = 1000
+
+    # request latency and SQL statement metrics on /metrics and in
+    # the X-DB-Query-Count / X-DB-Time-Ms response headers
+    metrics_enabled: bool = True
+
+    # diagnostic mode: statements slower than slow_query_ms are logged
+    # with their parameters and plan, and requests that run one statement
+    # shape more than n_plus_one_threshold times are logged as N+1
+    db_diagnostics: bool = False
+    slow_query_ms: float = 100
+    n_plus_one_threshold: int = 10
+
+    # background ingest jobs: where uploads are spooled, how many
+    # jobs run at once, and how many errors a job's report keeps
+    job_spool_dir: str = return_full_path("spool")
+    job_workers: int = 2
+    job_max_errors: int = 1000
+
+    # each process marks the jobs and upload claims it holds alive every
+    # heartbeat; a running job or claim whose heartbeat is older than the
+    # lease is taken over
+    job_heartbeat_seconds: float = 10
+    job_lease_seconds: float = 60
+
+    class Config:
+        env_file = return_full_path(".env")
+
+
+# Create instance of `Settings` class
 settings = Settings()
\ No newline at end of file
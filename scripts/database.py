@@ -1,20 +1,89 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
-import sys
-
-sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
-
-from config import settings
-
-# MySQL connector link
-SQLALCHEMY_DATABASE_URL = f"mysql+mysqlconnector://{settings.db_user}:{settings.db_pass}@{settings.db_host}/{settings.db_name}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"ssl_disabled": True})
-
-SessionLocal = sessionmaker(
-    autocommit=False, 
-    autoflush=False, 
-    bind=engine
-)
-
-# used in models.py to define the schema of the db
-Base = declarative_base()
\ No newline at end of file
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+from config import settings
+
+# MySQL connector link, unless another url is configured
+SQLALCHEMY_DATABASE_URL = (
+    settings.database_url
+    or f"mysql+mysqlconnector://{settings.db_user}:{settings.db_pass}@{settings.db_host}/{settings.db_name}"
+)
+
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # the parallel ingest workers write from several processes,
+    # each waits for the file lock instead of failing at once
+    connect_args = {"check_same_thread": False, "timeout": 30}
+    pool_args = {}
+else:
+    connect_args = {"ssl_disabled": True}
+
+    # one connection per concurrent request, tuned from the settings
+    pool_args = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    **pool_args
+)
+
+SessionLocal = sessionmaker(
+    autocommit=False, 
+    autoflush=False, 
+    bind=engine
+)
+
+# the same db through an async driver, see `settings.db_async`
+if settings.db_async:
+    ASYNC_DATABASE_URL = (
+        SQLALCHEMY_DATABASE_URL
+        .replace("sqlite:", "sqlite+aiosqlite:", 1)
+        .replace("mysql+mysqlconnector:", "mysql+aiomysql:", 1)
+    )
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        **pool_args
+    )
+
+    AsyncSessionLocal = async_sessionmaker(
+        autoflush=False,
+        expire_on_commit=False,
+        bind=async_engine
+    )
+
+# used in models.py to define the schema of the db
+Base = declarative_base()
+
+
+def get_db():
+    """
+    Provides a SQLAlchemy database session for one request,
+    closing it and returning its connection to the pool afterwards.
+    """
+
+    db = SessionLocal()
+
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """
+    Provides an async SQLAlchemy database session for one request
+    when `settings.db_async` is on.
+    """
+
+    async with AsyncSessionLocal() as db:
+        yield db
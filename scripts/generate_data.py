@@ -0,0 +1,379 @@
+"""
+Generates synthetic school datasets for load testing, in the
+formats the `/upload` and `/update` endpoints read:
+
+    python -m scripts.generate_data csv data/roster.csv --students 1000000
+    python -m scripts.generate_data json data/school.json --students 100000
+    python -m scripts.generate_data update data/updates.json --updates 10000
+
+The same arguments and seed always produce the same school. Rows are
+written as they are generated, so the output can be far larger than memory.
+"""
+from functools import cache
+from itertools import accumulate
+from typing import Iterator, TextIO
+import argparse
+import bisect
+import csv
+import json
+import random
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+
+FIRST_NAMES = [
+    "Saif", "Asad", "Hafsa", "Rafia", "Arslan", "Seemab", "Ayesha", "Bilal",
+    "Fatima", "Hamza", "Zainab", "Usman", "Maryam", "Ali", "Sana", "Omar",
+    "Hina", "Imran", "Nadia", "Tariq", "Amna", "Kamran", "Iqra", "Faisal",
+]
+
+LAST_NAMES = [
+    "Ullah", "Malik", "Mumtaz", "Khan", "Latif", "Ahmed", "Hussain", "Raza",
+    "Qureshi", "Sheikh", "Butt", "Chaudhry", "Javed", "Iqbal", "Aslam", "Mirza",
+]
+
+FIELDS = [
+    "Engineering", "Medical", "Computing", "Business", "Law", "Physics",
+    "Chemistry", "Mathematics", "Economics", "Architecture", "Biology", "Arts",
+]
+
+TOPICS = [
+    "Software Engineering", "Artificial Intelligence", "Data Science", "Anatomy",
+    "Calculus", "Linear Algebra", "Thermodynamics", "Microeconomics",
+    "Organic Chemistry", "Genetics", "Contract Law", "Accounting",
+]
+
+# the streams School draws each kind of entity from
+TEACHER, SUBJECT, STUDENT, UPDATES = range(4)
+
+# the roster CSV header read by Uploader.upload_csv
+ROSTER_HEADER = [
+    'dept_id', 'dept_name',
+    'teacher_id', 'teacher_name', 'teacher_email',
+    'subj_id', 'subj_name', 'description',
+    'std_id', 'std_name', 'std_email'
+]
+
+
+class School:
+    """
+    A deterministic synthetic school
+
+    Departments, teachers and subjects are numbered from 1 and dealt
+    round-robin to the departments; every teacher teaches at least one
+    subject of their department. Students enroll only in subjects of
+    their own department, so every roster row is consistent.
+
+    Each entity is drawn from its own seeded generator, so any of them
+    can be produced on its own, in any order, without the others.
+    Departments, teachers and subjects are cached once drawn, students
+    and enrollments are not, so memory does not grow with the students.
+    """
+
+    def __init__(
+            self,
+            departments: int = 10,
+            teachers: int = 200,
+            subjects: int = 500,
+            students: int = 10000,
+            min_enrollments: int = 1,
+            max_enrollments: int = 5,
+            skew: float = 1.0,
+            seed: int = 0
+        ):
+        """
+        Parameters
+        ----------
+        departments, teachers, subjects, students : int
+            how many of each, with
+            departments <= teachers <= subjects <= students
+        min_enrollments, max_enrollments : int
+            the range each student's number of subjects is drawn from,
+            uniformly, capped at the subjects of their department
+        skew : float
+            the Zipf exponent of subject popularity within a
+            department, 0 for uniform
+        seed : int
+            the seed of every generator
+        """
+
+        if not 1 <= departments <= teachers <= subjects <= students:
+            raise ValueError("Expected 1 <= departments <= teachers <= subjects <= students.")
+
+        if not 1 <= min_enrollments <= max_enrollments:
+            raise ValueError("Expected 1 <= min_enrollments <= max_enrollments.")
+
+        self.departments = departments
+        self.teachers = teachers
+        self.subjects = subjects
+        self.students = students
+        self.min_enrollments = min_enrollments
+        self.max_enrollments = max_enrollments
+        self.seed = seed
+
+        # subject ids of each department, and their cumulative popularity
+        self.__dept_subjects = [
+            list(range(dept, subjects + 1, departments))
+            for dept in range(1, departments + 1)
+        ]
+        self.__dept_weights = [
+            list(accumulate(1 / rank ** skew for rank in range(1, len(ids) + 1)))
+            for ids in self.__dept_subjects
+        ]
+
+
+    def __random(self, kind: int, id: int) -> random.Random:
+        """
+        The generator of one entity, independent of all the others
+        """
+
+        return random.Random(((self.seed * 8 + kind) << 40) + id)
+
+
+    def dept_of(self, id: int) -> int:
+        """
+        The department of a teacher or a subject
+        """
+
+        return (id - 1) % self.departments + 1
+
+
+    @cache
+    def department(self, id: int) -> dict:
+        field = FIELDS[(id - 1) % len(FIELDS)]
+        cycle = (id - 1) // len(FIELDS)
+
+        return {"dept_name": f"{field} {cycle + 1}" if cycle else field}
+
+
+    @cache
+    def teacher(self, id: int) -> dict:
+        rng = self.__random(TEACHER, id)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+        return {
+            "teacher_name": f"{first} {last}",
+            "email": f"{first}.{last}.t{id}@email.com".lower(),
+            "dept_id": self.dept_of(id)
+        }
+
+
+    @cache
+    def subject(self, id: int) -> dict:
+        topic = TOPICS[(id - 1) % len(TOPICS)]
+        level = (id - 1) // len(TOPICS) + 101
+
+        # the first subjects introduce every teacher, the rest go
+        # to a random teacher of the same department
+        if id <= self.teachers:
+            teacher_id = id
+        else:
+            teachers = range(self.dept_of(id), self.teachers + 1, self.departments)
+            teacher_id = self.__random(SUBJECT, id).choice(teachers)
+
+        return {
+            "subj_name": f"{topic} {level}",
+            "description": f"{topic} {level} covers the core of {topic.lower()} at level {level}.",
+            "dept_id": self.dept_of(id),
+            "teacher_id": teacher_id
+        }
+
+
+    def student(self, id: int) -> dict:
+        return self.enrolled_student(id)[0]
+
+
+    def enrolled_student(self, id: int) -> tuple:
+        """
+        Draws a student and the subjects they are enrolled in,
+        the subject they introduce first
+
+        Parameters
+        ----------
+        id : int
+            the student's id
+
+        Returns
+        -------
+        student, subject ids : tuple[dict, list[int]]
+        """
+
+        rng = self.__random(STUDENT, id)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+        # the first students introduce every subject
+        if id <= self.subjects:
+            dept_id = self.dept_of(id)
+        else:
+            dept_id = rng.randint(1, self.departments)
+
+        subjects = self.__dept_subjects[dept_id - 1]
+        weights = self.__dept_weights[dept_id - 1]
+
+        count = min(rng.randint(self.min_enrollments, self.max_enrollments), len(subjects))
+        chosen = [id] if id <= self.subjects else []
+
+        while len(chosen) < count:
+            subject = subjects[bisect.bisect(weights, rng.random() * weights[-1])]
+            if subject not in chosen:
+                chosen.append(subject)
+
+        student = {
+            "std_name": f"{first} {last}",
+            "email": f"{first}.{last}.{id}@email.com".lower(),
+            "dept_id": dept_id
+        }
+
+        return student, chosen
+
+
+def iter_roster(school: School) -> Iterator[list]:
+    """
+    Yields one roster row per enrollment, in student order
+
+    upload_csv gives the departments, teachers and subjects their ids
+    in the order they first appear, so the ids yielded are numbered
+    by first appearance too, and match a fresh db.
+    """
+
+    # school id -> id in the file, for each kind
+    numbering = {"dept": {}, "teacher": {}, "subject": {}}
+
+    def number(kind, id):
+        ids = numbering[kind]
+        if id not in ids:
+            ids[id] = len(ids) + 1
+        return ids[id]
+
+    for std_id in range(1, school.students + 1):
+        student, subject_ids = school.enrolled_student(std_id)
+
+        for subj_id in subject_ids:
+            subject = school.subject(subj_id)
+            teacher = school.teacher(subject["teacher_id"])
+            dept_id = subject["dept_id"]
+
+            yield [
+                number("dept", dept_id), school.department(dept_id)["dept_name"],
+                number("teacher", subject["teacher_id"]), teacher["teacher_name"], teacher["email"],
+                number("subject", subj_id), subject["subj_name"], subject["description"],
+                std_id, student["std_name"], student["email"]
+            ]
+
+
+def write_csv(school: School, file: TextIO):
+    """
+    Writes the roster CSV with its header
+    """
+
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(ROSTER_HEADER)
+    writer.writerows(iter_roster(school))
+
+
+def iter_records(school: School) -> Iterator[dict]:
+    """
+    Yields every record in the layout Uploader.upload_json reads,
+    each table after the ones it references
+    """
+
+    for id in range(1, school.departments + 1):
+        yield school.department(id)
+    for id in range(1, school.teachers + 1):
+        yield school.teacher(id)
+    for id in range(1, school.subjects + 1):
+        yield school.subject(id)
+    for id in range(1, school.students + 1):
+        yield school.student(id)
+
+    for id in range(1, school.students + 1):
+        for subj_id in school.enrolled_student(id)[1]:
+            yield {"student_id": id, "subject_id": subj_id}
+
+
+def iter_updates(school: School, updates: int) -> Iterator[dict]:
+    """
+    Yields update items in the layout Setter.update_record reads,
+    renaming students and teachers and rewriting subject descriptions
+    """
+
+    rng = random.Random(((school.seed * 8 + UPDATES) << 40))
+
+    for n in range(updates):
+        table = rng.choices(["students", "teachers", "subjects"], weights=[8, 1, 1])[0]
+
+        if table == "students":
+            record_id = rng.randint(1, school.students)
+            fields = {"std_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"}
+        elif table == "teachers":
+            record_id = rng.randint(1, school.teachers)
+            fields = {"teacher_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"}
+        else:
+            record_id = rng.randint(1, school.subjects)
+            fields = {"description": f"Revision {n} of the course outline."}
+
+        yield {"table_name": table, "record_id": record_id, "updated_fields": fields}
+
+
+def write_json_array(items: Iterator[dict], file: TextIO):
+    """
+    Writes the items as a JSON array, one item per line
+    """
+
+    file.write("[")
+
+    for n, item in enumerate(items):
+        file.write(",\n" if n else "\n")
+        file.write(json.dumps(item))
+
+    file.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("format", choices=["csv", "json", "update"])
+    parser.add_argument("output", help="the file to write, - for stdout")
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--teachers", type=int, default=200)
+    parser.add_argument("--subjects", type=int, default=500)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--min-enrollments", type=int, default=1)
+    parser.add_argument("--max-enrollments", type=int, default=5)
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="Zipf exponent of subject popularity, 0 for uniform")
+    parser.add_argument("--updates", type=int, default=1000,
+                        help="update items, for the update format")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        school = School(
+            departments=args.departments,
+            teachers=args.teachers,
+            subjects=args.subjects,
+            students=args.students,
+            min_enrollments=args.min_enrollments,
+            max_enrollments=args.max_enrollments,
+            skew=args.skew,
+            seed=args.seed
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    file = sys.stdout if args.output == "-" else open(args.output, "w", newline="", buffering=2**20)
+
+    try:
+        if args.format == "csv":
+            write_csv(school, file)
+        elif args.format == "json":
+            write_json_array(iter_records(school), file)
+        else:
+            write_json_array(iter_updates(school, args.updates), file)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == "__main__":
+    main()
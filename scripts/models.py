@@ -1,68 +1,149 @@
-from sqlalchemy.orm import relationship
-from sqlalchemy import (
-    Column,
-    Integer,
-    String,
-    ForeignKey
-)
-
-from scripts.database import Base
-
-
-class Student(Base):
-    __tablename__ = 'students'
-
-    id = Column(Integer, primary_key=True, autoincrement='auto')
-    std_name = Column(String(30))
-    email = Column(String(50), unique=True, index=True)
-    dept_id = Column(Integer, ForeignKey('departments.id'))
-    
-    department = relationship('Department', back_populates='students')
-    subjects = relationship('Enrollment', back_populates='students')
-
-
-class Teacher(Base):
-    __tablename__ = 'teachers'
-
-    id = Column(Integer, primary_key=True, autoincrement='auto')
-    teacher_name = Column(String(30))
-    email = Column(String(50), unique=True, index=True)
-    dept_id = Column(Integer, ForeignKey('departments.id'))
-    
-    department = relationship('Department', back_populates='teachers')
-    subjects = relationship('Subject', back_populates='teacher')
-
-
-class Department(Base):
-    __tablename__ = 'departments'
-
-    id = Column(Integer, primary_key=True, autoincrement='auto')
-    dept_name = Column(String(30), unique=True, index=True)
-
-    students = relationship('Student', back_populates='department')
-    teachers = relationship('Teacher', back_populates='department')
-    subjects = relationship('Subject', back_populates='department')
-
-
-class Subject(Base):
-    __tablename__ = 'subjects'
-
-    id = Column(Integer, primary_key=True, autoincrement='auto')
-    subj_name = Column(String(30), unique=True, index=True)
-    dept_id = Column(Integer, ForeignKey('departments.id'))
-    teacher_id = Column(Integer, ForeignKey('teachers.id'))
-    description = Column(String(256))
-
-    students = relationship('Enrollment', back_populates='subjects')
-    teacher = relationship('Teacher', back_populates='subjects')
-    department = relationship('Department', back_populates='subjects')
-
-
-class Enrollment(Base):
-    __tablename__ = 'enrollments'
-
-    student_id = Column(Integer, ForeignKey('students.id'), primary_key=True)
-    subject_id = Column(Integer, ForeignKey('subjects.id'), primary_key=True)
-
-    students = relationship('Student', back_populates='subjects')
-    subjects = relationship('Subject', back_populates='students')
+from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    JSON,
+    ForeignKey,
+    Index
+)
+from datetime import datetime
+
+from scripts.database import Base
+
+# bumped with every change to the tables, see crud.init_db
+SCHEMA_VERSION = 6
+
+
+class Student(Base):
+    __tablename__ = 'students'
+
+    id = Column(Integer, primary_key=True, autoincrement='auto')
+    std_name = Column(String(30))
+    email = Column(String(50), unique=True, index=True)
+    dept_id = Column(Integer, ForeignKey('departments.id'), index=True)
+    
+    department = relationship('Department', back_populates='students')
+    subjects = relationship('Enrollment', back_populates='students')
+
+
+class Teacher(Base):
+    __tablename__ = 'teachers'
+
+    id = Column(Integer, primary_key=True, autoincrement='auto')
+    teacher_name = Column(String(30))
+    email = Column(String(50), unique=True, index=True)
+    dept_id = Column(Integer, ForeignKey('departments.id'), index=True)
+    
+    department = relationship('Department', back_populates='teachers')
+    subjects = relationship('Subject', back_populates='teacher')
+
+
+class Department(Base):
+    __tablename__ = 'departments'
+
+    id = Column(Integer, primary_key=True, autoincrement='auto')
+    dept_name = Column(String(30), unique=True, index=True)
+
+    students = relationship('Student', back_populates='department')
+    teachers = relationship('Teacher', back_populates='department')
+    subjects = relationship('Subject', back_populates='department')
+
+
+class Subject(Base):
+    __tablename__ = 'subjects'
+
+    id = Column(Integer, primary_key=True, autoincrement='auto')
+    subj_name = Column(String(30), unique=True, index=True)
+    dept_id = Column(Integer, ForeignKey('departments.id'), index=True)
+    teacher_id = Column(Integer, ForeignKey('teachers.id'), index=True)
+    description = Column(String(256))
+
+    students = relationship('Enrollment', back_populates='subjects')
+    teacher = relationship('Teacher', back_populates='subjects')
+    department = relationship('Department', back_populates='subjects')
+
+
+class Enrollment(Base):
+    __tablename__ = 'enrollments'
+
+    student_id = Column(Integer, ForeignKey('students.id'), primary_key=True)
+    subject_id = Column(Integer, ForeignKey('subjects.id'), primary_key=True)
+
+    # the primary key only serves lookups by student; the students of a
+    # subject are found, counted and paged in student order from this
+    __table_args__ = (
+        Index('ix_enrollments_subject_id', 'subject_id', 'student_id'),
+    )
+
+    students = relationship('Student', back_populates='subjects')
+    subjects = relationship('Subject', back_populates='students')
+
+
+class EnrollmentSummary(Base):
+    __tablename__ = 'enrollment_summary'
+
+    # 'subjects', 'teachers' or 'departments'
+    scope = Column(String(11), primary_key=True)
+    scope_id = Column(Integer, primary_key=True, autoincrement=False)
+    # enrollments in the subject, or in the subjects of the teacher or department
+    enrollments = Column(Integer, default=0, nullable=False)
+    # students of the department, 0 for the other scopes
+    students = Column(Integer, default=0, nullable=False)
+
+
+class IngestJob(Base):
+    __tablename__ = 'ingest_jobs'
+
+    id = Column(String(32), primary_key=True)
+    format = Column(String(4))
+    # queued, running, cancelling, cancelled, done or failed
+    status = Column(String(10), index=True)
+    path = Column(String(256))
+    # rows (or JSON elements) read so far, where a resumed job restarts
+    rows_parsed = Column(Integer, default=0)
+    rows_failed = Column(Integer, default=0)
+    # table -> {inserted, skipped}
+    counts = Column(JSON, default=dict)
+    errors = Column(JSON, default=list)
+    error_count = Column(Integer, default=0)
+    # the JobManager running the job and when it last reported alive,
+    # a running job whose heartbeat is older than the lease is taken over
+    owner = Column(String(64))
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UploadRecord(Base):
+    __tablename__ = 'upload_records'
+
+    # 'sha256:<format>:<digest of the uploaded bytes>' or 'key:<Idempotency-Key>'
+    key = Column(String(300), primary_key=True)
+    format = Column(String(4))
+    digest = Column(String(64))
+    # running while the upload is processed, then done; failed uploads are not kept
+    status = Column(String(10))
+    # the response of the upload, returned again for a repeat of it
+    result = Column(JSON)
+    # the process running the upload and when it last renewed the claim,
+    # a running claim whose heartbeat is older than the lease is released
+    owner = Column(String(64))
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+
+    # one row, the SCHEMA_VERSION the tables were created at
+    version = Column(Integer, primary_key=True, autoincrement=False)
+
+
+# table name -> model, for requests that name the table to act on
+TABLES = {
+    model.__tablename__: model
+    for model in (Student, Teacher, Department, Subject, Enrollment)
+}
@@ -1,107 +1,184 @@
-from pydantic import BaseModel, validator
-from typing import List, Dict, Any
-
-
-class DepartmentBase(BaseModel):
-    dept_name: str
-
-class DepartmentCreate(DepartmentBase):
-    pass
-
-class Department(DepartmentBase):
-    id : int
-
-    class Config:
-        orm_mode = True
-
-
-class StudentBase(BaseModel):
-    email: str
-    std_name: str
-    dept_id: int
-
-    @validator('email')
-    def email_must_be_valid_email(cls, value):
-        
-        if '@' not in value:
-            raise ValueError('Invalid email format')
-        
-        return value
-
-
-class StudentCreate(StudentBase):
-    pass
-
-class Student(StudentBase):
-    id: int
-
-    class Config:
-        orm_mode = True
-
-
-class TeacherBase(BaseModel):
-    email: str
-    teacher_name: str
-    dept_id: int
-
-    @validator('email')
-    def email_must_be_valid_email(cls, value):
-        
-        if '@' not in value:
-            raise ValueError('Invalid email format')
-        
-        return value
-
-
-class TeacherCreate(TeacherBase):
-    pass
-
-class Teacher(TeacherBase):
-    id: int
-
-    class Config:
-        orm_mode = True
-
-
-class SubjectBase(BaseModel):
-    subj_name: str
-    description: str
-    dept_id: int
-    teacher_id: int
-    
-
-class SubjectCreate(SubjectBase):
-    pass
-
-class Subject(SubjectBase):
-    id: int
-
-    class Config:
-        orm_mode = True
-
-
-class EnrollmentBase(BaseModel):
-    student_id: int
-    subject_id: int
-
-class EnrollmentCreate(EnrollmentBase):
-    pass
-
-class Enrollment(EnrollmentBase):
-    pass
-
-    class Config:
-        orm_mode = True
-
-
-class UpdateItem(BaseModel):
-    table_name: str
-    record_id: int
-    updated_fields: Dict[str, Any]
-
-class UpdateRequest(BaseModel):
-    updates: List[UpdateItem]
-
-class UpdateResponse(BaseModel):
-    success: bool
-    message: str
\ No newline at end of file
+from pydantic import BaseModel, validator
+from pydantic.generics import GenericModel
+from typing import List, Dict, Any, Union, Optional, Generic, TypeVar
+from datetime import datetime
+
+
+class DepartmentBase(BaseModel):
+    dept_name: str
+
+class DepartmentCreate(DepartmentBase):
+    pass
+
+# the read models serve the rows as they are stored, where every
+# column but the id is nullable, e.g. a teacher_id set to null by /update
+class Department(DepartmentBase):
+    id : int
+    dept_name: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class StudentBase(BaseModel):
+    email: str
+    std_name: str
+    dept_id: int
+
+    @validator('email')
+    def email_must_be_valid_email(cls, value):
+        
+        if value is not None and '@' not in value:
+            raise ValueError('Invalid email format')
+        
+        return value
+
+
+class StudentCreate(StudentBase):
+    pass
+
+class Student(StudentBase):
+    id: int
+    email: Optional[str]
+    std_name: Optional[str]
+    dept_id: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+class TeacherBase(BaseModel):
+    email: str
+    teacher_name: str
+    dept_id: int
+
+    @validator('email')
+    def email_must_be_valid_email(cls, value):
+        
+        if value is not None and '@' not in value:
+            raise ValueError('Invalid email format')
+        
+        return value
+
+
+class TeacherCreate(TeacherBase):
+    pass
+
+class Teacher(TeacherBase):
+    id: int
+    email: Optional[str]
+    teacher_name: Optional[str]
+    dept_id: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+class SubjectBase(BaseModel):
+    subj_name: str
+    description: str
+    dept_id: int
+    teacher_id: int
+    
+
+class SubjectCreate(SubjectBase):
+    pass
+
+class Subject(SubjectBase):
+    id: int
+    subj_name: Optional[str]
+    description: Optional[str]
+    dept_id: Optional[int]
+    teacher_id: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+class EnrollmentBase(BaseModel):
+    student_id: int
+    subject_id: int
+
+class EnrollmentCreate(EnrollmentBase):
+    pass
+
+class Enrollment(EnrollmentBase):
+    pass
+
+    class Config:
+        orm_mode = True
+
+
+Item = TypeVar('Item')
+
+class Page(GenericModel, Generic[Item]):
+    items: List[Item]
+    # pass as `after` to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
+class SubjectStudentCount(BaseModel):
+    subject_id: int
+    count: int
+
+
+class EnrollmentSummary(BaseModel):
+    id: int
+    name: Optional[str]
+    # enrollments in the subject, or in the subjects of the teacher or department
+    enrollments: int
+    # students of the department, None for subjects and teachers
+    students: Optional[int]
+
+
+class EnrollmentDeleteRequest(BaseModel):
+    # exactly one of the three selects what to delete
+    enrollments: Optional[List[EnrollmentBase]] = None
+    student_id: Optional[int] = None
+    subject_id: Optional[int] = None
+
+class EnrollmentDeleteResponse(BaseModel):
+    success: bool
+    message: str
+    deleted: int
+    missing: List[EnrollmentBase]
+
+
+class UpdateItem(BaseModel):
+    table_name: str
+    # the primary key, a list in column order for composite keys
+    # e.g. [student_id, subject_id] for enrollments
+    record_id: Union[int, List[int]]
+    updated_fields: Dict[str, Any]
+
+class UpdateRequest(BaseModel):
+    updates: List[UpdateItem]
+
+class UpdateResponse(BaseModel):
+    success: bool
+    message: str
+
+
+class IngestJob(BaseModel):
+    id: str
+    format: str
+    status: str
+    rows_parsed: int
+    rows_failed: int
+    # table -> {inserted, skipped}
+    counts: Dict[str, Dict[str, int]]
+    error_count: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class IngestJobErrors(BaseModel):
+    id: str
+    error_count: int
+    # the first `settings.job_max_errors` errors, with their rows
+    errors: List[Dict[str, Any]]
+
+    class Config:
+        orm_mode = True
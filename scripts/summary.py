@@ -0,0 +1,53 @@
+"""
+Rebuilds or checks the enrollment summary behind the `/stats` endpoints:
+
+    python -m scripts.summary rebuild
+    python -m scripts.summary check
+
+`rebuild` recounts every row from the enrollments and students.
+`check` compares the summary with a live GROUP BY, lists the counts
+that differ and exits with status 1 if any do.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, "C:\\NUST\\Jobs\\Sila")
+
+# the app modules import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from scripts.database import SessionLocal
+from crud import SQLRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        repo = SQLRepository(db)
+
+        if args.command == "rebuild":
+            success, rows = repo.rebuild_summary()
+
+            if not success:
+                sys.exit(f"Rebuild failed: {rows}")
+
+            print(f"Rebuilt {rows} summary rows.")
+            return
+
+        drift = repo.get_summary_drift()
+
+    for row in drift:
+        print(f"{row['scope']} {row['scope_id']} {row['column']}: stored {row['stored']}, actual {row['actual']}")
+
+    if drift:
+        sys.exit(f"{len(drift)} summary counts differ from the enrollments, run `rebuild`.")
+
+    print("The summary matches the enrollments.")
+
+
+if __name__ == "__main__":
+    main()
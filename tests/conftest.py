@@ -0,0 +1,152 @@
+"""Shared fixtures of the tests.
+
+The tests run against a throwaway SQLite file, emptied before every
+test; the endpoint tests run the app once on the sync engine and once
+on the async one (aiosqlite). Run them from the project root:
+
+    python -m pytest -q tests
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the app modules import each other by bare name
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+# read by config, so set before anything from `app` or `scripts` is imported
+TMP_DIR = tempfile.mkdtemp(prefix="school-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}"
+# opens the async engine next to the sync one, `client` picks the mode
+os.environ["DB_ASYNC"] = "true"
+os.environ["JOB_SPOOL_DIR"] = os.path.join(TMP_DIR, "spool")
+
+from sqlalchemy import event, insert
+
+from config import settings
+from scripts import database, models
+from scripts.database import Base, SessionLocal, engine
+from cache import SUBJECTS_CACHE
+from crud import SQLRepository
+
+# the size of the `school` fixture
+DEPARTMENTS = 3
+TEACHERS = 6
+SUBJECTS = 10
+STUDENTS = 50
+
+
+# the engines the app sends its statements through
+ENGINES = [engine, database.async_engine.sync_engine]
+
+
+def pytest_sessionfinish(session, exitstatus):
+    for sync_engine in ENGINES:
+        sync_engine.dispose()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def empty_db():
+    """Recreates every table and forgets the cached rows."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    SUBJECTS_CACHE.invalidate_all()
+    for table in ("departments", "teachers", "subjects"):
+        SQLRepository.key_index.invalidate(table)
+
+    yield
+
+
+@pytest.fixture
+def repo():
+    """A repository on its own session, as a request would get."""
+    with SessionLocal() as db:
+        yield SQLRepository(db)
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements sent to the db during the test, in order."""
+    sent = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        sent.append(statement)
+
+    for sync_engine in ENGINES:
+        event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield sent
+    for sync_engine in ENGINES:
+        event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def load_main(db_async: bool):
+    """A copy of the main module, its app serving the endpoints
+    through the async engine when `db_async` is on."""
+    name = "main_async" if db_async else "main"
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "app", "main.py"))
+    module = sys.modules[name] = importlib.util.module_from_spec(spec)
+
+    previous, settings.db_async = settings.db_async, db_async
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        settings.db_async = previous
+
+    return module
+
+
+@pytest.fixture(scope="session", params=["sync", "async"])
+def app(request):
+    """The app on the sync engine, then on the async one."""
+    return load_main(request.param == "async").app
+
+
+@pytest.fixture
+def client(app):
+    """The app with its lifespan run."""
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+def enrolled_subjects(student_id: int) -> list:
+    """The subject ids of a student of the `school` fixture, in order."""
+    return sorted({(student_id - 1) % SUBJECTS + 1, student_id % SUBJECTS + 1})
+
+
+@pytest.fixture
+def school():
+    """Inserts a small school where every student takes two subjects,
+    see `enrolled_subjects`."""
+    with engine.begin() as conn:
+        conn.execute(insert(models.Department), [
+            {"id": id, "dept_name": f"Department {id}"} for id in range(1, DEPARTMENTS + 1)
+        ])
+        conn.execute(insert(models.Teacher), [
+            {"id": id, "teacher_name": f"Teacher {id}", "email": f"teacher.{id}@email.com",
+             "dept_id": id % DEPARTMENTS + 1}
+            for id in range(1, TEACHERS + 1)
+        ])
+        conn.execute(insert(models.Subject), [
+            {"id": id, "subj_name": f"Subject {id}", "description": f"Description of subject {id}",
+             "dept_id": id % DEPARTMENTS + 1, "teacher_id": id % TEACHERS + 1}
+            for id in range(1, SUBJECTS + 1)
+        ])
+        conn.execute(insert(models.Student), [
+            {"id": id, "std_name": f"Student {id}", "email": f"student.{id}@email.com",
+             "dept_id": id % DEPARTMENTS + 1}
+            for id in range(1, STUDENTS + 1)
+        ])
+        conn.execute(insert(models.Enrollment), [
+            {"student_id": student_id, "subject_id": subject_id}
+            for student_id in range(1, STUDENTS + 1)
+            for subject_id in enrolled_subjects(student_id)
+        ])
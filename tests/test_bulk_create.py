@@ -0,0 +1,38 @@
+"""bulk_create(ignore_conflicts=True) skips only the rows whose primary key
+a racing worker inserted since the lookup, and counts only the rows it
+inserted."""
+import pytest
+
+from scripts import models, schemas
+
+
+def student(id, email):
+    return schemas.Student.construct(id=id, std_name=f"Student {id}", email=email, dept_id=1)
+
+
+@pytest.fixture
+def racing(repo, school, monkeypatch):
+    """The repo with its lookup missing every row, as if they were
+    inserted by another worker after it."""
+    monkeypatch.setattr(repo, "get_ids_by_key", lambda key_column, records: {})
+    return repo
+
+
+def test_skips_and_does_not_count_existing_ids(racing):
+    records = {1: student(1, "student.1@email.com"), 100: student(100, "new.100@email.com")}
+
+    success, inserted = racing.bulk_create([(models.Student, models.Student.id, records)], ignore_conflicts=True)
+
+    assert success, inserted
+    assert inserted == {"students": 1}
+    assert racing.get_student_by_id(100) is not None
+
+
+def test_fails_on_another_unique_key(racing):
+    records = {100: student(100, "student.1@email.com")}
+
+    success, message = racing.bulk_create([(models.Student, models.Student.id, records)], ignore_conflicts=True)
+
+    assert not success
+    assert "UNIQUE" in message
+    assert racing.get_student_by_id(100) is None
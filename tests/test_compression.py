@@ -0,0 +1,125 @@
+"""gzip and zstd uploads are told apart by their Content-Encoding or by
+their first bytes, and a corrupt or cut short one is a 400, never a
+500 or a silently shorter file."""
+import gzip
+import io
+import json
+
+import pytest
+import zstandard
+
+from parsers import DecompressionError, open_decompressed
+
+DEPARTMENTS = [f"Department {id}" for id in range(1, 201)]
+
+CSV = ("dept_id,dept_name\n" + "".join(
+    f"{id},{name}\n" for id, name in enumerate(DEPARTMENTS, 1)
+)).encode()
+
+JSON = json.dumps([{"dept_name": name} for name in DEPARTMENTS]).encode()
+
+COMPRESS = {
+    "gzip": gzip.compress,
+    "zstd": lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+def upload(client, format, data, content_encoding=None):
+    headers = {"Content-Encoding": content_encoding} if content_encoding else {}
+    return client.post(f"/upload?format={format}", files={"file": ("upload", data, "application/octet-stream", headers)})
+
+
+def departments(client):
+    return [item["dept_name"] for item in client.get("/departments?limit=1000").json()["items"]]
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+@pytest.mark.parametrize("format, data", [("csv", CSV), ("json", JSON)])
+@pytest.mark.parametrize("by", ["magic bytes", "content encoding"])
+def test_compressed_upload(client, compression, format, data, by):
+    response = upload(client, format, COMPRESS[compression](data), compression if by == "content encoding" else None)
+
+    assert response.status_code == 200, response.text
+    assert departments(client) == DEPARTMENTS
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+def test_parallel_compressed_upload(client, compression):
+    response = client.post("/upload?format=csv&workers=2", files={"file": ("upload", COMPRESS[compression](CSV))})
+
+    assert response.status_code == 200, response.text
+    assert departments(client) == DEPARTMENTS
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+def test_concatenated_frames(compression):
+    half = len(CSV) // 2
+    data = COMPRESS[compression](CSV[:half]) + COMPRESS[compression](CSV[half:])
+
+    assert open_decompressed(io.BytesIO(data)).read() == CSV
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+def test_small_reads(compression):
+    reader = open_decompressed(io.BytesIO(COMPRESS[compression](CSV)))
+
+    assert b"".join(iter(lambda: reader.read(7), b"")) == CSV
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+@pytest.mark.parametrize("format, data", [("csv", CSV), ("json", JSON)])
+def test_truncated_upload(client, compression, format, data):
+    response = upload(client, format, COMPRESS[compression](data)[:-10])
+
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == f"The {compression} stream ends early, the upload was cut short."
+
+
+@pytest.mark.parametrize("compression", COMPRESS)
+@pytest.mark.parametrize("format, data", [("csv", CSV), ("json", JSON)])
+def test_corrupt_upload(client, compression, format, data):
+    compressed = COMPRESS[compression](data)
+    # keeps the magic bytes, so the compression is still detected
+    corrupt = compressed[:12] + bytes(b ^ 0xff for b in compressed[12:40]) + compressed[40:]
+
+    response = upload(client, format, corrupt)
+
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"].startswith(f"The {compression} stream is corrupt")
+
+
+def test_trailing_garbage():
+    with pytest.raises(DecompressionError, match="corrupt"):
+        open_decompressed(io.BytesIO(gzip.compress(CSV) + b"garbage")).read()
+
+
+def test_content_encoding_of_a_plain_file(client):
+    response = upload(client, "csv", CSV, "gzip")
+
+    assert response.status_code == 400, response.text
+    assert departments(client) == []
+
+
+@pytest.mark.parametrize("content_encoding", ["br", "deflate"])
+def test_unsupported_content_encoding(client, content_encoding):
+    response = upload(client, "csv", CSV, content_encoding)
+
+    assert response.status_code == 415, response.text
+    assert f"Unsupported Content-Encoding '{content_encoding}'" in response.json()["detail"]
+
+
+def test_identity_content_encoding(client):
+    response = upload(client, "csv", CSV, "identity")
+
+    assert response.status_code == 200, response.text
+    assert departments(client) == DEPARTMENTS
+
+
+def test_compressed_update(client):
+    upload(client, "csv", CSV)
+    updates = [{"table_name": "departments", "record_id": 1, "updated_fields": {"dept_name": "Renamed"}}]
+
+    response = client.put("/update", files={"file": ("updates", COMPRESS["zstd"](json.dumps(updates).encode()))})
+
+    assert response.status_code == 200, response.text
+    assert departments(client)[0] == "Renamed"
@@ -0,0 +1,33 @@
+"""Concurrent requests must each get their own session: a session shared
+between requests shows up as errors or as another student's subjects."""
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import STUDENTS, enrolled_subjects
+
+READERS = 32
+REQUESTS = 400
+
+
+def test_concurrent_subject_reads(client, school):
+    def fetch(student_id):
+        response = client.get(f"/students/{student_id}/subjects")
+        return student_id, response.status_code, response.json()
+
+    student_ids = [i % STUDENTS + 1 for i in range(REQUESTS)]
+
+    with ThreadPoolExecutor(max_workers=READERS) as pool:
+        results = list(pool.map(fetch, student_ids))
+
+    for student_id, status, subjects in results:
+        assert status == 200, (student_id, subjects)
+        assert sorted(subject["id"] for subject in subjects) == enrolled_subjects(student_id)
+
+
+def test_concurrent_reads_of_a_missing_student(client, school):
+    def fetch(student_id):
+        return client.get(f"/students/{student_id}/subjects").status_code
+
+    with ThreadPoolExecutor(max_workers=READERS) as pool:
+        statuses = list(pool.map(fetch, [STUDENTS + 1] * READERS + [1] * READERS))
+
+    assert statuses == [400] * READERS + [200] * READERS
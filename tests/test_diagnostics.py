@@ -0,0 +1,92 @@
+"""Strict `diagnose` blocks around the hot paths: a path that starts
+issuing a statement per item raises NPlusOneError and fails the build,
+while the chunk loops of the bulk paths are batched on purpose and pass."""
+import csv
+import io
+
+import pytest
+
+from business import ROSTER_COLUMNS, Deleter, Exporter, Getter, Uploader
+from diagnostics import NPlusOneError, diagnose, intentional_batch
+from scripts import schemas
+from scripts.database import engine
+from conftest import enrolled_subjects
+
+# each read path runs every statement shape once
+READ_PATHS = {
+    "subjects of a student": lambda repo: Getter(repo).get_subjects_by_student(1),
+    "page of students": lambda repo: Getter(repo).list_records('students', {}, None, 20),
+    "page of enrollments": lambda repo: Getter(repo).list_records('enrollments', {}, '1,1', 20),
+    "students of a subject": lambda repo: Getter(repo).list_students_by_subject(1, None, 20),
+    "students in a subject": lambda repo: Getter(repo).list_students_by_subject(1, count_only=True),
+    "page of the summary": lambda repo: Getter(repo).list_summary('departments', None, 20),
+}
+
+
+def strict(n_plus_one_threshold: int = None):
+    return diagnose(engine, strict=True, n_plus_one_threshold=n_plus_one_threshold)
+
+
+@pytest.mark.parametrize("read", READ_PATHS.values(), ids=READ_PATHS.keys())
+def test_read_path_runs_each_statement_once(repo, school, read):
+    with strict(n_plus_one_threshold=1):
+        read(repo)
+
+
+def test_query_per_item_is_caught(repo, school):
+    with pytest.raises(NPlusOneError):
+        with strict(n_plus_one_threshold=3):
+            for student_id in range(1, 6):
+                repo.get_student_by_id(id=student_id)
+
+
+def test_query_per_item_inside_a_batch_is_caught(repo, school):
+    with pytest.raises(NPlusOneError):
+        with strict(n_plus_one_threshold=3):
+            with intentional_batch("chunk"):
+                for student_id in range(1, 6):
+                    repo.get_student_by_id(id=student_id)
+
+
+def roster(students: int) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ROSTER_COLUMNS)
+
+    for student_id in range(1, students + 1):
+        for subject_id in enrolled_subjects(student_id):
+            writer.writerow([
+                1, "Department 1", 1, "Teacher 1", "teacher.1@email.com",
+                subject_id, f"Subject {subject_id}", f"Description of subject {subject_id}",
+                student_id, f"Student {student_id}", f"student.{student_id}@email.com"
+            ])
+
+    return buffer.getvalue().encode()
+
+
+def test_chunked_upload_is_not_n_plus_one(repo):
+    # 100 rows in 20 chunks, each a lookup and an insert per table
+    with strict():
+        result = Uploader(repo).upload_csv(io.BytesIO(roster(50)), chunk_size=5)
+
+    assert result["counts"]["enrollments"] == {"inserted": 100, "skipped": 0}
+
+
+def test_paged_export_is_not_n_plus_one(repo, school):
+    with strict():
+        content = b''.join(Exporter(repo).export('roster', 'csv', batch_size=5))
+
+    assert content.count(b'\n') == 101
+
+
+def test_chunked_delete_is_not_n_plus_one(repo, school):
+    request = schemas.EnrollmentDeleteRequest(enrollments=[
+        {"student_id": student_id, "subject_id": subject_id}
+        for student_id in range(1, 51)
+        for subject_id in enrolled_subjects(student_id)
+    ])
+
+    with strict():
+        result = Deleter(repo).delete_enrollments(request, chunk_size=5)
+
+    assert result["deleted"] == 100
@@ -0,0 +1,72 @@
+"""init_db creates a fresh db, leaves a current one alone, upgrades one
+that is behind and refuses a newer one; a db it can not read is an
+error, not a missing schema."""
+import pytest
+from sqlalchemy import create_engine, delete, exc, insert, inspect, text
+
+import crud
+from crud import get_schema_version, init_db
+from scripts import models
+from scripts.database import Base, engine
+
+
+def set_version(version):
+    with engine.begin() as conn:
+        conn.execute(delete(models.SchemaVersion))
+        conn.execute(insert(models.SchemaVersion).values(version=version))
+
+
+def test_fresh_db():
+    Base.metadata.drop_all(bind=engine)
+    assert get_schema_version() is None
+
+    init_db(create_schema=True)
+
+    assert get_schema_version() == models.SCHEMA_VERSION
+    assert set(inspect(engine).get_table_names()) >= set(Base.metadata.tables)
+
+
+def test_current_version_is_left_alone(statements):
+    set_version(models.SCHEMA_VERSION)
+    statements.clear()
+
+    init_db(create_schema=True)
+
+    assert not [statement for statement in statements if not statement.lstrip().startswith(("SELECT", "PRAGMA"))]
+
+
+def test_version_behind_is_upgraded():
+    set_version(models.SCHEMA_VERSION - 1)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE upload_records DROP COLUMN owner"))
+
+    init_db(create_schema=True)
+
+    assert get_schema_version() == models.SCHEMA_VERSION
+    assert "owner" in {column["name"] for column in inspect(engine).get_columns("upload_records")}
+
+
+def test_version_behind_without_create_schema():
+    set_version(models.SCHEMA_VERSION - 1)
+
+    with pytest.raises(RuntimeError, match="Migrate it"):
+        init_db(create_schema=False)
+
+
+def test_newer_version():
+    set_version(models.SCHEMA_VERSION + 1)
+
+    with pytest.raises(RuntimeError, match="newer"):
+        init_db(create_schema=True)
+
+
+def test_unreadable_db_is_an_error(monkeypatch, tmp_path):
+    unreachable = create_engine(f"sqlite:///{tmp_path / 'missing' / 'school.db'}")
+    monkeypatch.setattr(crud, "engine", unreachable)
+    created = []
+    monkeypatch.setattr(crud, "create_tables", lambda: created.append(True))
+
+    with pytest.raises(exc.OperationalError):
+        init_db(create_schema=True)
+
+    assert created == []
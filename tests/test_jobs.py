@@ -0,0 +1,85 @@
+"""Every app process starts a JobManager: it must take over only the jobs
+whose owner stopped sending heartbeats, never a live sibling's."""
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import ROOT
+from config import settings
+from jobs import JobManager
+from scripts.database import SessionLocal
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(SessionLocal)
+    yield manager
+    manager.shutdown()
+
+
+def running_job(repo, owner, heartbeat_at):
+    """A spooled copy of data/test.csv, recorded as running."""
+    os.makedirs(settings.job_spool_dir, exist_ok=True)
+    path = os.path.join(settings.job_spool_dir, f"{owner}.csv")
+    shutil.copy(os.path.join(ROOT, "data", "test.csv"), path)
+
+    success, job = repo.create_job(owner, "csv", path)
+    assert success, job
+    repo.update_job(job.id, status="running", owner=owner, heartbeat_at=heartbeat_at)
+    return job.id
+
+
+def wait_for(manager, job_id, statuses=("done", "failed"), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job.status in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job.status}")
+
+
+def test_start_leaves_a_live_job_to_its_owner(repo, manager):
+    job_id = running_job(repo, "live", datetime.utcnow())
+
+    manager.start()
+    job = manager.get(job_id)
+
+    assert (job.status, job.owner, job.rows_parsed) == ("running", "live", 0)
+
+
+def test_start_takes_over_a_stale_job(repo, manager):
+    stale = datetime.utcnow() - timedelta(seconds=2 * settings.job_lease_seconds)
+    job_id = running_job(repo, "stale", stale)
+
+    manager.start()
+    job = wait_for(manager, job_id)
+
+    assert (job.status, job.owner, job.rows_failed) == ("done", manager.owner, 0)
+    assert job.rows_parsed > 0
+    assert not os.path.exists(job.path)
+
+
+def test_a_job_taken_over_is_left_to_its_new_owner(repo, manager):
+    job_id = running_job(repo, "stale", None)
+    manager.start()
+    wait_for(manager, job_id)
+
+    # the old owner waking up after the lease must not touch the job
+    assert not repo.update_job(job_id, expected_owner="stale", status="cancelled")
+    assert manager.get(job_id).status == "done"
+
+
+def test_heartbeat_keeps_the_jobs_of_an_owner_alive(repo):
+    old = datetime.utcnow() - timedelta(seconds=2 * settings.job_lease_seconds)
+    live_id = running_job(repo, "live", old)
+    other_id = running_job(repo, "other", old)
+
+    assert repo.heartbeat_jobs("live") == 1
+    assert repo.requeue_stale_jobs(datetime.utcnow() - timedelta(seconds=1)) == 1
+
+    assert repo.get_job(live_id).status == "running"
+    assert (repo.get_job(other_id).status, repo.get_job(other_id).owner) == ("queued", None)
@@ -0,0 +1,60 @@
+"""The natural key index expires its keys, so a key renamed by another
+worker process stops being taken as existing after `key_index_ttl`, and
+an upload indexes the keys it inserts."""
+import csv
+import io
+
+from sqlalchemy import update
+
+import cache
+from business import ROSTER_COLUMNS, Uploader
+from config import settings
+from scripts import models
+from scripts.database import engine
+
+
+def test_renamed_key_expires(repo, school, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+
+    assert repo.get_ids_by_key(models.Department.dept_name, ["Department 1"]) == {"Department 1": 1}
+
+    # another worker renames it, this process is not told
+    with engine.begin() as conn:
+        conn.execute(update(models.Department).where(models.Department.id == 1).values(dept_name="Renamed"))
+
+    assert repo.get_ids_by_key(models.Department.dept_name, ["Department 1"]) == {"Department 1": 1}
+
+    now[0] += settings.key_index_ttl + 1
+
+    assert repo.get_ids_by_key(models.Department.dept_name, ["Department 1"]) == {}
+    assert repo.get_ids_by_key(models.Department.dept_name, ["Renamed"]) == {"Renamed": 1}
+
+
+def roster(std_ids):
+    file = io.StringIO()
+    writer = csv.writer(file)
+    writer.writerow(ROSTER_COLUMNS)
+    for std_id in std_ids:
+        dept_id, teacher_id, subj_id = std_id % 2 + 1, std_id % 3 + 1, std_id % 4 + 1
+        writer.writerow([
+            dept_id, f"Department {dept_id}",
+            teacher_id, f"Teacher {teacher_id}", f"teacher.{teacher_id}@email.com",
+            subj_id, f"Subject {subj_id}", f"Description {subj_id}",
+            std_id, f"Student {std_id}", f"student.{std_id}@email.com",
+        ])
+    return io.BytesIO(file.getvalue().encode())
+
+
+def test_upload_indexes_the_keys_it_inserts(repo, statements):
+    Uploader(repo).upload_csv(roster(range(1, 13)))
+    statements.clear()
+
+    Uploader(repo).upload_csv(roster(range(13, 25)))
+
+    key_columns = ("departments.dept_name IN", "teachers.email IN", "subjects.subj_name IN")
+    lookups = [
+        statement for statement in statements
+        if any(f"WHERE {column}" in statement for column in key_columns)
+    ]
+    assert lookups == []
@@ -0,0 +1,42 @@
+"""The listing endpoints serve rows whose nullable columns are null."""
+import pytest
+from sqlalchemy import update
+
+from scripts import models
+from scripts.database import engine
+
+
+@pytest.fixture
+def nulls(school):
+    """Clears every nullable column of the first row of each table."""
+    with engine.begin() as conn:
+        conn.execute(update(models.Department).where(models.Department.id == 1).values(dept_name=None))
+        conn.execute(
+            update(models.Teacher).where(models.Teacher.id == 1)
+            .values(teacher_name=None, email=None, dept_id=None)
+        )
+        conn.execute(
+            update(models.Subject).where(models.Subject.id == 1)
+            .values(subj_name=None, description=None, dept_id=None, teacher_id=None)
+        )
+        conn.execute(
+            update(models.Student).where(models.Student.id == 1)
+            .values(std_name=None, email=None, dept_id=None)
+        )
+
+
+@pytest.mark.parametrize("path, columns", [
+    ("/departments", ["dept_name"]),
+    ("/teachers", ["teacher_name", "email", "dept_id"]),
+    ("/subjects", ["subj_name", "description", "dept_id", "teacher_id"]),
+    ("/students", ["std_name", "email", "dept_id"]),
+    ("/subjects/1/students", ["std_name", "email", "dept_id"]),
+])
+def test_pages_serve_null_columns(client, nulls, path, columns):
+    response = client.get(path, params={"limit": 5})
+
+    assert response.status_code == 200, response.text
+
+    first = response.json()["items"][0]
+    assert first["id"] == 1
+    assert all(first[column] is None for column in columns)
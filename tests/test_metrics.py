@@ -0,0 +1,39 @@
+"""/metrics counts every request per route and every statement once,
+however many times the engine was instrumented."""
+import re
+
+from metrics import instrument_engine
+from scripts.database import engine
+
+REQUESTS = 3
+
+
+def scrape(client) -> dict:
+    """metric line -> value, e.g. 'db_queries_total' -> 12.0"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+
+    return {
+        match[1]: float(match[2])
+        for match in re.finditer(r"^([^#\s][^ ]*) (\S+)$", response.text, re.MULTILINE)
+    }
+
+
+def test_request_and_query_counters(client, school, statements):
+    # main instruments the engine on import, a second call adds nothing
+    instrument_engine(engine)
+
+    before = scrape(client)
+    statements.clear()
+
+    headers = [client.get("/departments").headers for _ in range(REQUESTS)]
+    sent = len(statements)
+    after = scrape(client)
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert delta('http_request_duration_seconds_count{method="GET",route="/departments",status="200"}') == REQUESTS
+    assert delta('http_request_db_queries_count{method="GET",route="/departments"}') == REQUESTS
+    assert sum(int(h["x-db-query-count"]) for h in headers) == sent
+    assert delta("db_queries_total") == sent
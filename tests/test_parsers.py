@@ -0,0 +1,86 @@
+"""parsers.iter_json_items reads a JSON array or NDJSON in fixed-size reads,
+stopping at the first malformed element instead of reading on."""
+import io
+import json
+
+import pytest
+
+from parsers import iter_json_items
+
+RECORDS = [
+    {"dept_name": "Engineering"},
+    {"std_name": "Saif Ullah", "email": "saif.ullah@email.com", "dept_id": 1},
+    12.5, -3e-2, True, False, None, "a é \\u string", [1, [2, {}]],
+]
+
+
+class CountingStream(io.BytesIO):
+    """Counts the bytes read from it."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def parse(data, read_size=None):
+    return list(iter_json_items(io.BytesIO(data), read_size))
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 1024])
+def test_array_split_across_reads(read_size):
+    data = json.dumps(RECORDS, ensure_ascii=False).encode()
+
+    assert parse(data, read_size) == RECORDS
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 1024])
+def test_ndjson_split_across_reads(read_size):
+    data = "\n".join(json.dumps(record) for record in RECORDS).encode() + b"\n"
+
+    assert parse(data, read_size) == RECORDS
+
+
+@pytest.mark.parametrize("data", [b"[]", b" [ ] \n", b"", b"\n\n"])
+def test_empty(data):
+    assert parse(data) == []
+
+
+@pytest.mark.parametrize("data", [
+    b'[{"a": 1}, {"a" 1}]',
+    b'[{"a": 1} {"a": 2}]',
+    b'[1, 2',
+    b'[1, tx]',
+    b'[12abc]',
+    b'[{"a": "unterminated]',
+    b'{"a": 1}\n{"a": }\n',
+])
+@pytest.mark.parametrize("read_size", [2, 1024])
+def test_malformed(data, read_size):
+    with pytest.raises(ValueError):
+        parse(data, read_size)
+
+
+@pytest.mark.parametrize("data", [b"[1, 2] garbage {", b"[1, 2]]", b"[1, 2] [3]"])
+def test_content_after_the_array(data):
+    with pytest.raises(ValueError, match="after the JSON array"):
+        parse(data)
+
+
+def test_whitespace_after_the_array():
+    assert parse(b"[1, 2] \r\n\t ") == [1, 2]
+
+
+def test_error_stops_reading():
+    # the error sits in the first read, the rest of the file is never read
+    data = b'[{"a": 1}, {"a" 1}, ' + b'{"a": 1}, ' * 100_000 + b'{"a": 1}]'
+    stream = CountingStream(data)
+
+    with pytest.raises(ValueError):
+        list(iter_json_items(stream, 1024))
+
+    assert stream.bytes_read <= 2 * 1024
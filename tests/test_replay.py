@@ -0,0 +1,104 @@
+"""A repeated upload, recognised by the digest of its bytes or by its
+Idempotency-Key, gets the stored result back with an
+`Idempotent-Replayed: true` header and writes nothing."""
+import json
+
+import pytest
+
+from config import settings
+
+CSV = b"dept_id,dept_name\n1,Engineering\n2,Physics\n"
+JSON = json.dumps([{"dept_name": "Engineering"}, {"dept_name": "Physics"}]).encode()
+
+
+def upload(client, format, data, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(f"/upload?format={format}", files={"file": ("upload", data)}, headers=headers)
+
+
+def writes(statements):
+    """The statements that wrote to anything but the upload records,
+    which a replay still claims its key in"""
+    return [
+        statement for statement in statements
+        if statement.lstrip().startswith(("INSERT", "UPDATE", "DELETE"))
+        and "upload_records" not in statement
+    ]
+
+
+def departments(client):
+    return [item["dept_name"] for item in client.get("/departments").json()["items"]]
+
+
+@pytest.mark.parametrize("format, data", [("csv", CSV), ("json", JSON)])
+def test_replay_by_digest(client, statements, format, data):
+    first = upload(client, format, data)
+    assert first.status_code == 200, first.text
+    assert first.headers.get("Idempotent-Replayed") is None
+
+    statements.clear()
+    repeat = upload(client, format, data)
+
+    assert repeat.status_code == 200, repeat.text
+    assert repeat.headers["Idempotent-Replayed"] == "true"
+    assert repeat.json() == first.json()
+    assert writes(statements) == []
+    assert departments(client) == ["Engineering", "Physics"]
+
+
+def test_replay_by_idempotency_key(client, statements):
+    first = upload(client, "csv", CSV, key="roster-1")
+    assert first.status_code == 200, first.text
+
+    # a retry is known by its key, whatever its bytes
+    statements.clear()
+    repeat = upload(client, "csv", b"dept_id,dept_name\n3,Chemistry\n", key="roster-1")
+
+    assert repeat.status_code == 200, repeat.text
+    assert repeat.headers["Idempotent-Replayed"] == "true"
+    assert repeat.json() == first.json()
+    assert writes(statements) == []
+    assert departments(client) == ["Engineering", "Physics"]
+
+
+def test_another_key_is_not_a_replay(client):
+    upload(client, "csv", CSV, key="roster-1")
+
+    response = upload(client, "csv", CSV, key="roster-2")
+
+    assert response.status_code == 200, response.text
+    assert response.headers.get("Idempotent-Replayed") is None
+    assert response.json()["counts"]["departments"] == {"inserted": 0, "skipped": 2}
+
+
+def test_dedup_off_ingests_a_repeat(client, monkeypatch):
+    monkeypatch.setattr(settings, "upload_dedup", False)
+    upload(client, "csv", CSV)
+
+    repeat = upload(client, "csv", CSV)
+    assert repeat.headers.get("Idempotent-Replayed") is None
+
+    # an Idempotency-Key is honoured either way
+    upload(client, "csv", CSV, key="roster-1")
+    assert upload(client, "csv", CSV, key="roster-1").headers["Idempotent-Replayed"] == "true"
+
+
+def test_failed_upload_is_not_replayed(client):
+    invalid = b"dept_id,dept_name\nnot a number,Engineering\n"
+
+    assert upload(client, "csv", invalid, key="roster-1").status_code == 400
+    retry = upload(client, "csv", CSV, key="roster-1")
+
+    assert retry.status_code == 200, retry.text
+    assert retry.headers.get("Idempotent-Replayed") is None
+    assert departments(client) == ["Engineering", "Physics"]
+
+
+def test_repeat_of_a_running_upload(client, repo):
+    claimed, record = repo.claim_upload("key:roster-1", "csv", owner="other")
+    assert claimed, record
+
+    response = upload(client, "csv", CSV, key="roster-1")
+
+    assert response.status_code == 409, response.text
+    assert departments(client) == []
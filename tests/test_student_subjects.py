@@ -0,0 +1,46 @@
+"""SQLRepository.get_subject_by_student reads a student's subjects
+with one joined statement, see benchmarks/student_subjects.py."""
+import json
+
+from sqlalchemy import insert
+
+from scripts import models
+from scripts.database import engine
+from conftest import STUDENTS, enrolled_subjects
+
+
+def test_one_statement_per_call(repo, school, statements):
+    for student_id in (1, 2, STUDENTS):
+        statements.clear()
+        subjects = repo.get_subject_by_student(student_id)
+
+        assert len(statements) == 1
+        assert [subject.id for subject in subjects] == enrolled_subjects(student_id)
+
+
+def test_missing_student(repo, school, statements):
+    assert repo.get_subject_by_student(STUDENTS + 1) is None
+    assert len(statements) == 1
+
+
+def test_student_without_enrollments(repo, school, statements):
+    with engine.begin() as conn:
+        conn.execute(insert(models.Student), [
+            {"id": STUDENTS + 1, "std_name": "New Student", "email": "new.student@email.com", "dept_id": 1}
+        ])
+
+    statements.clear()
+
+    assert repo.get_subject_by_student(STUDENTS + 1) == []
+    assert len(statements) == 1
+
+
+def test_subject_whose_teacher_was_cleared(client, school):
+    updates = [{"table_name": "subjects", "record_id": 1, "updated_fields": {"teacher_id": None}}]
+    response = client.put("/update", files={"file": ("update.json", json.dumps(updates))})
+    assert response.status_code == 200, response.text
+
+    response = client.get("/students/1/subjects")
+
+    assert response.status_code == 200, response.text
+    assert {subject["id"]: subject["teacher_id"] for subject in response.json()}[1] is None
@@ -0,0 +1,105 @@
+"""A student's cached subject list is dropped by every write that changes
+it: an update, a delete, a bulk delete and an upload, in the request or
+in the parallel workers."""
+import csv
+import io
+import json
+
+import pytest
+
+from business import ROSTER_COLUMNS
+from cache import SUBJECTS_CACHE
+from conftest import SUBJECTS, enrolled_subjects
+
+STUDENT = 1
+
+
+def subjects(client, student_id=STUDENT):
+    response = client.get(f"/students/{student_id}/subjects")
+    assert response.status_code == 200, response.text
+    return {subject["id"]: subject for subject in response.json()}
+
+
+@pytest.fixture
+def cached(client, school):
+    """The subjects of STUDENT, read once so the next read is a hit."""
+    subjects(client)
+
+    hits = SUBJECTS_CACHE.hits
+    assert sorted(subjects(client)) == enrolled_subjects(STUDENT)
+    assert SUBJECTS_CACHE.hits == hits + 1
+
+
+def update(client, *updates):
+    response = client.put("/update", files={"file": ("updates.json", json.dumps(updates).encode())})
+    assert response.status_code == 200, response.text
+    return response.json()["updated"]
+
+
+def test_update_of_a_subject(client, cached):
+    subject_id = enrolled_subjects(STUDENT)[0]
+
+    update(client, {"table_name": "subjects", "record_id": subject_id, "updated_fields": {"subj_name": "Renamed"}})
+
+    assert subjects(client)[subject_id]["subj_name"] == "Renamed"
+
+
+def test_update_of_an_enrollment(client, cached):
+    old, kept = enrolled_subjects(STUDENT)
+    new = next(id for id in range(1, SUBJECTS + 1) if id not in (old, kept))
+
+    update(client, {"table_name": "enrollments", "record_id": [STUDENT, old], "updated_fields": {"subject_id": new}})
+
+    assert sorted(subjects(client)) == sorted([kept, new])
+
+
+def test_enrollment_moved_to_the_student(client, cached):
+    # another student's enrollment handed to STUDENT
+    other = STUDENT + 4
+    subject_id = next(id for id in enrolled_subjects(other) if id not in enrolled_subjects(STUDENT))
+
+    update(client, {"table_name": "enrollments", "record_id": [other, subject_id], "updated_fields": {"student_id": STUDENT}})
+
+    assert sorted(subjects(client)) == sorted(enrolled_subjects(STUDENT) + [subject_id])
+
+
+def test_delete(client, cached):
+    removed, kept = enrolled_subjects(STUDENT)
+
+    response = client.delete("/delete", params={"student_id": STUDENT, "subject_id": removed})
+
+    assert response.status_code == 200, response.text
+    assert sorted(subjects(client)) == [kept]
+
+
+@pytest.mark.parametrize("request_body", [
+    {"enrollments": [{"student_id": STUDENT, "subject_id": enrolled_subjects(STUDENT)[0]}]},
+    {"student_id": STUDENT},
+    {"subject_id": enrolled_subjects(STUDENT)[0]},
+])
+def test_bulk_delete(client, cached, request_body):
+    response = client.request("DELETE", "/enrollments", json=request_body)
+
+    assert response.status_code == 200, response.text
+    assert enrolled_subjects(STUDENT)[0] not in subjects(client)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_upload(client, cached, workers):
+    subject_id = next(id for id in range(1, SUBJECTS + 1) if id not in enrolled_subjects(STUDENT))
+
+    file = io.StringIO()
+    writer = csv.writer(file)
+    writer.writerow(ROSTER_COLUMNS)
+    writer.writerow([
+        1, "Department 1", 1, "Teacher 1", "teacher.1@email.com",
+        subject_id, f"Subject {subject_id}", f"Description of subject {subject_id}",
+        STUDENT, f"Student {STUDENT}", f"student.{STUDENT}@email.com",
+    ])
+
+    response = client.post(
+        f"/upload?format=csv&workers={workers}", files={"file": ("roster.csv", file.getvalue().encode())}
+    )
+
+    assert response.status_code == 200, response.text
+    assert sorted(subjects(client)) == sorted(enrolled_subjects(STUDENT) + [subject_id])
@@ -0,0 +1,130 @@
+"""The enrollment summary behind /stats stays equal to a live GROUP BY
+after every kind of write, and scripts/summary.py rebuilds and checks it."""
+import csv
+import io
+import json
+import sys
+
+import pytest
+from sqlalchemy import text
+
+from business import ROSTER_COLUMNS
+from conftest import DEPARTMENTS, STUDENTS, enrolled_subjects
+from crud import SQLRepository
+from scripts import summary
+from scripts.database import SessionLocal
+
+
+def drift():
+    with SessionLocal() as db:
+        return SQLRepository(db).get_summary_drift()
+
+
+@pytest.fixture
+def counted(school, repo):
+    """The `school` with its summary counted."""
+    success, rows = repo.rebuild_summary()
+    assert success, rows
+    assert drift() == []
+
+
+def roster(rows):
+    file = io.StringIO()
+    writer = csv.writer(file)
+    writer.writerow(ROSTER_COLUMNS)
+    for std_id, subj_id in rows:
+        writer.writerow([
+            1, "Department 1", 1, "Teacher 1", "teacher.1@email.com",
+            subj_id, f"Subject {subj_id}", f"Description of subject {subj_id}",
+            std_id, f"Student {std_id}", f"student.{std_id}@email.com",
+        ])
+    return file.getvalue().encode()
+
+
+def test_rebuild_counts_the_school(counted, client):
+    departments = client.get("/stats/departments").json()["items"]
+
+    assert [department["students"] for department in departments] == [
+        sum(1 for id in range(1, STUDENTS + 1) if id % DEPARTMENTS + 1 == dept_id)
+        for dept_id in range(1, DEPARTMENTS + 1)
+    ]
+    assert sum(department["enrollments"] for department in departments) == 2 * STUDENTS
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_upload(counted, client, workers):
+    # new students in a known subject and in a new one
+    data = roster([(101, 1), (101, 11), (102, 11), (103, 2)])
+
+    response = client.post(f"/upload?format=csv&workers={workers}", files={"file": ("roster.csv", data)})
+
+    assert response.status_code == 200, response.text
+    assert drift() == []
+
+
+def test_update(counted, client):
+    updates = [
+        # moves the enrollments of subject 1 to another teacher and department
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"teacher_id": 1, "dept_id": 1}},
+        {"table_name": "students", "record_id": 2, "updated_fields": {"dept_id": 1}},
+        {"table_name": "enrollments", "record_id": [3, enrolled_subjects(3)[0]], "updated_fields": {"subject_id": 9}},
+    ]
+
+    response = client.put("/update", files={"file": ("updates.json", json.dumps(updates).encode())})
+
+    assert response.status_code == 200, response.text
+    assert drift() == []
+
+
+def test_delete(counted, client):
+    response = client.delete("/delete", params={"student_id": 1, "subject_id": enrolled_subjects(1)[0]})
+
+    assert response.status_code == 200, response.text
+    assert drift() == []
+
+
+@pytest.mark.parametrize("request_body", [
+    {"enrollments": [{"student_id": 1, "subject_id": enrolled_subjects(1)[0]},
+                     {"student_id": 2, "subject_id": enrolled_subjects(2)[1]}]},
+    {"student_id": 4},
+    {"subject_id": 5},
+])
+def test_bulk_delete(counted, client, request_body):
+    response = client.request("DELETE", "/enrollments", json=request_body)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["deleted"] > 0
+    assert drift() == []
+
+
+def test_drift_lists_the_counts_that_differ(counted, repo):
+    repo.db.execute(text(
+        "UPDATE enrollment_summary SET enrollments = enrollments + 1 "
+        "WHERE scope = 'subjects' AND scope_id = 1"
+    ))
+    repo.db.commit()
+    enrolled = sum(1 for id in range(1, STUDENTS + 1) if 1 in enrolled_subjects(id))
+
+    assert drift() == [{
+        "scope": "subjects", "scope_id": 1, "column": "enrollments",
+        "stored": enrolled + 1, "actual": enrolled,
+    }]
+
+
+def run_script(monkeypatch, command):
+    monkeypatch.setattr(sys, "argv", ["summary.py", command])
+    summary.main()
+
+
+def test_script_check_and_rebuild(school, monkeypatch, capsys):
+    # the school was inserted around the summary, every count is missing
+    with pytest.raises(SystemExit, match="summary counts differ"):
+        run_script(monkeypatch, "check")
+    assert "subjects 1 enrollments: stored 0" in capsys.readouterr().out
+
+    run_script(monkeypatch, "rebuild")
+    assert capsys.readouterr().out.startswith("Rebuilt ")
+
+    run_script(monkeypatch, "check")
+    assert capsys.readouterr().out == "The summary matches the enrollments.\n"
+    assert drift() == []
@@ -0,0 +1,102 @@
+"""PUT /update groups its items into one executemany UPDATE per table and
+set of columns, reports the affected rows per table, and takes the
+record_id of a composite key as a list."""
+import json
+
+import pytest
+from sqlalchemy import select
+
+from conftest import enrolled_subjects
+from scripts import models
+
+
+def update(client, updates):
+    return client.put("/update", files={"file": ("updates.json", json.dumps(updates).encode())})
+
+
+def test_counts_per_table(client, school, statements):
+    updates = [
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"subj_name": "One"}},
+        {"table_name": "subjects", "record_id": 2, "updated_fields": {"subj_name": "Two"}},
+        {"table_name": "subjects", "record_id": 3, "updated_fields": {"description": "Three"}},
+        {"table_name": "teachers", "record_id": 1, "updated_fields": {"teacher_name": "Teacher One"}},
+        {"table_name": "students", "record_id": 1, "updated_fields": {"std_name": "Student One"}},
+        {"table_name": "students", "record_id": 2, "updated_fields": {"std_name": "Student Two"}},
+        # no such student, counted as no row
+        {"table_name": "students", "record_id": 999, "updated_fields": {"std_name": "Nobody"}},
+    ]
+
+    statements.clear()
+    response = update(client, updates)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["updated"] == {"subjects": 3, "teachers": 1, "students": 2}
+
+    # one UPDATE per table and set of columns
+    updated = [statement.split()[1] for statement in statements if statement.startswith("UPDATE")]
+    assert sorted(table for table in updated if table != "enrollment_summary") == [
+        "students", "subjects", "subjects", "teachers"
+    ]
+
+
+def test_later_item_wins(client, repo, school):
+    updates = [
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"subj_name": "First"}},
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"subj_name": "Second", "description": "D"}},
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"subj_name": "Third"}},
+    ]
+
+    response = update(client, updates)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["updated"] == {"subjects": 3}
+    subject = repo.db.get(models.Subject, 1)
+    assert (subject.subj_name, subject.description) == ("Third", "D")
+
+
+def test_enrollment_by_list_record_id(client, repo, school):
+    old, kept = enrolled_subjects(1)
+    new = next(id for id in range(1, 11) if id not in (old, kept))
+
+    response = update(client, [
+        {"table_name": "enrollments", "record_id": [1, old], "updated_fields": {"subject_id": new}},
+    ])
+
+    assert response.status_code == 200, response.text
+    assert response.json()["updated"] == {"enrollments": 1}
+    assert repo.db.scalars(
+        select(models.Enrollment.subject_id).where(models.Enrollment.student_id == 1).order_by(models.Enrollment.subject_id)
+    ).all() == sorted([kept, new])
+
+
+def test_single_key_as_a_list(client, repo, school):
+    response = update(client, [
+        {"table_name": "departments", "record_id": [1], "updated_fields": {"dept_name": "Renamed"}},
+    ])
+
+    assert response.status_code == 200, response.text
+    assert response.json()["updated"] == {"departments": 1}
+    assert repo.db.get(models.Department, 1).dept_name == "Renamed"
+
+
+@pytest.mark.parametrize("item, error", [
+    ({"table_name": "enrollments", "record_id": 1, "updated_fields": {"subject_id": 3}},
+     "Records of 'enrollments' are identified by ['student_id', 'subject_id']!"),
+    ({"table_name": "subjects", "record_id": [1, 2], "updated_fields": {"subj_name": "X"}},
+     "Records of 'subjects' are identified by ['id']!"),
+    ({"table_name": "subjects", "record_id": 1, "updated_fields": {"colour": "red"}},
+     "Columns ['colour'] do not exist in 'subjects'!"),
+    ({"table_name": "rooms", "record_id": 1, "updated_fields": {"name": "X"}},
+     "Table 'rooms' does not exist!"),
+])
+def test_invalid_item_updates_nothing(client, repo, school, item, error):
+    response = update(client, [
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"subj_name": "Renamed"}},
+        # runs the rename before the invalid item is read
+        {"table_name": "subjects", "record_id": 1, "updated_fields": {"description": "Changed"}},
+        item,
+    ])
+
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == error
+    assert repo.db.get(models.Subject, 1).subj_name == "Subject 1"
@@ -0,0 +1,86 @@
+"""Every app process releases the stale upload claims on start: a claim
+is released or taken over only once its owner stopped renewing it."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from config import settings
+from crud import release_upload_claims
+from scripts import models
+
+
+def claim(repo, key, owner, age=0):
+    """A running claim of `owner`, last renewed `age` seconds ago."""
+    claimed, record = repo.claim_upload(key, "csv", owner=owner)
+    assert claimed, record
+
+    repo.db.execute(
+        update(models.UploadRecord).where(models.UploadRecord.key == key)
+        .values(heartbeat_at=datetime.utcnow() - timedelta(seconds=age))
+    )
+    repo.db.commit()
+
+
+def claims(repo):
+    return dict(repo.db.execute(
+        select(models.UploadRecord.key, models.UploadRecord.owner)
+        .execution_options(populate_existing=True)
+    ).all())
+
+
+def test_start_releases_only_stale_claims(repo):
+    claim(repo, "live", "live")
+    claim(repo, "stale", "stale", age=2 * settings.job_lease_seconds)
+
+    release_upload_claims()
+
+    assert claims(repo) == {"live": "live"}
+
+
+def test_claim_takes_over_only_a_stale_claim(repo):
+    claim(repo, "live", "live")
+    claim(repo, "stale", "stale", age=2 * settings.job_lease_seconds)
+
+    claimed, record = repo.claim_upload("live", "csv", owner="retry")
+    assert not claimed and record.owner == "live"
+
+    assert repo.claim_upload("stale", "csv", owner="retry") == (True, None)
+    assert claims(repo) == {"live": "live", "stale": "retry"}
+
+
+def test_release_leaves_a_claim_taken_over(repo):
+    claim(repo, "upload", "new")
+
+    repo.release_upload("upload", owner="old")
+    assert claims(repo) == {"upload": "new"}
+
+    repo.release_upload("upload", owner="new")
+    assert claims(repo) == {}
+
+
+def test_renew_keeps_the_claims_of_an_owner(repo):
+    claim(repo, "renewed", "live", age=2 * settings.job_lease_seconds)
+    claim(repo, "other", "other", age=2 * settings.job_lease_seconds)
+
+    assert repo.renew_upload_claims("live") == 1
+    release_upload_claims()
+
+    assert claims(repo) == {"renewed": "live"}
+
+
+def test_retry_after_a_dead_upload(client, repo):
+    data = b"dept_id,dept_name\n1,Engineering\n"
+    response = client.post("/upload?format=csv", files={"file": ("d.csv", data)}, headers={"Idempotency-Key": "k"})
+    assert response.status_code == 200, response.text
+
+    # as if the upload were still running in a process that died
+    repo.db.execute(
+        update(models.UploadRecord)
+        .values(status="running", owner="dead", heartbeat_at=datetime.utcnow() - timedelta(days=1))
+    )
+    repo.db.commit()
+
+    response = client.post("/upload?format=csv", files={"file": ("d.csv", data)}, headers={"Idempotency-Key": "k"})
+
+    assert response.status_code == 200, response.text
+    assert response.headers.get("Idempotent-Replayed") is None
@@ -0,0 +1,40 @@
+"""The students of a roster keep the std_id of the file, which their
+enrollments reference, whether the upload runs in the request or in
+the parallel workers."""
+import csv
+import io
+
+import pytest
+
+from business import ROSTER_COLUMNS
+
+# std_ids with gaps, so an autoincremented id would not match
+STUDENT_IDS = [5, 9, 12]
+
+
+def roster():
+    file = io.StringIO()
+    writer = csv.writer(file)
+    writer.writerow(ROSTER_COLUMNS)
+    for subj_id, std_id in enumerate(STUDENT_IDS, 1):
+        writer.writerow([
+            1, "Department 1", 1, "Teacher 1", "teacher.1@email.com",
+            subj_id, f"Subject {subj_id}", f"Description {subj_id}",
+            std_id, f"Student {std_id}", f"student.{std_id}@email.com",
+        ])
+    return file.getvalue().encode()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_students_keep_their_file_ids(client, workers):
+    response = client.post(
+        f"/upload?format=csv&workers={workers}", files={"file": ("roster.csv", roster())}
+    )
+    assert response.status_code == 200, response.text
+
+    students = client.get("/students").json()["items"]
+    assert [student["id"] for student in students] == STUDENT_IDS
+
+    for subj_id, std_id in enumerate(STUDENT_IDS, 1):
+        subjects = client.get(f"/students/{std_id}/subjects").json()
+        assert [subject["subj_name"] for subject in subjects] == [f"Subject {subj_id}"]
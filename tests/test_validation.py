@@ -0,0 +1,76 @@
+"""BatchValidator catches reused keys and repeated rows anywhere in a file,
+whichever chunks their copies land in, up to `upload_unique_keys` keys."""
+import csv
+import io
+
+import pytest
+
+from business import ROSTER_COLUMNS
+from config import settings
+from validation import BatchValidator
+
+
+def row(std_id, subj_id, std_email=None):
+    return {
+        "dept_id": "1", "dept_name": "Department 1",
+        "teacher_id": "1", "teacher_name": "Teacher 1", "teacher_email": "teacher.1@email.com",
+        "subj_id": str(subj_id), "subj_name": f"Subject {subj_id}", "description": "",
+        "std_id": str(std_id), "std_name": f"Student {std_id}",
+        "std_email": std_email or f"student.{std_id}@email.com",
+    }
+
+
+def test_repeated_row_in_a_chunk():
+    errors = BatchValidator(ROSTER_COLUMNS).validate([row(1, 1), row(2, 1), row(1, 1)])
+
+    assert errors == [{"row": 3, "column": "std_id,subj_id", "error": "duplicate of row 1"}]
+
+
+def test_repeated_row_in_another_chunk():
+    validator = BatchValidator(ROSTER_COLUMNS)
+
+    assert validator.validate([row(1, 1), row(2, 1)]) == []
+    assert validator.validate([row(3, 1), row(1, 1)], 3) == [
+        {"row": 4, "column": "std_id,subj_id", "error": "duplicate of row 1"}
+    ]
+
+
+def test_reused_key_in_another_chunk():
+    validator = BatchValidator(ROSTER_COLUMNS)
+
+    assert validator.validate([row(1, 1)]) == []
+    assert validator.validate([row(2, 2, "student.1@email.com")], 2) == [
+        {"row": 2, "column": "std_email", "error": "already used by std_id 1"}
+    ]
+
+
+def test_keys_past_the_limit_are_checked_within_their_chunk(monkeypatch):
+    monkeypatch.setattr(settings, "upload_unique_keys", 2)
+    validator = BatchValidator(ROSTER_COLUMNS)
+
+    assert validator.validate([row(1, 1), row(2, 2)]) == []
+    # the third row key does not fit, a repeat in its chunk is still caught
+    assert validator.validate([row(3, 3), row(3, 3)], 3) == [
+        {"row": 4, "column": "std_id,subj_id", "error": "duplicate of row 3"}
+    ]
+    assert validator.validate([row(1, 1), row(3, 3)], 5) == [
+        {"row": 5, "column": "std_id,subj_id", "error": "duplicate of row 1"}
+    ]
+    assert len(validator.rows_seen.file) == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_upload_rejects_a_repeated_row_at_any_chunk_size(client, monkeypatch, chunk_size):
+    monkeypatch.setattr(settings, "ingest_chunk_size", chunk_size)
+
+    file = io.StringIO()
+    writer = csv.DictWriter(file, ROSTER_COLUMNS)
+    writer.writeheader()
+    writer.writerows([row(1, 1), row(2, 2), row(1, 1)])
+
+    response = client.post("/upload?format=csv", files={"file": ("roster.csv", file.getvalue().encode())})
+
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"]["errors"] == [
+        {"row": 3, "column": "std_id,subj_id", "error": "duplicate of row 1"}
+    ]